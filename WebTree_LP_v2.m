@@ -51,4 +51,6 @@ exitflag
 output
 
 fileid = fopen(OUTFILE, 'w');
-fprintf(fileid, '%d\n', x);
\ No newline at end of file
+fprintf(fileid, '%d\n', x);
+% Or, much smaller, just the selected variables (save OUTFILE as .idx):
+% fprintf(fileid, '%d\n', find(x > 0.5) - 1);
\ No newline at end of file
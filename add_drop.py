@@ -0,0 +1,308 @@
+'''
+The add/drop period, after the WebTree lottery. Starts from a finished run
+(its assignments and every course's ceiling) and processes a stream
+of add, drop and ceiling-change events as they come in. A student who tries
+to add a full course goes on that course's waitlist, and whenever a seat
+opens up the first student on the list gets it.
+
+Waitlists are ordered the way the lottery ordered students: seniors first,
+then juniors, sophomores, first-years and everyone else, and within a class
+year by lottery number (the student's place in their class year's first-pass
+ordering from baseline_webtree.assign_random_numbers). Each waitlist is a
+heap, so every event costs O(log n). Students who leave a waitlist are
+removed lazily, when they come up to the top.
+
+Events come one per line as "add,ID,CRN", "drop,ID,CRN" or "cap,CRN,SEATS":
+
+    python add_drop.py "WebTree Data/spring-2015.csv" events.csv --seed 3
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import csv
+import heapq
+import random
+
+import assignment_io
+import baseline_webtree
+from student_store import CLASS_ORDER
+from webtree_model import CLASSES_PER_STUDENT
+
+# What add() can say
+ENROLLED = 'enrolled'
+WAITLISTED = 'waitlisted'
+ALREADY_ENROLLED = 'already enrolled'
+ALREADY_WAITLISTED = 'already waitlisted'
+FULL_LOAD = 'full load'
+NO_SUCH_COURSE = 'no such course'
+
+
+def lottery_priorities(students_by_class, random_ordering):
+    '''Returns each student's waitlist priority: a (class year, lottery
+        number) pair, smaller first.
+
+    Parameters:
+        students_by_class - the class year -> IDs dictionary from
+            baseline_webtree.read_file()
+        random_ordering - the orderings from
+            baseline_webtree.assign_random_numbers()
+    '''
+    priorities = {}
+    for year, class_year in enumerate(CLASS_ORDER):
+        if class_year not in random_ordering:
+            continue
+        for number, id in enumerate(random_ordering[class_year][0]):
+            priorities[id] = (year, number)
+    return priorities
+
+
+class AddDropEngine:
+    """Live enrollment during add/drop.
+
+    Attributes:
+        ceilings - a dictionary mapping CRNs to their ceilings.
+        seats - a dictionary mapping CRNs to the seats left: the ceiling
+                less the students enrolled (negative if a ceiling was
+                lowered below them).
+        enrolled - a dictionary mapping CRNs to the set of enrolled IDs.
+        schedules - a dictionary mapping student IDs to the set of CRNs they
+                    are enrolled in.
+        priorities - a dictionary mapping student IDs to their waitlist
+                     priority, as from lottery_priorities().
+        max_classes - the most classes a student may hold at once.
+        _waitlists - a dictionary mapping CRNs to a heap of
+                     (priority, ID) entries, possibly stale.
+        _waiting - a dictionary mapping CRNs to the set of IDs really on
+                   their waitlist.
+    """
+    def __init__(self, assignments, ceilings, priorities,
+                 max_classes=CLASSES_PER_STUDENT):
+        """Seeds the engine from a finished lottery.
+
+        Parameters:
+            assignments - a dictionary mapping student IDs to the list of
+                          CRNs they were assigned.
+            ceilings - a dictionary mapping every CRN to its ceiling.
+                       A CRN assigned to a student more than once (the
+                       lottery can do that) is one enrollment.
+            priorities - the waitlist priorities from lottery_priorities().
+            max_classes - the most classes a student may hold at once.
+        """
+        self.ceilings = dict(ceilings)
+        self.enrolled = dict((crn, set()) for crn in self.ceilings)
+        self.schedules = {}
+        for id, crns in assignments.items():
+            self.schedules[id] = set(crns)
+            for crn in crns:
+                self.enrolled[crn].add(id)
+        self.seats = dict((crn, cap - len(self.enrolled[crn]))
+                          for crn, cap in self.ceilings.items())
+        self.priorities = dict(priorities)
+        self.max_classes = max_classes
+        self._waitlists = dict((crn, []) for crn in self.seats)
+        self._waiting = dict((crn, set()) for crn in self.seats)
+
+    def _priority(self, id):
+        '''Returns a student's priority; students the lottery never saw go
+            after everyone it did, first come first served.
+        '''
+        if id not in self.priorities:
+            self.priorities[id] = (len(CLASS_ORDER), len(self.priorities))
+        return self.priorities[id]
+
+    def _enroll(self, id, crn):
+        self.seats[crn] -= 1
+        self.enrolled[crn].add(id)
+        self.schedules.setdefault(id, set()).add(crn)
+
+    def _promote(self, crn):
+        '''Fills open seats in a course from its waitlist.
+
+        Returns: the list of IDs enrolled
+        '''
+        promoted = []
+        waitlist = self._waitlists[crn]
+        waiting = self._waiting[crn]
+        while self.seats[crn] > 0 and waitlist:
+            priority, id = heapq.heappop(waitlist)
+            if id not in waiting:
+                continue    # left the list since joining it
+            waiting.discard(id)
+            if len(self.schedules.get(id, ())) >= self.max_classes:
+                continue    # filled up elsewhere in the meantime
+            self._enroll(id, crn)
+            promoted.append(id)
+        return promoted
+
+    def add(self, id, crn):
+        '''A student asks for a course.
+
+        Returns: ENROLLED, WAITLISTED, ALREADY_ENROLLED, ALREADY_WAITLISTED,
+            FULL_LOAD or NO_SUCH_COURSE
+        '''
+        if crn not in self.seats:
+            return NO_SUCH_COURSE
+        if crn in self.schedules.get(id, ()):
+            return ALREADY_ENROLLED
+        if id in self._waiting[crn]:
+            return ALREADY_WAITLISTED
+        if len(self.schedules.get(id, ())) >= self.max_classes:
+            return FULL_LOAD
+        if self.seats[crn] > 0 and not self._waiting[crn]:
+            self._enroll(id, crn)
+            return ENROLLED
+        self._waiting[crn].add(id)
+        heapq.heappush(self._waitlists[crn], (self._priority(id), id))
+        return WAITLISTED
+
+    def drop(self, id, crn):
+        '''A student drops a course, or leaves its waitlist.
+
+        Returns: a list of (ID, CRN) enrollments the opened seat led to. A
+            drop frees a place in the student's schedule as well, but that
+            doesn't promote them anywhere on its own.
+        '''
+        if crn not in self.seats:
+            return []
+        if id in self._waiting[crn]:
+            self._waiting[crn].discard(id)
+            return []
+        if crn not in self.schedules.get(id, ()):
+            return []
+        self.schedules[id].discard(crn)
+        self.enrolled[crn].discard(id)
+        self.seats[crn] += 1
+        return [(other, crn) for other in self._promote(crn)]
+
+    def set_cap(self, crn, cap):
+        '''Changes the ceiling of a course (adding it if it's new). Seats
+            already taken stay taken, even over a lowered ceiling.
+
+        Returns: a list of (ID, CRN) enrollments the change led to
+        '''
+        if crn not in self.seats:
+            self.enrolled[crn] = set()
+            self._waitlists[crn] = []
+            self._waiting[crn] = set()
+        self.ceilings[crn] = cap
+        self.seats[crn] = cap - len(self.enrolled[crn])
+        return [(id, crn) for id in self._promote(crn)]
+
+    def check(self):
+        '''Checks that every course's seats left and enrollment add up to
+            its ceiling; raises a ValueError naming the first that doesn't.
+        '''
+        for crn, cap in self.ceilings.items():
+            if self.seats[crn] + len(self.enrolled[crn]) != cap:
+                raise ValueError('CRN %d has %d seats left and %d enrolled, '
+                                 'but a ceiling of %d' % (
+                                     crn, self.seats[crn],
+                                     len(self.enrolled[crn]), cap))
+
+    def waitlist(self, crn):
+        '''Returns the IDs on a course's waitlist, in order.'''
+        waiting = self._waiting[crn]
+        return [id for priority, id in sorted(self._waitlists[crn])
+                if id in waiting]
+
+    def assignments(self):
+        '''Returns a dictionary mapping each student ID to a sorted list of
+            the CRNs they're enrolled in.
+        '''
+        return dict((id, sorted(crns)) for id, crns in self.schedules.items())
+
+    def process(self, events):
+        '''Processes a stream of events.
+
+        Parameter:
+            events - an iterable of ('add', ID, CRN), ('drop', ID, CRN) or
+                ('cap', CRN, SEATS) tuples
+
+        Returns: a generator giving, for each event, a 2-tuple (result,
+            enrollments): add's result (None for the others) and the list
+            of (ID, CRN) enrollments from the waitlists the event led to
+        '''
+        for action, first, second in events:
+            if action == 'add':
+                result = self.add(first, second)
+                enrollments = [(first, second)] if result == ENROLLED else []
+                yield result, enrollments
+            elif action == 'drop':
+                yield None, self.drop(first, second)
+            elif action == 'cap':
+                yield None, self.set_cap(first, second)
+            else:
+                raise ValueError('unknown add/drop event %r' % action)
+
+
+def start_add_drop(filename, rng=random):
+    '''Runs the WebTree lottery on a request file and opens add/drop on the
+        result.
+
+    Parameters:
+        filename - the WebTree CSV
+        rng - the random number generator for the lottery
+
+    Returns: an AddDropEngine
+    '''
+    student_requests, students_by_class, courses = \
+        baseline_webtree.read_file(filename)
+    # run_webtree takes seats out of courses as it goes, once for every
+    # assignment, duplicates included, so keep the ceilings from before
+    ceilings = dict(courses)
+    random_ordering = baseline_webtree.assign_random_numbers(
+        students_by_class, rng)
+    assignments = baseline_webtree.run_webtree(student_requests,
+                                               students_by_class, courses,
+                                               random_ordering)
+    engine = AddDropEngine(assignments, ceilings,
+                           lottery_priorities(students_by_class,
+                                              random_ordering))
+    engine.check()
+    return engine
+
+
+def read_events(filename):
+    '''Reads add/drop events from a CSV, one (action, int, int) per row.'''
+    with open(filename, 'r') as f:
+        for row in csv.reader(f):
+            if row:
+                yield row[0].strip(), int(row[1]), int(row[2])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run the add/drop period after a WebTree lottery.')
+    parser.add_argument('requests', help='the WebTree CSV')
+    parser.add_argument('events', help='a CSV of add/drop/cap events')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the lottery')
+    parser.add_argument('--outfile', default=None,
+                        help='where to write the final enrollment')
+    args = parser.parse_args()
+
+    engine = start_add_drop(args.requests, random.Random(args.seed))
+    counts = {}
+    promotions = 0
+    for result, enrollments in engine.process(read_events(args.events)):
+        counts[result] = counts.get(result, 0) + 1
+        promotions += len(enrollments) if result is None else 0
+    for result in sorted(counts, key=str):
+        if result is not None:
+            print('%-20s %d' % (result, counts[result]))
+    print('%-20s %d' % ('promoted', promotions))
+
+    if args.outfile:
+        provenance = {'method': 'baseline', 'add_drop': args.events}
+        if args.seed is not None:
+            provenance['seed'] = args.seed
+        assignment_io.save(engine.assignments(), args.outfile,
+                           semester=assignment_io.semester_name(args.requests),
+                           provenance=provenance)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+'''
+Reading and writing class assignments. The binary format is the default; the
+old space-delimited text (one line per student: the ID, then its CRNs) is
+still there as an export option and is always readable.
+
+A binary assignment file is
+
+    MAGIC (4 bytes), VERSION and header length (little-endian uint32 each)
+    a JSON header: semester, provenance and the number of pairs, padded with
+        spaces so that the arrays start on an 8-byte boundary
+    the student IDs, one little-endian int32 per pair
+    the CRNs, one little-endian int32 per pair
+
+Pairs are sorted by student. A student who got nothing still appears, with a
+single EMPTY CRN, so that the number of students survives a round trip. The
+arrays can be memory-mapped straight out of the file.
+
+Author: Alden Hart
+'''
+
+import json
+import os
+import struct
+
+import numpy as np
+
+MAGIC = b'WTAS'
+VERSION = 1
+PREAMBLE = struct.Struct('<4sII')
+ALIGNMENT = 8
+
+# The CRN given to students who weren't assigned anything
+EMPTY = -1
+
+BINARY_SUFFIX = '.wta'
+TEXT_SUFFIXES = ('.txt',)
+
+PAIR_TYPE = np.dtype('<i4')
+
+
+def semester_name(filename):
+    '''Returns the semester a WebTree CSV is for, e.g. 'spring-2015'.'''
+    return os.path.splitext(os.path.basename(filename))[0]
+
+
+def to_pairs(assignments):
+    '''Flattens an assignment dictionary into parallel int32 arrays, sorted by
+        student, with one EMPTY pair for each student who got nothing.
+
+    Parameter:
+        assignments - a dictionary with student IDs as keys and the list of
+            CRNs they were assigned as values
+
+    Returns: a 2-tuple of arrays (students, crns)
+    '''
+    students = []
+    crns = []
+    for student in sorted(assignments):
+        classes = assignments[student] or [EMPTY]
+        students.extend([student] * len(classes))
+        crns.extend(classes)
+    return np.array(students, dtype=np.int32), np.array(crns, dtype=np.int32)
+
+
+def from_pairs(students, crns):
+    '''The inverse of to_pairs(): builds the assignment dictionary.'''
+    assignments = {}
+    for student, crn in zip(students.tolist(), crns.tolist()):
+        classes = assignments.setdefault(student, [])
+        if crn != EMPTY:
+            classes.append(crn)
+    return assignments
+
+
+def _header_size(header_length):
+    '''Returns where the arrays start, for a JSON header of the given length.'''
+    size = PREAMBLE.size + header_length
+    return size + (-size) % ALIGNMENT
+
+
+def write_pairs(filename, students, crns, semester=None, provenance=None):
+    '''Writes (student, CRN) pairs in the binary format.
+
+    Parameters:
+        filename - where to write
+        students, crns - parallel arrays of pairs, sorted by student, as from
+            to_pairs()
+        semester - optional name of the semester, e.g. 'spring-2015'
+        provenance - optional JSON-able dictionary describing how the
+            assignment was made (method, seed, ...)
+
+    Returns: None
+    '''
+    students = np.ascontiguousarray(students, dtype=PAIR_TYPE)
+    crns = np.ascontiguousarray(crns, dtype=PAIR_TYPE)
+    if len(students) != len(crns):
+        raise ValueError('students and crns have different lengths')
+
+    header = json.dumps({'semester': semester, 'provenance': provenance or {},
+                         'count': len(students)}, sort_keys=True)
+    header = header.encode('utf-8')
+    header += b' ' * (_header_size(len(header)) - PREAMBLE.size - len(header))
+    with open(filename, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, VERSION, len(header)))
+        f.write(header)
+        f.write(students.tobytes())
+        f.write(crns.tobytes())
+
+
+def read_pairs(filename, mmap=True):
+    '''Reads a binary assignment file.
+
+    Parameters:
+        filename - the file to read
+        mmap - whether to memory-map the arrays rather than read them in
+
+    Returns: a 3-tuple (students, crns, header), where header is the
+        dictionary with 'semester', 'provenance' and 'count'
+    '''
+    with open(filename, 'rb') as f:
+        magic, version, header_length = PREAMBLE.unpack(
+            f.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError('%s is not a binary assignment file' % filename)
+        if version != VERSION:
+            raise ValueError('%s has unsupported version %d'
+                             % (filename, version))
+        header = json.loads(f.read(header_length).decode('utf-8'))
+        count = header['count']
+        offset = _header_size(header_length)
+        if mmap and count:
+            pairs = np.memmap(f, dtype=PAIR_TYPE, mode='r', offset=offset,
+                              shape=(2, count))
+        else:
+            f.seek(offset)
+            pairs = np.fromfile(f, dtype=PAIR_TYPE,
+                                count=2 * count).reshape(2, count)
+    return pairs[0], pairs[1], header
+
+
+def write_text(assignments, filename):
+    '''Writes assignments as text: one line per student, the ID followed by
+        the CRNs, separated by spaces.
+    '''
+    lines = []
+    for student in sorted(assignments):
+        lines.append(' '.join([str(student)] +
+                              [str(c) for c in assignments[student]]) + ' \n')
+    with open(filename, 'w') as f:
+        f.write(''.join(lines))
+
+
+def read_text(filename):
+    '''Reads text assignments into a dictionary with integer keys and lists of
+        integer CRNs as values.
+    '''
+    assignments = {}
+    with open(filename, 'r') as f:
+        for row in f.read().splitlines():
+            split_row = row.split()
+            if split_row:
+                assignments[int(split_row[0])] = [int(x) for x in split_row[1:]]
+    return assignments
+
+
+def is_binary(filename):
+    '''Returns whether a file is in the binary assignment format.'''
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def choose_format(filename, format=None):
+    '''Returns 'text' or 'binary': the given format, or else text for the
+        TEXT_SUFFIXES and binary for everything else.
+    '''
+    if format is not None:
+        if format not in ('text', 'binary'):
+            raise ValueError('unknown assignment format %r' % format)
+        return format
+    if os.path.splitext(filename)[1].lower() in TEXT_SUFFIXES:
+        return 'text'
+    return 'binary'
+
+
+def save(assignments, filename, format=None, semester=None, provenance=None):
+    '''Writes an assignment dictionary in either format.
+
+    Parameters:
+        assignments - a dictionary with student IDs as keys and the list of
+            CRNs they were assigned as values
+        filename - where to write
+        format - 'text' or 'binary'; by default, chosen from the file name
+            by choose_format()
+        semester, provenance - recorded in the binary header (text files
+            have nowhere to keep them)
+
+    Returns: None
+    '''
+    if choose_format(filename, format) == 'text':
+        write_text(assignments, filename)
+    else:
+        students, crns = to_pairs(assignments)
+        write_pairs(filename, students, crns, semester, provenance)
+
+
+def load(filename):
+    '''Reads an assignment file in either format into a dictionary.'''
+    if is_binary(filename):
+        students, crns, _ = read_pairs(filename, mmap=False)
+        return from_pairs(students, crns)
+    return read_text(filename)
+
+
+def load_pairs(filename):
+    '''Reads an assignment file in either format as arrays, ready for
+        evaluation.score_pairs().
+
+    Returns: a 3-tuple (students, crns, num_students) with the EMPTY pairs
+        left out of students and crns but counted in num_students
+    '''
+    if is_binary(filename):
+        students, crns, _ = read_pairs(filename)
+    else:
+        students, crns = to_pairs(read_text(filename))
+    num_students = len(np.unique(students))
+    given = crns != EMPTY
+    return (np.asarray(students[given], dtype=np.int64),
+            np.asarray(crns[given], dtype=np.int64), num_students)
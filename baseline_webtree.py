@@ -1,14 +1,14 @@
 
-import csv
+from __future__ import print_function
+
 import sys
 import random
 from student import Student
 from happiness_function import evaluate_happiness
+from webtree_data import load_requests, CLASS_NAMES
+import assignment_io
 
-FIELDS = ['ID','CLASS','CRN','TREE','BRANCH','COURSE_CEILING',
-          'MAJOR','MAJOR2','SUBJ','NUMB','SEQ']
-
-OUTFILE = 'baseline_matches_spring-2015.txt'
+OUTFILE = 'baseline_matches_spring-2015.wta'
 
 def read_file(filename):
     """Returns data read in from supplied WebTree data file.
@@ -23,35 +23,32 @@ def read_file(filename):
            which students are seniors, juniors, etc.
         c) A dictionary mapping course CRNs to enrollment capacities.
     """
-    with open(filename, 'r') as csvfile:
-        reader = csv.DictReader(csvfile, fieldnames=FIELDS)
-        student_requests = {}
-        students_by_class = {'SENI': set([]), 'JUNI': set([]),
-                             'SOPH': set([]), 'FRST': set([]),
-                             'OTHER': set([])}
-        courses = {}
-        reader.next() # consume the first line, which is just column headers
-
-        for row in reader:
-            id = int(row['ID'])
-            class_year = row['CLASS']
-            crn = int(row['CRN'])
-            tree = int(row['TREE'])
-            branch = int(row['BRANCH'])
-            if id in student_requests: # does this student already exist?
-                student_requests[id].add_request(crn, tree, branch)
-            else: # nope, create a new record
-                s = Student(id, class_year)
-                s.add_request(crn, tree, branch)
-                student_requests[id] = s
-
+    data = load_requests(filename)
+    student_requests = {}
+    students_by_class = {'SENI': set([]), 'JUNI': set([]),
+                         'SOPH': set([]), 'FRST': set([]),
+                         'OTHER': set([])}
+
+    rows = zip(data['ID'].tolist(), data['CLASS'].tolist(),
+               data['CRN'].tolist(), data['TREE'].tolist(),
+               data['BRANCH'].tolist())
+    for id, class_code, crn, tree, branch in rows:
+        if id in student_requests: # does this student already exist?
+            student_requests[id].add_request(crn, tree, branch)
+        else: # nope, create a new record
+            class_year = CLASS_NAMES[class_code]
+            s = Student(id, class_year)
+            s.add_request(crn, tree, branch)
+            student_requests[id] = s
             students_by_class[class_year].add(id)
-            courses[crn] = int(row['COURSE_CEILING'])
-            
+
+    courses = dict(zip(data['CRN'].tolist(),
+                       data['COURSE_CEILING'].tolist()))
+
     return student_requests, students_by_class, courses
 
 
-def assign_random_numbers(students_by_class):
+def assign_random_numbers(students_by_class, rng=random):
     """Returns four randomly permuted orderings representing the order in
     which students will receive courses from the scheduler.
 
@@ -63,7 +60,10 @@ def assign_random_numbers(students_by_class):
         students_by_class - a dictionary mapping class years to student
                             IDs, indicating which students are seniors,
                             juniors, etc.
-                            
+        rng - the random number generator to shuffle with (anything with a
+              shuffle method, e.g. a random.Random). Defaults to the
+              module-level generator.
+
     Returns:
         A dictionary mapping class year to a list of four lists, each
         of which represents the scheduling order for the appropriate pass.
@@ -76,10 +76,10 @@ def assign_random_numbers(students_by_class):
         # list1 and list3 are independently random permutations; list2 and
         # list4 are the complements of number1 and number3 wrt the class size.
         list1 = list(students)
-        random.shuffle(list1)
+        rng.shuffle(list1)
         list2 = list1[::-1]
         list3 = list(students)
-        random.shuffle(list3)
+        rng.shuffle(list3)
         list4 = list3[::-1]
 
         random_ordering[class_year] = [list1, list2, list3, list4]
@@ -102,16 +102,14 @@ def assign_student(student, courses):
         if no course can be found.
     """
     while (student.can_advance_preference()):
-        try:
-            requested_course = student.get_next_course()
-            if (courses[requested_course] > 0): # there is space!
-                courses[requested_course] -= 1
-                student.advance_preference(True)
-                return requested_course
-        except KeyError: # student didn't fill in preference, continue
-            pass
-        
-        # No space (or student didn't specify this node), try next course
+        requested_course = student.get_next_course()
+        if (courses[requested_course] > 0): # there is space!
+            courses[requested_course] -= 1
+            student.advance_preference(True)
+            return requested_course
+
+        # No space, try next course. Nodes the student didn't fill in are
+        # skipped by the Student itself.
         student.advance_preference(False)
 
     # No courses can be assigned
@@ -151,27 +149,25 @@ def run_webtree(student_requests, students_by_class, courses, random_ordering):
                                         
     return assignments
 
-def write_out(assignments, filename):
-    '''Writes the final assignments to a txt file.'''
-    with open(filename, 'w') as f:
-        for a in sorted(assignments):
-            f.write(str(a) + ' ')
-            for c in assignments[a]:
-                f.write(str(c) + ' ')
-            f.write('\n')
+def write_out(assignments, filename, semester=None, provenance=None):
+    '''Writes the final assignments, in the binary assignment format unless
+        filename ends in .txt (see assignment_io.py).
+    '''
+    assignment_io.save(assignments, filename, semester=semester,
+                       provenance=provenance)
 
 
 def main():
     if (len(sys.argv) != 2):
-        print
-        print "***********************************************************"
-        print "You need to supply a .csv file containing the WebTree data"
-        print "as a command-line argument."
-        print
-        print "Example:"
-        print "    python baseline_webtree.py spring-2015.csv"
-        print "***********************************************************"
-        print
+        print()
+        print("***********************************************************")
+        print("You need to supply a .csv file containing the WebTree data")
+        print("as a command-line argument.")
+        print()
+        print("Example:")
+        print("    python baseline_webtree.py spring-2015.csv")
+        print("***********************************************************")
+        print()
         return
     
     # Read in data
@@ -192,7 +188,8 @@ def main():
     #         print course,
     #     print
 
-    write_out(assignments, OUTFILE)
+    write_out(assignments, OUTFILE, assignment_io.semester_name(sys.argv[1]),
+              {'method': 'baseline'})
 
     # test_prefs = [[None]*25]*9
     # test_prefs[0][1] = 10016
@@ -2,101 +2,179 @@
 Takes the result MATLAB spits out and turns it into a matching of students
 and their assigned classes.
 
+The result can come in three forms:
+    dense - what WebTree_LP_v2.m writes: one 0 or 1 per line for every
+        (student, class) variable
+    indices - one line per selected variable, giving its (0-based) index,
+        e.g. from fprintf(fileid, '%d\\n', find(x > 0.5) - 1)
+    bitmap - one bit per variable, packed 8 to a byte, high bit first
+        (numpy.packbits order)
+Whichever it is, decoding works on the indices of the selected variables
+only, so it takes time in the number of assigned pairs. Dense results are
+memory-mapped rather than read into a list.
+
+The input data is either the dense CSV given to WebTree_LP_v2.m, in which
+variable i is (student i // classes, class i % classes), or a sparse model
+from webtree_model.save_model, in which variable i is the model's pair i (as
+in webtree_ilp.build_program; any variables after the pairs are ignored).
+
 Author: Alden Hart
 3/23/2015
 '''
 
+from __future__ import print_function
+
+import argparse
+import os
+
 import numpy as np
-import csv
+
+import assignment_io
+from webtree_model import is_model_file, load_model
 
 MATLAB_RESULT = 'MATLAB_result_spring-2015.txt'
 INPUT_DATA = 'processed_data_spring-2015.csv'
-OUTFILE = 'class_matching_spring-2015.txt'
+OUTFILE = 'class_matching_spring-2015.wta'
 
-def read_in_result(MATLAB_RESULT):
-    '''Reads in what MATLAB spit out. Returns it as a list.'''
-    text_file = open(MATLAB_RESULT, 'r')
-    lines = text_file.readlines()
-    text_file.close()
+RESULT_FORMATS = ['dense', 'indices', 'bitmap']
 
-    out = []
-    for i in lines:
-        out.append(int(i))
-    return out
+# Result formats that go with file suffixes; anything else is dense
+RESULT_SUFFIXES = {'.idx': 'indices', '.bits': 'bitmap'}
+
+def result_format(filename):
+    '''Guesses the format of a solver result from its file name.'''
+    return RESULT_SUFFIXES.get(os.path.splitext(filename)[1].lower(), 'dense')
+
+def read_dense(filename):
+    '''Returns the indices of the 1s in a dense result. The usual layout, one
+        "0\\n" or "1\\n" per variable, is memory-mapped and scanned two bytes
+        per variable without being parsed.
+    '''
+    if os.path.getsize(filename) == 0:
+        return np.zeros(0, dtype=np.int64)
+    raw = np.memmap(filename, dtype=np.uint8, mode='r')
+    if len(raw) % 2 == 0 and np.all(raw[1::2] == ord('\n')):
+        return np.flatnonzero(raw[0::2] == ord('1'))
+
+    # Anything else (\r\n line endings, 1.000000e+00, ...) gets parsed
+    values = np.loadtxt(filename, dtype=float, ndmin=1)
+    return np.flatnonzero(values > 0.5)
+
+def read_indices(filename):
+    '''Returns the selected variable indices listed in a sparse result.'''
+    if os.path.getsize(filename) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.unique(np.loadtxt(filename, dtype=np.int64, ndmin=1))
+
+def read_bitmap(filename, num_variables=None):
+    '''Returns the indices of the set bits of a bitmap result.'''
+    bits = np.unpackbits(np.fromfile(filename, dtype=np.uint8))
+    return np.flatnonzero(bits[:num_variables])
+
+def read_in_result(MATLAB_RESULT, format=None, num_variables=None):
+    '''Reads in what MATLAB spit out.
+
+    Parameter:
+        MATLAB_RESULT - the name of the result file
+        format - one of RESULT_FORMATS; by default, guessed from the suffix
+        num_variables - the number of variables, to ignore the padding bits
+            at the end of a bitmap
+
+    Returns: a sorted array of the indices of the selected variables
+    '''
+    format = format or result_format(MATLAB_RESULT)
+    if format == 'dense':
+        return read_dense(MATLAB_RESULT)
+    elif format == 'indices':
+        return read_indices(MATLAB_RESULT)
+    elif format == 'bitmap':
+        return read_bitmap(MATLAB_RESULT, num_variables)
+    raise ValueError('unknown result format %r' % format)
 
 def read_input_data(INPUT_DATA):
     '''Reads in what you gave MATLAB so that you can figure out what class is
-        what and what person is who.
+        what and what person is who. Only the CRN header row and the ID
+        column are needed, so the preferences themselves are never parsed.
 
     Parameter:
         INPUT_DATA - the name of the file you put into MATLAB
 
-    Returns: a 2-D numpy array of the matrix
+    Returns: a 2-tuple of arrays (people, classes): the student IDs and the
+        CRNs, in the order of the rows and columns of the matrix
     '''
-    out = []
     with open(INPUT_DATA, 'r') as f:
-        reader = csv.reader(f)
-        for row in reader:
-            out.append(row)
+        classes = f.readline().strip().split(',')[1:]
+        f.readline()    # the course caps
+        people = [line.split(',', 1)[0] for line in f if line.strip()]
 
-    return out
+    return (np.array(people, dtype=np.int64),
+            np.array(classes, dtype=np.int64))
 
 def class_assignments(results, people, classes):
-    '''Takes the string of 1's and 0's that MATLAB gives you and turns that
-        into an assignment of four classes for each person.
+    '''Takes the variables MATLAB selected and turns them into an assignment
+        of four classes for each person.
 
     Parameter:
-        results - the list of MATLAB results
-        people - the list of student IDs, in order
-        classes - the list of CRNs in order
+        results - the sorted indices of the selected variables, as from
+            read_in_result()
+        people - the array of student IDs, in order
+        classes - the array of CRNs in order
 
     Returns: a dictionary with keys of people and values of the four classes
         this person got (as a list)
     '''
+    student_index, class_index = np.divmod(np.asarray(results, dtype=np.int64),
+                                           len(classes))
+    if len(student_index) and student_index[-1] >= len(people):
+        raise ValueError('result has more variables than students x classes')
+
     assignments = {}
-    num_classes = len(classes)
-
-    for i in xrange(len(results)):
-        if results[i] == 1:
-            student_index = i / num_classes
-            class_index = i % num_classes
-            student = people[student_index]
-            crn = classes[class_index]
-            if student in assignments:
-                assignments[student].append(crn)
-            else:
-                assignments[student] = [crn]
+    for student, crn in zip(people[student_index].tolist(),
+                            classes[class_index].tolist()):
+        if student in assignments:
+            assignments[student].append(crn)
+        else:
+            assignments[student] = [crn]
 
     return assignments
 
-def write_out(assignments, filename):
-    '''Writes the final assignments to a txt file.'''
-    with open(filename, 'w') as f:
-        for a in sorted(assignments):
-            f.write(str(a) + ' ')
-            for c in assignments[a]:
-                f.write(str(c) + ' ')
-            f.write('\n')
+def write_out(assignments, filename, semester=None, provenance=None):
+    '''Writes the final assignments, in the binary assignment format unless
+        filename ends in .txt (see assignment_io.py).
+    '''
+    assignment_io.save(assignments, filename, semester=semester,
+                       provenance=provenance)
 
 
 def main():
-    result = read_in_result(MATLAB_RESULT)
-    input_data = read_input_data(INPUT_DATA)
-    print 'Num results', len(result)
-    print 'Total classes assigned', sum(result)
-    crns = input_data[0][1:]
-    print 'Unique classes', len(crns)
-    # print crns[:10]
-    people = []
-    for row in input_data[2:]:
-        people.append(int(row[0]))
-    # print people[:10]
-    print 'Unique people', len(people)
-
-    assignments = class_assignments(result, people, crns)
-    # for p in assignments:
-    #     print p, assignments[p]
-    write_out(assignments, OUTFILE)
+    parser = argparse.ArgumentParser(
+        description='Turn a MATLAB solver result into a class matching.')
+    parser.add_argument('result', nargs='?', default=MATLAB_RESULT)
+    parser.add_argument('input_data', nargs='?', default=INPUT_DATA,
+                        help='the processed CSV that was given to MATLAB, or '
+                             'the saved model')
+    parser.add_argument('outfile', nargs='?', default=OUTFILE)
+    parser.add_argument('--format', choices=RESULT_FORMATS, default=None,
+                        help='the result format (default: from the suffix)')
+    args = parser.parse_args()
+
+    if is_model_file(args.input_data):
+        model = load_model(args.input_data)
+        print(model)
+        result = read_in_result(args.result, args.format, model.num_pairs)
+        assignments = model.assignments(result[result < model.num_pairs])
+    else:
+        people, crns = read_input_data(args.input_data)
+        print('Unique classes', len(crns))
+        print('Unique people', len(people))
+        result = read_in_result(args.result, args.format,
+                                len(people) * len(crns))
+        assignments = class_assignments(result, people, crns)
+    print('Total classes assigned',
+          sum(len(classes) for classes in assignments.values()))
+
+    write_out(assignments, args.outfile,
+              provenance={'method': 'matlab', 'result': args.result})
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
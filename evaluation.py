@@ -2,13 +2,28 @@
 Takes the matching from students to assigned courses and figures out whether
 the student is satisfied with the choices.
 
+Everything works on integer arrays: the assigned (student, CRN) pairs are
+looked up in the semester's preference index (preference_index.py) in one go,
+and every score is a grouped reduction over what comes back.
+
 Author: Alden Hart
 3/24/2015
 '''
 
+from __future__ import print_function
+
+import argparse
 import csv
+import glob
+import json
+import multiprocessing
+import sys
+
 import numpy as np
 
+import assignment_io
+from preference_index import pair_keys, rank_branch, rank_tree, read_index
+
 FA_2013_ASSIGNMENT_FILENAME = 'class_matching_fall-2013.txt'
 FA_2013_BASELINE_MATCHING = 'baseline_matches_fall-2013.txt'
 FA_2013_ORIGINAL_FILENAME = './WebTree Data/fall-2013.csv'
@@ -25,162 +40,57 @@ SP_2015_ASSIGNMENT_FILENAME = 'class_matching_spring-2015.txt'
 SP_2015_BASELINE_MATCHING = 'baseline_matches_spring-2015.txt'
 SP_2015_ORIGINAL_FILENAME = './WebTree Data/spring-2015.csv'
 
-FIELDS = ['ID','CLASS','CRN','TREE','BRANCH','COURSE_CEILING',
-          'MAJOR','MAJOR2','SUBJ','NUMB','SEQ']
-FIELDS_WE_CARE_ABOUT = ['ID','CLASS','CRN','TREE','BRANCH','COURSE_CEILING']
-ID = 0
-CLASS = 1
-CRN = 2
-TREE = 3
-BRANCH = 4
-COURSE_CEILING = 5
-
 def read_in_assignments(ASSIGNMENT_FILENAME):
-    '''Reads in the assigned courses'''
-    assignments = {}
-    with open(ASSIGNMENT_FILENAME, 'r') as f:
-        for row in f:
-            split_row = row.split(' ')
-            student = split_row[0]
-            # assignments[student] = [int(x) for x in split_row[1:-1]]
-            assignments[student] = split_row[1:-1]
-
-    return assignments
-
-
-def read_file(filename):
-    """Returns data read in from supplied WebTree data file.
-
-    Parameter:
-        filename - the name of the file to be read
-
-    Returns: a list for each column of the information
-    """
-    ids = []
-    classes = []
-    crns = []
-    trees = []
-    branches = []
-    ceilings = []
-
-    with open(filename, 'r') as csvfile:
-        reader = csv.DictReader(csvfile, fieldnames=FIELDS)
-        reader.next()   # get rid of the header line
-
-        for row in reader:
-            id = int(row['ID'])
-            ids.append(id)
-
-            class_year = row['CLASS']
-            classes.append(class_year)
-
-            crn = int(row['CRN'])
-            crns.append(crn)
-
-            tree = int(row['TREE'])
-            trees.append(tree)
+    '''Reads in the assigned courses, from a text or binary assignment file'''
+    return assignment_io.load(ASSIGNMENT_FILENAME)
 
-            branch = int(row['BRANCH'])
-            branches.append(branch)
 
-            ceiling = int(row['COURSE_CEILING'])
-            ceilings.append(ceiling)
-
-    raw_array = np.array([ids, classes, crns, trees, branches, ceilings])
-    return np.transpose(raw_array)
-
-def assigned_ranks(assignments, requests):
-    '''Looks at the classes each person was assigned and compares them to 
-        their rank in their trees.
+def assignment_pairs(assignments):
+    '''Flattens an assignment dictionary into parallel arrays.
 
     Parameter:
-        assignments - a dictionary with student IDs as keys and their four
+        assignments - a dictionary with student IDs as keys and their
             assigned classes as values
-        requests - the matrix of all request data
 
-    Returns: a dictionary with student IDs as keys and a list of tuples of
-        (CRN, tree, branch) of each course assigned.
+    Returns: a 3-tuple (students, crns, num_students): one entry in students
+        and crns per assigned class, and the number of students in the
+        assignment (including any who got nothing)
     '''
-    ranks = {}
-    for row in requests:
-        student = row[ID]
-        course = row[CRN]
-        if course in assignments[student]:  # They were assigned this course
-            tree = row[TREE]
-            branch = row[BRANCH]
-            if student in ranks:
-                ranks[student].append( (course, tree, branch) )
-            else:
-                ranks[student] = [ (course, tree, branch) ]
-    return ranks
-
-def remove_uniques(ranks):
-    '''The assigned_ranks() function returns a list of where the user ranked
-        each of their assigned courses in the trees. However, it is likely that
-        users put courses more than once in their tree. This removes all
-        duplicates, leaving you with one 3-tuple for each course corresponding
-        to the lowest rank (highest priority) time they put that course in the
-        tree.
-
-    Parameter:
-        ranks - a dictionary as returned by assigned_ranks()
-
-    Returns: a dictionary with duplicates removed.
-    '''
-    unique_ranks = {}
-    for student, lst in ranks.iteritems():
-        unique_ranks[student] = unique_classes(lst)
-
-    return unique_ranks
+    students = []
+    crns = []
+    for student, classes in assignments.items():
+        students.extend([student] * len(classes))
+        crns.extend(classes)
+    return (np.array(students, dtype=np.int64), np.array(crns, dtype=np.int64),
+            len(assignments))
 
-def unique_classes(lst):
-    '''Helper function to take a list of (class, tree, branch) tuples and 
-        return a list of tuples with no repeats of classes and only the 
-        lowest tree, branch choices for each class.
+def assigned_ranks(students, crns, index):
+    '''Looks at the classes each person was assigned and compares them to 
+        their rank in their trees, with one lookup in the preference index.
 
     Parameter:
-        lst - a list of tuples
+        students, crns - the assigned (student, CRN) pairs, as arrays
+        index - the semester's preference_index.PreferenceIndex
 
-    Returns: a list with the most preferred classes chosen
+    Returns: a 3-tuple of arrays (students, ranks, counts), one entry for
+        each distinct assigned pair the student actually requested, sorted by
+        student: the best rank they gave the course and how many times
+        they put it in their trees
     '''
-    classes = {}
-    for tple in lst:
-        crn = tple[0]
-        if crn in classes:
-            class_in_dict = classes[crn]
-            new_class = (tple[1], tple[2])
-            if higher_preference(new_class, class_in_dict):
-                classes[crn] = new_class
-        else:
-            classes[crn] = (tple[1], tple[2])
-
-    uniques = []
-    for k, v in classes.iteritems():
-        uniques.append( (k, v[0], v[1]) )
-
-    return uniques
-
-def higher_preference(class_a, class_b):
-    '''Determines which of class_a and class_b the user wanted more.
-
-    Parameter:
-        class_a - a 3-tuple of (crn, tree, branch)
-        class_b - a 3-tuple of (crn, tree, branch)
-
-    Returns: true if the user preferred class_a, false otherwise
+    keys = np.unique(pair_keys(students, crns))
+    position = index.lookup(keys >> 32, keys & 0xffffffff)
+    requested = position >= 0
+    position = position[requested]
+    return (keys[requested] >> 32, index.ranks[position].astype(np.int64),
+            index.counts[position].astype(np.int64))
+
+def _group_by_student(students):
+    '''Returns (number of students, group index of every entry) for entries
+        sorted by student.
     '''
-    tree_a = class_a[0]
-    branch_a = class_a[1]
-    tree_b = class_b[0]
-    branch_b = class_b[1]
-
-    if tree_a <= tree_b:
-        if tree_a < tree_b:
-            return True
-        elif branch_a < branch_b:
-            return True
-
-    return False
+    first = np.ones(len(students), dtype=bool)
+    first[1:] = students[1:] != students[:-1]
+    return int(first.sum()), np.cumsum(first) - 1
 
 def duplicate_counts(ranks):
     '''Returns an estimation for the success of the ranking. If a user put
@@ -190,90 +100,87 @@ def duplicate_counts(ranks):
         are better)
 
     Parameter:
-        ranks - a dictionary as assigned by assigned_ranks()
+        ranks - the arrays as returned by assigned_ranks()
 
-    Returns: a dictionary with student IDs as keys and scores as values.
+    Returns: an array of the scores of every student with a requested class
     '''
-    scores = {}
-    for student, lst in ranks.iteritems():
-        scores[student] = count_classes(lst)
+    students, _, counts = ranks
+    num_students, group = _group_by_student(students)
+    return np.bincount(group, counts - 1, num_students)
 
-    return scores
+def average_count_score(duplicate_counts):
+    '''Returns the average duplicate count of the set of assignments, as a 
+        metric for how good the matching was.
+    '''
+    if len(duplicate_counts) == 0:
+        return float('nan')
+    return float(np.mean(duplicate_counts))
 
-def count_classes(lst):
-    '''Counts the number of duplicate classes in the given list.
+def tree_score(ranks):
+    '''Returns the average (tree, branch) position of the assigned classes:
+        the average over students of each student's average position.
+    '''
+    students, best, _ = ranks
+    num_students, group = _group_by_student(students)
+    if num_students == 0:
+        return (float('nan'), float('nan'))
+    num_classes = np.bincount(group, minlength=num_students)
+    trees = np.bincount(group, rank_tree(best), num_students)
+    branches = np.bincount(group, rank_branch(best), num_students)
+    return (float(np.mean(trees / num_classes)),
+            float(np.mean(branches / num_classes)))
+
+def avg_classes_assigned(students, num_students):
+    '''Maybe the most important metric is how many classes get assigned per 
+        person. This returns the average number of classes per person.
 
     Parameter:
-        lst - a list of 3-tuples (crn, tree, branch)
+        students - the student of every assigned class
+        num_students - the number of students in the assignment
 
-    Returns: the number of duplicates in the list
+    Returns: the average number of classes assigned to each person
     '''
-    count = 0
-    found_classes = set()
-    for tple in lst:
-        current_class = tple[0]
-        if current_class in found_classes:
-            count += 1
-        else:
-            found_classes.add(current_class)
+    return len(students) / float(num_students)
 
-    return count
+def score_pairs(students, crns, num_students, index):
+    '''Computes every score for an assignment given as parallel arrays.
 
-def average_count_score(duplicate_counts):
-    '''Returns the average duplicate count of the set of assignments, as a 
-        metric for how good the matching was.
-    '''
-    total_score = 0
-    total_counts = 0.0
-    for person, score in duplicate_counts.iteritems():
-        total_counts += 1
-        total_score += score
-
-    return total_score / total_counts
+    Parameter:
+        students, crns - the assigned (student ID, CRN) pairs
+        num_students - the number of students in the assignment
+        index - the semester's preference_index.PreferenceIndex
 
-def d_score(assignment_file, request_file):
-    '''Returns the average number of times a person put a courses they got in 
-        WebTree, as a measure of how good the matching was.
+    Returns: a 4-tuple (duplicate score, tree score, branch score,
+        average classes assigned)
     '''
-    assignments = read_in_assignments(assignment_file)
-    requests = read_file(request_file)
-    ranks = assigned_ranks(assignments, requests)
-    duplicate_scores = duplicate_counts(ranks)
+    ranks = assigned_ranks(students, crns, index)
+    avg_d_score = average_count_score(duplicate_counts(ranks))
+    avg_tree_score = tree_score(ranks)
+    avg_num_classes = avg_classes_assigned(students, num_students)
 
-    return average_count_score(duplicate_scores)
+    return (avg_d_score, avg_tree_score[0], avg_tree_score[1], avg_num_classes)
 
-def tree_score(unique_ranks):
-    '''Returns the average (tree, branch) position of the four assigned classes.
-    '''
-    tot_tree = 0
-    tot_branch = 0
-    num_students = 0.0
-    for student, classes in unique_ranks.iteritems():
-        # tot_tree += classes[1]
-        # tot_branch += classes[2]
-        student_scores = individual_score(classes)
-        tot_tree += student_scores[0]
-        tot_branch += student_scores[1]
-        num_students += 1
-
-    return (tot_tree/num_students, tot_branch/num_students)
-
-def individual_score(classes):
-    '''Calculates the average tree and branch position of the four classes
-        assigned to the student.
+def score_assignments(assignments, index):
+    '''Computes all the scores of all_scores() for an assignment that's
+        already in memory.
 
     Parameter:
-        classes - a list of (crn, tree, branch) tuples of the classes assigned
+        assignments - a dictionary with student IDs as keys and their
+            assigned classes as values
+        index - the semester's preference_index.PreferenceIndex
 
-    Returns: a tuple of (average tree, average branch)
+    Returns: a 4-tuple (duplicate score, tree score, branch score,
+        average classes assigned)
     '''
-    tot_tree = 0.0
-    tot_branch = 0.0
-    for c in classes:
-        tot_tree += float(c[1])
-        tot_branch += float(c[2])
+    return score_pairs(*(assignment_pairs(assignments) + (index,)))
 
-    return (tot_tree/len(classes), tot_branch/len(classes))
+def d_score(assignment_file, request_file):
+    '''Returns the average number of times a person put a courses they got in 
+        WebTree, as a measure of how good the matching was.
+    '''
+    students, crns, num_students = assignment_io.load_pairs(assignment_file)
+    ranks = assigned_ranks(students, crns, read_index(request_file))
+    return average_count_score(duplicate_counts(ranks))
 
 def all_scores(assignment_file, request_file):
     '''Computes both the duplicate score and tree score for the given assignment.
@@ -282,176 +189,138 @@ def all_scores(assignment_file, request_file):
         assignment_file - the file with the class assignments
         request_file - the WebTree data file
 
-    Returns: a 3-tuple (duplicate score, tree score, branch score)
+    Returns: a 4-tuple (duplicate score, tree score, branch score,
+        average classes assigned)
     '''
-    assignments = read_in_assignments(assignment_file)
-    requests = read_file(request_file)
-    ranks = assigned_ranks(assignments, requests)
-    unique_ranks = remove_uniques(ranks)
-    duplicate_scores = duplicate_counts(ranks)
-    avg_d_score = average_count_score(duplicate_scores)
-    avg_tree_score = tree_score(unique_ranks)
-    avg_num_classes = avg_classes_assigned(assignments)
+    students, crns, num_students = assignment_io.load_pairs(assignment_file)
+    return score_pairs(students, crns, num_students, read_index(request_file))
 
-    return (avg_d_score, avg_tree_score[0], avg_tree_score[1], avg_num_classes)
 
-def avg_classes_assigned(assignments):
-    '''Maybe the most important metric is how many classes get assigned per 
-        person. This returns the average number of classes per person.
+# Every committed matching, with the semester it was made from
+DEFAULT_PAIRS = [
+    (FA_2013_ASSIGNMENT_FILENAME, FA_2013_ORIGINAL_FILENAME),
+    (FA_2013_BASELINE_MATCHING, FA_2013_ORIGINAL_FILENAME),
+    (FA_2014_ASSIGNMENT_FILENAME, FA_2014_ORIGINAL_FILENAME),
+    (FA_2014_BASELINE_MATCHING, FA_2014_ORIGINAL_FILENAME),
+    (SP_2014_ASSIGNMENT_FILENAME, SP_2014_ORIGINAL_FILENAME),
+    (SP_2014_BASELINE_MATCHING, SP_2014_ORIGINAL_FILENAME),
+    (SP_2015_ASSIGNMENT_FILENAME, SP_2015_ORIGINAL_FILENAME),
+    (SP_2015_BASELINE_MATCHING, SP_2015_ORIGINAL_FILENAME),
+]
+
+SCORE_NAMES = ['duplicate', 'tree', 'branch', 'classes']
+
+TABLE_COLUMNS = ['assignment', 'requests'] + SCORE_NAMES + \
+    ['happiness', 'students', 'short']
+
+def expand_pairs(pairs):
+    '''Expands (assignment file, request file) pairs whose assignment side is
+        a glob pattern, grouping the assignments by request file.
 
     Parameter:
-        assignments - the class assignments
+        pairs - a list of (assignment file or glob, request file) pairs
 
-    Returns: the average number of classes assigned to each person
+    Returns: a list of (request file, list of assignment files), with the
+        request files in the order they first appear
     '''
-    total_classes = 0.0
-    for person, classes in assignments.iteritems():
-        total_classes += len(classes)
+    semesters = {}
+    order = []
+    for pattern, request_file in pairs:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) \
+            else [pattern]
+        if not matches:
+            raise IOError('no assignment files match %r' % pattern)
+        if request_file not in semesters:
+            semesters[request_file] = []
+            order.append(request_file)
+        for assignment_file in matches:
+            if assignment_file not in semesters[request_file]:
+                semesters[request_file].append(assignment_file)
+    return [(request_file, semesters[request_file]) for request_file in order]
+
+def evaluate_semester(semester):
+    '''Scores every assignment of one semester against its requests, which
+        are read only once.
 
-    return total_classes/len(assignments)
+    Parameter:
+        semester - a (request file, list of assignment files) pair
 
+    Returns: a list of table rows, one per assignment file, as dictionaries
+        keyed by TABLE_COLUMNS
+    '''
+    request_file, assignment_files = semester
+    index = read_index(request_file)
+    rows = []
+    for assignment_file in assignment_files:
+        students, crns, num_students = assignment_io.load_pairs(
+            assignment_file)
+        row = {'assignment': assignment_file, 'requests': request_file}
+        row.update(zip(SCORE_NAMES,
+                       score_pairs(students, crns, num_students, index)))
+        row['happiness'] = index.happiness(students, crns)
+        row['students'] = num_students
+        # Students with fewer than a full load (students with none don't
+        # appear in students at all)
+        per_student = np.unique(students, return_counts=True)[1]
+        row['short'] = num_students - int(np.sum(per_student >= 4))
+        rows.append(row)
+    return rows
+
+def evaluate_batch(pairs, processes=None):
+    '''Scores many assignments, with each semester handled by its own
+        worker process.
+
+    Parameters:
+        pairs - a list of (assignment file or glob, request file) pairs
+        processes - the number of worker processes (default: one per core,
+            but never more than there are semesters)
+
+    Returns: a list of table rows as from evaluate_semester(), in the order
+        the pairs were given
+    '''
+    semesters = expand_pairs(pairs)
+    workers = min(len(semesters), processes or multiprocessing.cpu_count())
+    if workers <= 1:
+        results = [evaluate_semester(semester) for semester in semesters]
+    else:
+        pool = multiprocessing.Pool(workers)
+        try:
+            results = pool.map(evaluate_semester, semesters)
+        finally:
+            pool.close()
+            pool.join()
+    return [row for rows in results for row in rows]
+
+def write_table(rows, f, format='csv'):
+    '''Writes the evaluation table as CSV or JSON to an open file.'''
+    if format == 'json':
+        json.dump(rows, f, indent=2)
+        f.write('\n')
+    else:
+        writer = csv.DictWriter(f, TABLE_COLUMNS, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
 
 def main():
-    # assignments = read_in_assignments(ASSIGNMENT_FILENAME)
-    # requests = read_file(ORIGINAL_FILENAME)
-    # ranks = assigned_ranks(assignments, requests)
-    # unique_ranks = remove_uniques(ranks)
-    # duplicate_scores = duplicate_counts(ranks)
-
-    # our_score = d_score(ASSIGNMENT_FILENAME, ORIGINAL_FILENAME)
-    # baseline_score = d_score(BASELINE_MATCHING, ORIGINAL_FILENAME)
-    # our_tree_score = t_score(ASSIGNMENT_FILENAME, ORIGINAL_FILENAME)
-
-    our_avg_dup_score = 0
-    our_avg_tree_score = 0
-    our_avg_branch_score = 0
-
-    baseline_avg_dup_score = 0
-    baseline_avg_tree_score = 0
-    baseline_avg_branch_score = 0
-    baseline_avg_classes = 0
-
-    fa_2013_our_score = all_scores(FA_2013_ASSIGNMENT_FILENAME, FA_2013_ORIGINAL_FILENAME)
-    fa_2013_baseline_score = all_scores(FA_2013_BASELINE_MATCHING, FA_2013_ORIGINAL_FILENAME)
-    print 'fall-2013'
-    print 'ours', fa_2013_our_score
-    print 'baseline', fa_2013_baseline_score
-    our_avg_dup_score += fa_2013_our_score[0]
-    our_avg_tree_score += fa_2013_our_score[1]
-    our_avg_branch_score += fa_2013_our_score[2]
-    baseline_avg_dup_score += fa_2013_baseline_score[0]
-    baseline_avg_tree_score += fa_2013_baseline_score[1]
-    baseline_avg_branch_score += fa_2013_baseline_score[2]
-    baseline_avg_classes += fa_2013_baseline_score[3]
-
-    fa_2014_our_score = all_scores(FA_2014_ASSIGNMENT_FILENAME, FA_2014_ORIGINAL_FILENAME)
-    fa_2014_baseline_score = all_scores(FA_2014_BASELINE_MATCHING, FA_2014_ORIGINAL_FILENAME)
-    print 'fall-2014'
-    print 'ours', fa_2014_our_score
-    print 'baseline', fa_2014_baseline_score
-    our_avg_dup_score += fa_2014_our_score[0]
-    our_avg_tree_score += fa_2014_our_score[1]
-    our_avg_branch_score += fa_2014_our_score[2]
-    baseline_avg_dup_score += fa_2014_baseline_score[0]
-    baseline_avg_tree_score += fa_2014_baseline_score[1]
-    baseline_avg_branch_score += fa_2014_baseline_score[2]
-    baseline_avg_classes += fa_2014_baseline_score[3]
-
-    sp_2014_our_score = all_scores(SP_2014_ASSIGNMENT_FILENAME, SP_2014_ORIGINAL_FILENAME)
-    sp_2014_baseline_score = all_scores(SP_2014_BASELINE_MATCHING, SP_2014_ORIGINAL_FILENAME)
-    print 'spring-2014'
-    print 'ours', sp_2014_our_score
-    print 'baseline', sp_2014_baseline_score
-    our_avg_dup_score += sp_2014_our_score[0]
-    our_avg_tree_score += sp_2014_our_score[1]
-    our_avg_branch_score += sp_2014_our_score[2]
-    baseline_avg_dup_score += sp_2014_baseline_score[0]
-    baseline_avg_tree_score += sp_2014_baseline_score[1]
-    baseline_avg_branch_score += sp_2014_baseline_score[2]
-    baseline_avg_classes += sp_2014_baseline_score[3]
-
-    sp_2015_our_score = all_scores(SP_2015_ASSIGNMENT_FILENAME, SP_2015_ORIGINAL_FILENAME)
-    sp_2015_baseline_score = all_scores(SP_2015_BASELINE_MATCHING, SP_2015_ORIGINAL_FILENAME)
-    print 'spring-2015'
-    print 'ours', sp_2015_our_score
-    print 'baseline', sp_2015_baseline_score
-    our_avg_dup_score += sp_2015_our_score[0]
-    our_avg_tree_score += sp_2015_our_score[1]
-    our_avg_branch_score += sp_2015_our_score[2]
-    baseline_avg_dup_score += sp_2015_baseline_score[0]
-    baseline_avg_tree_score += sp_2015_baseline_score[1]
-    baseline_avg_branch_score += sp_2015_baseline_score[2]
-    baseline_avg_classes += sp_2015_baseline_score[3]
-
-    print 'our duplicate:', our_avg_dup_score/4.0
-    print 'our tree:', our_avg_tree_score/4.0
-    print 'our branch:', our_avg_branch_score/4.0
-    print
-    print 'baseline dup:', baseline_avg_dup_score/4.0
-    print 'baseline tree:', baseline_avg_tree_score/4.0
-    print 'baseline branch:', baseline_avg_branch_score/4.0
-    print 'baseline classes:', baseline_avg_classes/4.0
-
-    # # The raw data
-    # for i in range(10):
-    #     print requests[i]
-
-    # # Each person's class assignment
-    # j = 0
-    # for k, v in assignments.iteritems():
-    #     if j < 10:
-    #         print k, v
-    #     j += 1
-
-    # # The ranks people gave the classes they got
-    # j = 0
-    # for k, v in ranks.iteritems():
-    #     if j < 10:
-    #         print k, v
-    #     j += 1
-
-    # The highest rank of each class given to a person
-    # j = 0
-    # for k, v in unique_ranks.iteritems():
-    #     if j < 10:
-    #         print k, v
-    #     j += 1
-
-    # The "duplicate score" of each person
-    # j = 0
-    # for k, v in duplicate_scores.iteritems():
-    #     if j < 10:
-    #         print k, v
-    #     j += 1
-
-    # print average_count_score(duplicate_scores)
-
-    # print '344' in assignments
-    # print '15262' in assignments['344']
-    # print assignments['344']
-    # print 15262 in assignments['344']
-
-    f2013 = read_in_assignments(FA_2013_BASELINE_MATCHING)
-    f2014 = read_in_assignments(FA_2014_BASELINE_MATCHING)
-    s2014 = read_in_assignments(SP_2014_BASELINE_MATCHING)
-    s2015 = read_in_assignments(SP_2015_BASELINE_MATCHING)
-    total = 0
-    for person, classes in f2013.iteritems():
-        if len(classes) < 4:
-            total += 1
-    for person, classes in f2014.iteritems():
-        if len(classes) < 4:
-            total += 1
-    for person, classes in s2014.iteritems():
-        if len(classes) < 4:
-            total += 1
-    for person, classes in s2015.iteritems():
-        if len(classes) < 4:
-            total += 1
-
-    print 'Students without four classes:', total / 4.0
+    parser = argparse.ArgumentParser(
+        description='Score class assignments against their WebTree requests. '
+                    'With no --pair, scores every committed matching.')
+    parser.add_argument('--pair', nargs=2, action='append', default=None,
+                        metavar=('ASSIGNMENTS', 'REQUESTS'),
+                        help='an assignment file (or quoted glob) and the '
+                             'WebTree CSV it was made from; repeatable')
+    parser.add_argument('--format', choices=['csv', 'json'], default='csv')
+    parser.add_argument('--out', default=None,
+                        help='where to write the table (default: stdout)')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    rows = evaluate_batch(args.pair or DEFAULT_PAIRS, args.processes)
+    if args.out is None:
+        write_table(rows, sys.stdout, args.format)
+    else:
+        with open(args.out, 'w') as f:
+            write_table(rows, f, args.format)
 
 if __name__ == '__main__':
     main()
-
-# 344 [15262, 15261, 15561, 15513]
\ No newline at end of file
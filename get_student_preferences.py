@@ -6,8 +6,13 @@ Authors: Rich Korzelius and Alden Hart
 """
 
 def get_student_prefs(num_unique_students, possibles, student_ids, crns, trees, branches):
-	used_students = [None] * num_unique_students
-	student_pref_matrix = [[None]*possible] * num_unique_students
+	"""Returns one list of possibles CRNs (None where empty) per student,
+	indexed by student ID, with each CRN at position rank - 1.
+
+	For anything beyond a quick look, preference_index.build_index is the
+	shared, array-backed version of this.
+	"""
+	student_pref_matrix = [[None] * possibles for _ in range(num_unique_students)] #separate lists, not one list aliased N times
 
 	for i in range(len(student_ids)):
 		student_in_question = student_ids[i]
@@ -16,4 +21,4 @@ def get_student_prefs(num_unique_students, possibles, student_ids, crns, trees,
 		student_pref_matrix[student_in_question][preference - 1] = class_in_question
 
 
-	return student_pref_matrix
\ No newline at end of file
+	return student_pref_matrix
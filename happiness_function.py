@@ -5,16 +5,27 @@ Fitness (Happiness) Function for Webtree course assignemnts
 Authors: Alden Hart and Rich Korzelius
 """
 
+import numpy as np
 
+from preference_index import NUM_PREFS
 
-def evaluate_happiness(assignments, student_pref_matrix):
-	happiness_sum = 0
-	NUM_PREFS = 25
 
+def evaluate_happiness(assignments, preference_index):
+	"""Each assigned course is worth NUM_PREFS for a first choice, down to 1
+	for a last choice (and nothing if the student never asked for it).
+
+	Parameters:
+		assignments - a dictionary mapping student IDs to their CRNs.
+		preference_index - the semester's preference_index.PreferenceIndex.
+
+	Returns:
+		The total happiness, from one lookup over every assigned course.
+	"""
+	students = []
+	courses = []
 	for student in assignments:
-		courses = assignments[student] #get student course assignments
-		preferences = student_pref_matrix[int(student) - 1] #get list of student preferences 
-		for i in range(len(courses)):
-			happiness_sum += NUM_PREFS - preferences.index(courses[i]) #add the prefernece level of each assigned course to happiness sum
+		students.extend([int(student)] * len(assignments[student])) #one entry per assigned course
+		courses.extend(int(c) for c in assignments[student])
 
-	return happiness_sum
+	return preference_index.happiness(np.array(students, dtype=np.int64),
+	                                  np.array(courses, dtype=np.int64))
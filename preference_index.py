@@ -0,0 +1,170 @@
+'''
+One index over a semester's preferences, built once and shared by happiness
+scoring, evaluation and the simulators.
+
+It's laid out like a CSR matrix: student i's requested courses are
+crns[offsets[i]:offsets[i+1]], best rank first, each course once with the
+best rank the student gave it. Next to that is a (student ID, CRN) lookup:
+the pairs packed into sorted int64 keys, so looking up any number of pairs
+is one searchsorted. Student IDs don't have to be dense.
+
+Author: Alden Hart
+'''
+
+import numpy as np
+
+from student import BRANCHES
+from webtree_data import load_requests
+from webtree_model import preference_ranks
+
+# The number of preference ranks: seven in each of the first three trees,
+# four in the fill-in tree
+NUM_PREFS = 25
+
+# The rank looked up for a course the student never asked for
+NOT_REQUESTED = 0
+
+
+def pair_keys(students, crns):
+    '''Packs (student ID, CRN) pairs into single int64 keys.'''
+    return (np.asarray(students, dtype=np.int64) << 32) | \
+        np.asarray(crns, dtype=np.int64)
+
+
+class PreferenceIndex:
+    """Every student's requests for one semester.
+
+    Attributes:
+        student_ids - the student IDs, sorted (int32).
+        offsets - where each student's requests start in crns, plus the end
+                  of the last student's (int64, one longer than student_ids).
+        crns - each student's requested CRNs, best rank first (int32).
+        ranks - the best rank the student gave each of those CRNs (int16).
+        counts - how many times the student put that CRN in their trees
+                 (int16).
+        keys - the sorted (student ID, CRN) keys from pair_keys() (int64).
+        key_pairs - the position in crns of each key.
+    """
+    def __init__(self, student_ids, offsets, crns, ranks, counts):
+        self.student_ids = student_ids
+        self.offsets = offsets
+        self.crns = crns
+        self.ranks = ranks
+        self.counts = counts
+        students = np.repeat(student_ids, np.diff(offsets))
+        keys = pair_keys(students, crns)
+        self.key_pairs = np.argsort(keys, kind='stable')
+        self.keys = keys[self.key_pairs]
+
+    def __len__(self):
+        return len(self.student_ids)
+
+    def __str__(self):
+        """Returns a printable summary of the index size."""
+        return '{%d students, %d requested pairs}' % (len(self),
+                                                      len(self.crns))
+
+    def student_index(self, ids):
+        '''Returns the index of each student ID, or -1 for unknown IDs.'''
+        ids = np.asarray(ids)
+        where = np.minimum(np.searchsorted(self.student_ids, ids),
+                           max(len(self.student_ids) - 1, 0))
+        found = self.student_ids[where] == ids if len(self.student_ids) \
+            else np.zeros(ids.shape, dtype=bool)
+        return np.where(found, where, -1)
+
+    def preferences(self, id):
+        '''Returns a 2-tuple (crns, ranks) of one student's requests, best
+            first (views, not copies).
+        '''
+        i = self.student_index(id)
+        if i < 0:
+            raise KeyError(id)
+        part = slice(self.offsets[i], self.offsets[i + 1])
+        return self.crns[part], self.ranks[part]
+
+    def lookup(self, students, crns):
+        '''Finds (student ID, CRN) pairs in the index.
+
+        Parameters:
+            students, crns - parallel arrays of pairs
+
+        Returns: the position in crns/ranks/counts of every pair, or -1 for
+            pairs the student didn't request
+        '''
+        keys = pair_keys(students, crns)
+        if len(self.keys) == 0:
+            return np.full(keys.shape, -1, dtype=np.int64)
+        where = np.minimum(np.searchsorted(self.keys, keys),
+                           len(self.keys) - 1)
+        return np.where(self.keys[where] == keys, self.key_pairs[where], -1)
+
+    def rank_of(self, students, crns):
+        '''Returns the best rank each student gave each CRN, or
+            NOT_REQUESTED.
+        '''
+        position = self.lookup(students, crns)
+        return np.where(position >= 0, self.ranks[position], NOT_REQUESTED)
+
+    def happiness(self, students, crns):
+        '''Returns the happiness of assigned (student ID, CRN) pairs: for
+            each pair, NUM_PREFS + 1 - its best rank, so a student's first
+            choice is worth NUM_PREFS and a course they didn't ask for is
+            worth nothing.
+        '''
+        ranks = self.rank_of(students, crns)
+        return int(np.sum(np.where(ranks != NOT_REQUESTED,
+                                   NUM_PREFS + 1 - ranks, 0)))
+
+
+def rank_tree(ranks):
+    '''Returns the tree of each preference rank.'''
+    return (ranks - 1) // BRANCHES + 1
+
+
+def rank_branch(ranks):
+    '''Returns the branch of each preference rank.'''
+    return (ranks - 1) % BRANCHES + 1
+
+
+def build_index(data):
+    '''Builds the preference index from the request columns.
+
+    Parameter:
+        data - the request columns as returned by webtree_data.load_requests()
+
+    Returns: a PreferenceIndex
+    '''
+    ranks = preference_ranks(data['TREE'], data['BRANCH'])
+    keys = pair_keys(data['ID'], data['CRN'])
+
+    # One entry per (student, CRN), with its best rank and how often it
+    # was requested
+    order = np.lexsort((ranks, keys))
+    keys = keys[order]
+    ranks = ranks[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = keys[1:] != keys[:-1]
+    starts = np.flatnonzero(first)
+    counts = np.diff(np.append(starts, len(keys)))
+    keys = keys[starts]
+    ranks = ranks[starts]
+    students = keys >> 32
+    crns = keys & 0xffffffff
+
+    # CSR rows: by student, then rank
+    order = np.lexsort((crns, ranks, students))
+    students = students[order]
+    student_ids, row_counts = np.unique(students, return_counts=True)
+    offsets = np.zeros(len(student_ids) + 1, dtype=np.int64)
+    np.cumsum(row_counts, out=offsets[1:])
+
+    return PreferenceIndex(student_ids.astype(np.int32), offsets,
+                           crns[order].astype(np.int32),
+                           ranks[order].astype(np.int16),
+                           counts[order].astype(np.int16))
+
+
+def read_index(filename):
+    '''Builds the preference index for a WebTree CSV.'''
+    return build_index(load_requests(filename))
@@ -1,15 +1,135 @@
 
-class Student:
+# WebTree nodes are numbered 0-27: node 7*(tree-1) + (branch-1). EXHAUSTED is
+# the state after the last tree has been used up.
+TREES = 4
+BRANCHES = 7
+NUM_NODES = TREES * BRANCHES
+EXHAUSTED = NUM_NODES
+
+
+def node_index(tree, branch):
+    """Returns the node number of a (tree, branch) pair, or EXHAUSTED for the
+    (0, 0) "nowhere left to go" pair.
+    """
+    if (tree == 0) or (branch == 0):
+        return EXHAUSTED
+    return BRANCHES * (tree - 1) + (branch - 1)
+
+
+def next_node(tree, branch, got_last_class):
+    """Returns the (tree, branch) pair that follows the given node.
+
+    Parameters:
+        tree, branch - the node just considered.
+        got_last_class - a Boolean indicating whether the student received
+                         the class at that node.
+
+    Returns:
+        The next (tree, branch) pair, or (0, 0) if there is nowhere left to go.
+    """
+    if (tree == 0) or (branch == 0):
+        raise Exception("This should never happen!")
+
+    if got_last_class: # stay along same path if possible
+        if (tree <= 3) and (branch <= 3):
+            return (tree, branch*2)
+        elif (tree <= 3): # time to move to fill-in tree (#4)
+            return (4, 1)
+        elif (branch <= 3): # already in tree #4
+            return (4, branch + 1)
+        else: # already at 4-4, nowhere left to go, tough luck kid.
+            return (0, 0)
+    else: # need to make a parallel move, or jump to a different tree
+        if (tree <= 3) and (branch == 1):
+            return (tree + 1, 1)
+        elif (tree <= 3) and (branch % 2 == 0): # rightwards move if possible
+            return (tree, branch + 1)
+        elif (tree <= 3) and (branch == 3): # special case, goes to next row
+            return (tree, branch + 1)
+        elif (tree <= 3): # 5 or 7, move to fill-in tree (#4)
+            return (4, 1)
+        elif (branch <= 3): # already in tree #4
+            return (4, branch + 1)
+        else: # tough luck kid
+            return (0, 0)
+
+
+def _table(move):
+    """Tabulates a move over every node; EXHAUSTED stays EXHAUSTED."""
+    table = []
+    for node in range(NUM_NODES):
+        tree, branch = node // BRANCHES + 1, node % BRANCHES + 1
+        table.append(node_index(*move(tree, branch)))
+    return tuple(table) + (EXHAUSTED,)
+
+ON_SUCCESS = _table(lambda tree, branch: next_node(tree, branch, True))
+ON_FAILURE = _table(lambda tree, branch: next_node(tree, branch, False))
+
+
+def _level_order(tree, branch):
+    """The next node in a level-order walk over all four trees."""
+    if (tree == 4) and (branch == 4): # we're done
+        return (0, 0)
+    elif (tree == 4): # rightwards on tree #4
+        return (4, branch + 1)
+    elif (branch == 7): # jump to top of next tree
+        return (tree + 1, 1)
+    else: # next node in current tree in level order
+        return (tree, branch + 1)
+
+LEVEL_ORDER = _table(_level_order)
+
+# Compiled plans, shared by every student who filled in the same set of nodes
+_plans = {}
+
+
+def compile_plan(filled):
+    """Returns the traversal plan for a set of filled-in nodes.
+
+    A plan is a 3-tuple of tables indexed by node: where to go on success,
+    where to go on failure, and where a walk starting at that node really
+    starts. All three skip over empty nodes, so following a plan only ever
+    lands on a filled-in node or EXHAUSTED.
+
+    Parameters:
+        filled - a bit mask with bit n set iff node n was filled in.
+
+    Returns:
+        The plan (shared between students; don't modify it).
+    """
+    plan = _plans.get(filled)
+    if plan is None:
+        skip = [EXHAUSTED] * (NUM_NODES + 1)
+        # Failure moves only go forward, so fill in from the back
+        for node in range(NUM_NODES - 1, -1, -1):
+            if filled & (1 << node):
+                skip[node] = node
+            else:
+                skip[node] = skip[ON_FAILURE[node]]
+        plan = (tuple(skip[n] for n in ON_SUCCESS),
+                tuple(skip[n] for n in ON_FAILURE),
+                tuple(skip))
+        _plans[filled] = plan
+    return plan
+
+
+class Student(object):
     """Type for representing a student record.
 
+    The student's trees are compiled into a plan (see compile_plan) the first
+    time they are walked, so that walking them is a table lookup per step.
+
     Attributes:
         id - an integer representing the student's ID number.
         class_year - a string representing the student's class year.
-        _next_course - a tuple representing the WebTree node that
-                       should be considered next for scheduling.
-        requests - a list of 3-tuples representing the student's
-                   WebTree requests.
+        _nodes - the CRN at every WebTree node (None where left empty).
+        _filled - a bit mask of the filled-in nodes.
+        _plan - the compiled plan, or None until the next walk compiles it.
+        _node - the WebTree node that should be considered next for
+                scheduling.
     """
+    __slots__ = ('id', 'class_year', '_nodes', '_filled', '_plan', '_node')
+
     def __init__(self, id, class_year):
         """Constructs a new student record with specified attributes.
 
@@ -19,8 +139,10 @@ class Student:
         """
         self.id = id
         self.class_year = class_year
-        self._next_course = (1, 1)
-        self.requests = {}
+        self._nodes = [None] * (NUM_NODES + 1)
+        self._filled = 0
+        self._plan = None
+        self._node = 0
 
     def __str__(self):
         """Returns a printable representation of this student record.
@@ -34,6 +156,12 @@ class Student:
         str_rep += "}"
         return str_rep
 
+    @property
+    def requests(self):
+        """A dictionary mapping (tree, branch) nodes to the requested CRNs."""
+        return dict(((node // BRANCHES + 1, node % BRANCHES + 1), crn)
+                    for node, crn in enumerate(self._nodes) if crn is not None)
+
     def add_request(self, crn, tree, branch):
         """Adds the supplied WebTree request to this student's record.
 
@@ -45,7 +173,20 @@ class Student:
         Returns:
             None.
         """
-        self.requests[(tree, branch)] = crn
+        node = node_index(tree, branch)
+        self._nodes[node] = crn
+        self._filled |= 1 << node
+        self._plan = None
+
+    def _compile(self):
+        """Compiles this student's plan and moves the next node onto a
+        filled-in one.
+
+        Returns:
+            None.
+        """
+        self._plan = compile_plan(self._filled)
+        self._node = self._plan[2][self._node]
 
     def get_next_course(self):
         """Returns the next CRN according to this student's preference.
@@ -54,19 +195,23 @@ class Student:
             An integer representing the next CRN in this student's completed
             preference form.
         """
-        return self.requests[self._next_course]
+        if self._plan is None:
+            self._compile()
+        return self._nodes[self._node]
 
     def can_advance_preference(self):
         """Returns True iff this student's WebTree has not been exhausted.
 
         Returns:
-            True iff we've not already advanced beyond tree #4, branch #4 in
-            this student's preferences (which resets the counters to (0, 0)).
+            True iff there's a filled-in node left to consider.
         """
-        return (self._next_course != (0, 0))
+        if self._plan is None:
+            self._compile()
+        return self._node != EXHAUSTED
 
     def advance_preference(self, got_last_class):
-        """Progresses along this student's WebTree preferences.
+        """Progresses along this student's WebTree preferences, skipping any
+        nodes the student left empty.
 
         Parameters:
             got_last_class - a Boolean indicating whether the student received
@@ -75,67 +220,34 @@ class Student:
         Returns:
             None
         """
-        tree = self._next_course[0]
-        branch = self._next_course[1]
-
-        if (tree == 0) or (branch == 0):
+        if self._plan is None:
+            self._compile()
+        if self._node == EXHAUSTED:
             raise Exception("This should never happen!")
-        
+
         if got_last_class: # stay along same path if possible
-            if (tree <= 3) and (branch <= 3):
-                self._next_course = (tree, branch*2)
-            elif (tree <= 3): # time to move to fill-in tree (#4)
-                self._next_course = (4, 1)
-            elif (branch <= 3): # already in tree #4
-                self._next_course = (4, branch + 1)
-            else: # already at 4-4, nowhere left to go, tough luck kid.
-                self._next_course = (0, 0)
+            self._node = self._plan[0][self._node]
         else: # need to make a parallel move, or jump to a different tree
-            if (tree <= 3) and (branch == 1):
-                self._next_course = (tree + 1, 1)
-            elif (tree <= 3) and (branch % 2 == 0): # rightwards move if possible
-                self._next_course = (tree, branch + 1)
-            elif (tree <= 3) and (branch == 3): # special case, goes to next row
-                self._next_course = (tree, branch + 1)
-            elif (tree <= 3): # 5 or 7, move to fill-in tree (#4)
-                self._next_course = (4, 1)
-            elif (branch <= 3): # already in tree #4
-                self._next_course = (4, branch + 1)
-            else: # tough luck kid
-                self._next_course = (0, 0)
+            self._node = self._plan[1][self._node]
 
     def reset_preferences(self):
-        """Resets this student's WebTree iterator to tree #1, branch #1.
+        """Resets this student's WebTree iterator to tree #1, branch #1 (or
+        the first filled-in node after it).
 
         Returns:
             None.
         """
-        self._next_course = (1, 1)
+        self._node = 0
+        if self._plan is not None:
+            self._node = self._plan[2][0]
 
     def traverse_tree(self):
         """Performs a level-order traversal of every tree in the student's
-        preferences.
+        preferences. Unlike advance_preference, this visits empty nodes too.
 
         Returns:
             None.
         """
-        tree = self._next_course[0]
-        branch = self._next_course[1]
-        
-        if (tree == 0) or (branch == 0):
+        if self._node == EXHAUSTED:
             raise Exception("This should never happen!")
-
-        if (tree == 4) and (branch == 4): # we're done
-            self._next_course = (0, 0)
-        elif (tree == 4): # rightwards on tree #4
-            self._next_course = (4, branch + 1)
-        elif (branch == 7): # jump to top of next tree
-            self._next_course = (tree + 1, 1)
-        else: # next node in current tree in level order
-            self._next_course = (tree, branch + 1)
-                
-                
-            
-                
-            
-    
+        self._node = LEVEL_ORDER[self._node]
@@ -0,0 +1,172 @@
+'''
+Struct-of-arrays storage for every student in a semester. Where read_file in
+baseline_webtree.py builds a Student object (with its own node list) per ID,
+a StudentStore keeps IDs, class years, traversal cursors and request tables in
+a handful of contiguous numpy arrays. It takes a few bytes per request, and
+pickles as a few flat buffers when it's sent to a process pool.
+
+Students are sorted by class year, seniors first, so each class year is a
+contiguous slice and by_class() is a view rather than a copy.
+
+Author: Alden Hart
+'''
+
+import numpy as np
+
+from student import BRANCHES, EXHAUSTED, NUM_NODES, TREES, compile_plan
+from webtree_data import CLASS_CODES, CLASS_NAMES
+
+NUM_STATES = NUM_NODES + 1
+
+CLASS_ORDER = ['SENI', 'JUNI', 'SOPH', 'FRST', 'OTHER']
+
+
+class StudentStore:
+    """Every student of a semester, as parallel arrays.
+
+    Course references are indices into crns. Each student's node table uses
+    MISSING (= number of courses) for empty nodes and DONE (= number of
+    courses + 1) in the EXHAUSTED column.
+
+    Traversal plans (see student.compile_plan) are shared: students who
+    filled in the same nodes point at the same row of the plan tables.
+
+    Attributes:
+        ids - the student IDs (int32).
+        class_codes - the class year codes from webtree_data.CLASS_CODES
+                      (int8).
+        first_row - the request row each student first appears on (int32).
+        requests - the (students x NUM_STATES) table of course indices.
+        cursor - each student's current traversal state (int8).
+        plan - each student's row in the plan tables (int32).
+        plan_start - the first non-empty state of every plan.
+        plan_success, plan_failure - the (plans x NUM_STATES) next-state
+                      tables, empty nodes skipped.
+        crns - the CRNs the course indices refer to (int32).
+        class_slices - a dictionary mapping each class year to the slice of
+                      students in it.
+    """
+    def __init__(self, ids, class_codes, first_row, requests, cursor, plan,
+                 plan_start, plan_success, plan_failure, crns, class_slices):
+        self.ids = ids
+        self.class_codes = class_codes
+        self.first_row = first_row
+        self.requests = requests
+        self.cursor = cursor
+        self.plan = plan
+        self.plan_start = plan_start
+        self.plan_success = plan_success
+        self.plan_failure = plan_failure
+        self.crns = crns
+        self.class_slices = class_slices
+        self._sorted_ids = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def MISSING(self):
+        return len(self.crns)
+
+    @property
+    def DONE(self):
+        return len(self.crns) + 1
+
+    def by_class(self, class_year):
+        '''Returns a StudentStore view (no copying) of one class year.'''
+        part = self.class_slices[class_year]
+        start = part.start
+        slices = dict((year, slice(0, 0)) for year in CLASS_ORDER)
+        slices[class_year] = slice(0, part.stop - start)
+        return StudentStore(self.ids[part], self.class_codes[part],
+                            self.first_row[part], self.requests[part],
+                            self.cursor[part], self.plan[part],
+                            self.plan_start, self.plan_success,
+                            self.plan_failure, self.crns, slices)
+
+    def index_of(self, ids):
+        '''Returns the store index of each of the given student IDs.'''
+        if self._sorted_ids is None:
+            order = np.argsort(self.ids, kind='stable')
+            self._sorted_ids = (self.ids[order], order)
+        sorted_ids, order = self._sorted_ids
+        return order[np.searchsorted(sorted_ids, ids)]
+
+    def reset(self):
+        '''Moves every student's cursor back to the start of their trees.'''
+        self.cursor[:] = self.plan_start[self.plan]
+
+    def students_by_class(self):
+        '''Returns the dictionary mapping class years to sets of student IDs,
+            built in the same order as baseline_webtree.read_file builds it.
+        '''
+        students_by_class = dict((year, set()) for year in CLASS_ORDER)
+        order = np.argsort(self.first_row, kind='stable')
+        for id, code in zip(self.ids[order].tolist(),
+                            self.class_codes[order].tolist()):
+            students_by_class[CLASS_NAMES[code]].add(id)
+        return students_by_class
+
+    def nbytes(self):
+        '''Returns the memory held by the per-student arrays, in bytes.'''
+        return sum(a.nbytes for a in (self.ids, self.class_codes,
+                                      self.first_row, self.requests,
+                                      self.cursor, self.plan))
+
+
+def build_store(data):
+    '''Builds the StudentStore for the request columns.
+
+    Parameter:
+        data - the request columns from webtree_data.load_requests()
+
+    Returns: a StudentStore
+    '''
+    ids, first_row, inverse = np.unique(data['ID'], return_index=True,
+                                        return_inverse=True)
+    class_codes = data['CLASS'][first_row]
+
+    # Seniors first, then juniors, ...; file order within a class year
+    order = np.lexsort((first_row, -class_codes.astype(np.int64)))
+    position = np.empty(len(ids), dtype=np.int64)
+    position[order] = np.arange(len(ids))
+    student_index = position[inverse]
+    ids = ids[order].astype(np.int32)
+    class_codes = class_codes[order]
+    first_row = first_row[order].astype(np.int32)
+
+    crns, course_index = np.unique(data['CRN'], return_inverse=True)
+    missing = len(crns)
+    requests = np.empty((len(ids), NUM_STATES), dtype=np.int32)
+    requests.fill(missing)
+    requests[:, EXHAUSTED] = missing + 1
+    trees = data['TREE'].astype(np.int64)
+    branches = data['BRANCH'].astype(np.int64)
+    valid = ((trees >= 1) & (trees <= TREES) &
+             (branches >= 1) & (branches <= BRANCHES))
+    # Later rows overwrite earlier ones, like Student.add_request
+    requests[student_index[valid],
+             BRANCHES * (trees[valid] - 1) + branches[valid] - 1] = \
+        course_index[valid]
+
+    # One compiled plan per distinct set of filled-in nodes
+    weights = np.left_shift(1, np.arange(NUM_NODES, dtype=np.int64))
+    filled = (requests[:, :NUM_NODES] != missing).astype(np.int64).dot(weights)
+    masks, plan = np.unique(filled, return_inverse=True)
+    plans = [compile_plan(int(mask)) for mask in masks.tolist()]
+    plan_success = np.array([p[0] for p in plans], dtype=np.int8)
+    plan_failure = np.array([p[1] for p in plans], dtype=np.int8)
+    plan_start = np.array([p[2][0] for p in plans], dtype=np.int8)
+    plan = plan.astype(np.int32)
+
+    class_slices = {}
+    for year in CLASS_ORDER:
+        members = np.flatnonzero(class_codes == CLASS_CODES[year])
+        if len(members):
+            class_slices[year] = slice(members[0], members[-1] + 1)
+        else:
+            class_slices[year] = slice(0, 0)
+
+    return StudentStore(ids, class_codes, first_row, requests,
+                        plan_start[plan], plan, plan_start, plan_success,
+                        plan_failure, crns.astype(np.int32), class_slices)
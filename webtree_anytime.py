@@ -0,0 +1,323 @@
+'''
+Anytime solve of the WebTree matching: always has a matching in hand, gets
+better as long as there's time, and stops at a wall-clock deadline with the
+best matching found and how far from optimal it can be.
+
+    1. The incumbent starts as the WebTree lottery (baseline_webtree), with
+       any seats it left open filled greedily, so there is a feasible answer
+       within a second.
+    2. The LP relaxation (webtree_lp) gives a lower bound for the gap. If its
+       answer is integral, which it usually is for the plain program, it is
+       an optimal matching and we're done; a fractional one is rounded and
+       repaired as a candidate.
+    3. Until the deadline, or until the gap closes, large neighbourhood
+       search: free the seats of a random set of students, keep everyone
+       else's, and solve that part exactly with the ILP on the seats left.
+       The current matching is always one answer to the part, so it never
+       gets worse.
+
+scipy's milp takes no starting point, so the incumbent warm-starts the
+search rather than the solver. Every improvement goes to the callback and,
+if asked for, to a checkpoint (a binary assignment file, with the objective
+and bound in its provenance), written at most every CHECKPOINT_INTERVAL
+seconds and once more at the end, so a crash or a kill at the deadline
+still leaves a recent matching on disk.
+
+    python webtree_anytime.py "WebTree Data/spring-2015.csv" out.wta --until 06:00
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import datetime
+import os
+import time
+
+import numpy as np
+
+import webtree_ilp
+import webtree_lp
+from assignment_io import save, semester_name
+from webtree_match import run_baseline
+from webtree_model import read_model
+
+# Students freed per neighbourhood
+NEIGHBOURHOOD = 200
+
+# Don't start a step with less time than this left, in seconds
+MIN_STEP = 0.5
+
+# Seconds between checkpoint writes
+CHECKPOINT_INTERVAL = 5.0
+
+
+def selection(model, assignments):
+    '''Turns an assignment dictionary into a boolean mask over the model's
+        pairs. Assigned CRNs the student never requested are left out.
+    '''
+    wanted = set((id, crn) for id, crns in assignments.items()
+                 for crn in crns)
+    pairs = zip(model.student_ids[model.pair_student].tolist(),
+                model.crns[model.pair_course].tolist())
+    return np.array([pair in wanted for pair in pairs], dtype=bool)
+
+
+def gap(objective, bound):
+    '''Returns the relative gap between an objective and a lower bound, or
+        None without a bound.
+    '''
+    if bound is None:
+        return None
+    return max(objective - bound, 0.0) / max(abs(bound), 1.0)
+
+
+def solve_neighbourhood(model, selected, students, time_limit=None):
+    '''Re-solves some students' seats exactly, keeping everyone else's.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        selected - a boolean mask over the model's pairs, the current
+            matching
+        students - the sorted indices of the students to free
+        time_limit - optional limit on solver time, in seconds
+
+    Returns: a new boolean mask over the model's pairs
+    '''
+    free = np.zeros(model.num_students, dtype=bool)
+    free[students] = True
+    kept = selected & ~free[model.pair_student]
+    remaining = model.caps - np.bincount(model.pair_course[kept],
+                                         minlength=model.num_courses)
+    courses = np.arange(model.num_courses)
+    part, pairs = model.submodel(students, courses, remaining)
+    result = kept.copy()
+    result[pairs[webtree_ilp.solve_model(part, time_limit)]] = True
+    return result
+
+
+class AnytimeSolve:
+    """The state of an anytime solve: the best matching so far and the
+    bound it is measured against.
+
+    Attributes:
+        model - the webtree_model.PreferenceModel being solved.
+        deadline - the time.time() at which to stop.
+        callback - called as callback(selected, objective, bound, source)
+                   with every improvement, or None.
+        checkpoint - where to keep the best matching, or None.
+        semester - the semester recorded in checkpoints.
+        best - a boolean mask over the model's pairs, the best matching.
+        objective - its cost.
+        bound - the best lower bound known, or None.
+        improvements - how many times the matching got better.
+        source - what found the best matching.
+        last_checkpoint - the time.time() of the last checkpoint written.
+        unwritten - whether the best matching is newer than the checkpoint.
+    """
+    def __init__(self, model, deadline, callback=None, checkpoint=None,
+                 semester=None):
+        self.model = model
+        self.deadline = deadline
+        self.callback = callback
+        self.checkpoint = checkpoint
+        self.semester = semester
+        self.best = None
+        self.objective = None
+        self.bound = None
+        self.improvements = 0
+        self.source = None
+        self.last_checkpoint = 0.0
+        self.unwritten = False
+
+    def remaining(self):
+        '''Returns the seconds left before the deadline.'''
+        return self.deadline - time.time()
+
+    def offer(self, selected, source):
+        '''Takes a matching if it's better than the best so far.
+
+        Parameters:
+            selected - a boolean mask over the model's pairs, within every
+                ceiling and slot count
+            source - what found it, for the callback and the checkpoint
+
+        Returns: whether it was taken
+        '''
+        objective = self.model.objective(selected)
+        if self.objective is not None and objective >= self.objective:
+            return False
+        self.best = selected
+        self.objective = objective
+        self.source = source
+        self.improvements += 1
+        self.unwritten = True
+        if time.time() - self.last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.write_checkpoint()
+        if self.callback is not None:
+            self.callback(selected, objective, self.bound, source)
+        return True
+
+    def write_checkpoint(self):
+        '''Writes the best matching to the checkpoint file, if there is one
+            and it isn't written yet. Written under a temporary name and then
+            renamed, so the file is never half-written.
+        '''
+        if self.checkpoint is None or not self.unwritten:
+            return
+        tmp = '%s.%d.tmp' % (self.checkpoint, os.getpid())
+        save(self.model.assignments(self.best), tmp, format='binary',
+             semester=self.semester,
+             provenance={'method': 'anytime', 'source': self.source,
+                         'objective': self.objective, 'bound': self.bound})
+        os.rename(tmp, self.checkpoint)
+        self.last_checkpoint = time.time()
+        self.unwritten = False
+
+    def closed(self):
+        '''Returns whether the best matching is proven optimal.'''
+        # Costs are whole numbers, so an objective under bound + 1 is optimal
+        return self.bound is not None and self.objective < self.bound + 1
+
+    def run(self, initial, rng, neighbourhood=NEIGHBOURHOOD):
+        '''Improves on a starting matching until the deadline or until the
+            gap closes.
+
+        Parameters:
+            initial - a boolean mask over the model's pairs, within every
+                ceiling and slot count
+            rng - a numpy random Generator
+            neighbourhood - the number of students freed per step
+
+        Returns: the number of neighbourhoods searched
+        '''
+        model = self.model
+        webtree_lp.repair(model, initial, rng.permutation(model.num_students))
+        self.offer(initial, 'baseline')
+
+        if self.remaining() > MIN_STEP:
+            try:
+                values, self.bound = webtree_lp.solve_relaxation(
+                    model, self.remaining())
+            except RuntimeError:
+                pass
+            else:
+                selected = webtree_lp.round_values(model, values, rng)
+                webtree_lp.repair(model, selected,
+                                  rng.permutation(model.num_students))
+                self.offer(selected, 'lp')
+
+        steps = 0
+        size = min(neighbourhood, model.num_students)
+        while not self.closed() and self.remaining() > MIN_STEP:
+            students = np.sort(rng.choice(model.num_students, size,
+                                          replace=False))
+            try:
+                selected = solve_neighbourhood(model, self.best, students,
+                                               self.remaining())
+            except RuntimeError:
+                break
+            self.offer(selected, 'search')
+            steps += 1
+        self.write_checkpoint()
+        return steps
+
+
+def solve_anytime(model, filename, deadline, seed=None, callback=None,
+                  checkpoint=None, neighbourhood=NEIGHBOURHOOD):
+    '''Solves the matching for a preference model until a deadline, starting
+        from the WebTree lottery.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        filename - the WebTree CSV the model came from, for the lottery
+        deadline - the time.time() at which to stop
+        seed - optional seed for the lottery and the search
+        callback - optional function called as
+            callback(selected, objective, bound, source) with every
+            improvement
+        checkpoint - optional file to keep the best matching in
+        neighbourhood - the number of students freed per search step
+
+    Returns: a 2-tuple (selected, report): a boolean mask over the model's
+        pairs, and a dictionary with the objective, bound and gap
+    '''
+    start = time.time()
+    solve = AnytimeSolve(model, deadline, callback, checkpoint,
+                         semester_name(filename))
+    initial = selection(model, run_baseline(filename, seed))
+    steps = solve.run(initial, np.random.default_rng(seed), neighbourhood)
+    report = {'objective': solve.objective,
+              'bound': solve.bound,
+              'gap': gap(solve.objective, solve.bound),
+              'optimal': solve.closed(),
+              'improvements': solve.improvements,
+              'steps': steps,
+              'seconds': time.time() - start}
+    return solve.best, report
+
+
+def parse_deadline(seconds=None, until=None):
+    '''Returns the time.time() of a deadline given either as seconds from
+        now or as a clock time 'HH:MM' (the next time it comes round).
+    '''
+    if until is None:
+        return time.time() + seconds
+    clock = datetime.datetime.strptime(until, '%H:%M').time()
+    now = datetime.datetime.now()
+    at = datetime.datetime.combine(now.date(), clock)
+    if at <= now:
+        at += datetime.timedelta(days=1)
+    return time.time() + (at - now).total_seconds()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Solve the WebTree matching as well as possible by a '
+                    'deadline.')
+    parser.add_argument('requests', help='the WebTree CSV')
+    parser.add_argument('outfile', help='where to write the matching')
+    when = parser.add_mutually_exclusive_group()
+    when.add_argument('--seconds', type=float, default=60.0,
+                      help='time budget in seconds (default: 60)')
+    when.add_argument('--until', default=None,
+                      help='clock time to stop at, as HH:MM')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the lottery and the search')
+    parser.add_argument('--checkpoint', default=None,
+                        help='file to write every improvement to')
+    parser.add_argument('--neighbourhood', type=int, default=NEIGHBOURHOOD,
+                        help='students freed per search step')
+    args = parser.parse_args()
+
+    deadline = parse_deadline(args.seconds, args.until)
+    model = read_model(args.requests)
+    print(model)
+    start = time.time()
+
+    def progress(selected, objective, bound, source):
+        print('%7.2fs  %-8s objective %d%s' % (
+            time.time() - start, source, objective,
+            '' if bound is None else ', bound %.1f' % bound))
+
+    selected, report = solve_anytime(model, args.requests, deadline,
+                                     args.seed, progress, args.checkpoint,
+                                     args.neighbourhood)
+    if report['gap'] is None:
+        print('objective %d, no bound by the deadline' % report['objective'])
+    else:
+        print('objective %d, gap %.4f%%%s' % (
+            report['objective'], 100 * report['gap'],
+            ' (optimal)' if report['optimal'] else ''))
+
+    provenance = {'method': 'anytime', 'objective': report['objective'],
+                  'bound': report['bound']}
+    if args.seed is not None:
+        provenance['seed'] = args.seed
+    save(model.assignments(selected), args.outfile,
+         semester=semester_name(args.requests), provenance=provenance)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,397 @@
+'''
+Solves the WebTree matching with an auction (Bertsekas' auction algorithm,
+in its Jacobi form for a transportation problem). Every student has four
+slots to fill and every course has COURSE_CEILING seats. Each round, every
+student with an empty slot bids for the courses that look best at the
+current prices, raising each one's price by how much better it is than the
+next best option, plus epsilon. A course keeps its highest bids up to its
+ceiling, and the students outbid lose the seat and bid again next round.
+The slots nobody can fill cost BIG_NUMBER, as in the other solvers, so the
+auction always ends.
+
+A whole round is a handful of numpy operations over the requested pairs:
+every student's bids are worked out independently of the others, and all the
+state (who holds which seat, for how much, and the course prices) is kept
+per pair or per course, so memory grows with the number of requests.
+
+Epsilon scaling: the auction is run with a large epsilon first, then again
+with smaller and smaller epsilons starting from the prices the last run
+left. There are more seats than slots, so a course can be left with empty
+seats at a price from an earlier run; reverse rounds have those courses
+lower their prices to win students over, until every course with an empty
+seat is free again (Bertsekas and Castanon's forward/reverse auction for
+asymmetric problems). With integer ranks, finishing with epsilon below
+1 / (total slots) is optimal. Whatever epsilon it stops at, the final
+prices give a lower bound on the best possible objective (the Lagrangian
+dual of the course ceilings), so every result comes with a certified gap.
+
+    python webtree_auction.py "WebTree Data/spring-2015.csv" out.wta --tolerance 100
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+
+from assignment_io import save, semester_name
+from webtree_model import BIG_NUMBER, read_model
+
+# Epsilon is divided by this between scaling phases
+EPSILON_FACTOR = 5.0
+
+
+def group_positions(groups):
+    '''For a sorted array of group numbers, returns each element's position
+        within its group.
+    '''
+    if len(groups) == 0:
+        return np.zeros(0, dtype=np.int64)
+    starts = np.ones(len(groups), dtype=bool)
+    starts[1:] = groups[1:] != groups[:-1]
+    first = np.flatnonzero(starts)
+    sizes = np.diff(np.append(first, len(groups)))
+    return np.arange(len(groups)) - np.repeat(first, sizes)
+
+
+def lower_bound(model, prices):
+    '''Returns the Lagrangian lower bound on the objective given by a set of
+        course prices: each student's cheapest slots at those prices, minus
+        what every course's seats are worth. Any prices >= 0 give a valid
+        bound.
+    '''
+    usable = model.caps > 0
+    values = model.pair_rank + np.where(usable, prices, 0)[model.pair_course]
+    values[~usable[model.pair_course]] = np.inf
+
+    order = np.lexsort((values, model.pair_student))
+    students = model.pair_student[order]
+    values = values[order]
+    take = (group_positions(students) < model.slots[students]) & \
+        (values < BIG_NUMBER)
+    taken = np.bincount(students[take], minlength=model.num_students)
+    total = values[take].sum() + \
+        BIG_NUMBER * float(np.sum(model.slots - taken))
+    return total - float(np.dot(model.caps[usable], prices[usable]))
+
+
+class Auction:
+    '''The state of an auction over a preference model. Every seat has a
+    price: a held seat costs what it was won with, and a course's empty
+    seats all cost the same.
+
+    Attributes:
+        model - the webtree_model.PreferenceModel.
+        held - a boolean mask over the pairs: which students hold a seat.
+        paid - the bid each held seat was won with.
+        unfilled - how many of each student's slots are left empty.
+        empty_price - the price of each course's empty seats.
+        rounds - the number of bidding rounds run so far.
+    '''
+    def __init__(self, model):
+        self.model = model
+        self.held = np.zeros(model.num_pairs, dtype=bool)
+        self.paid = np.zeros(model.num_pairs)
+        self.unfilled = np.zeros(model.num_students, dtype=np.int64)
+        self.empty_price = np.zeros(model.num_courses)
+        self.rounds = 0
+
+    def taken(self):
+        '''Returns the number of seats held in each course.'''
+        return np.bincount(self.model.pair_course[self.held],
+                           minlength=self.model.num_courses)
+
+    def seat_prices(self):
+        '''Returns a 2-tuple of arrays (cheapest, second): the price of the
+            cheapest seat in each course (an empty seat if there is one,
+            otherwise the lowest winning bid) and of the next cheapest.
+        '''
+        model = self.model
+        held = np.flatnonzero(self.held)
+        courses = model.pair_course[held]
+        order = np.lexsort((self.paid[held], courses))
+        courses = courses[order]
+        paid = self.paid[held][order]
+        position = group_positions(courses)
+        lowest = np.full((2, model.num_courses), np.inf)
+        for k in range(2):
+            lowest[k, courses[position == k]] = paid[position == k]
+
+        open_seats = model.caps - self.taken()
+        cheapest = np.where(open_seats > 0, self.empty_price, lowest[0])
+        second = np.where(open_seats > 1, self.empty_price,
+                          np.where(open_seats == 1, lowest[0], lowest[1]))
+        return cheapest, second
+
+    def prices(self):
+        '''Returns the price of the cheapest seat in each course.'''
+        return self.seat_prices()[0]
+
+    def restart(self):
+        '''Empties every seat but keeps the prices, to start a new phase.'''
+        self.empty_price = np.where(self.model.caps > 0, self.prices(), 0.0)
+        self.held[:] = False
+        self.unfilled[:] = 0
+
+    def bid(self, epsilon):
+        '''Runs one forward round: every student with an empty slot bids,
+            and every course keeps its best bids.
+
+        Returns: whether anyone bid
+        '''
+        model = self.model
+        prices, second_prices = self.seat_prices()
+        free = model.slots - self.unfilled - np.bincount(
+            model.pair_student[self.held], minlength=model.num_students)
+        wanting = (free > 0)[model.pair_student]
+        candidates = np.flatnonzero(~self.held & wanting)
+        values = model.pair_rank[candidates] + \
+            prices[model.pair_course[candidates]]
+        order = np.lexsort((values, model.pair_student[candidates]))
+        candidates = candidates[order]
+        values = values[order]
+        students = model.pair_student[candidates]
+        position = group_positions(students)
+        need = free[students]
+
+        # The best thing each student can do with one more slot: the first
+        # course they won't bid on, or leaving the slot empty
+        second = np.full(model.num_students, float(BIG_NUMBER))
+        at_need = position == need
+        second[students[at_need]] = np.minimum(values[at_need], BIG_NUMBER)
+
+        bidding = (position < need) & (values < BIG_NUMBER)
+        # Slots with nothing better than staying empty are left empty
+        active = free > 0
+        self.unfilled[active] += free[active] - np.bincount(
+            students[bidding], minlength=model.num_students)[active]
+        if not bidding.any():
+            return False
+        self.rounds += 1
+
+        # Another seat in the same course is an alternative too: a student
+        # only has to outbid it, not their next best course
+        bidders = candidates[bidding]
+        amounts = np.minimum(
+            second[students[bidding]] - model.pair_rank[bidders],
+            second_prices[model.pair_course[bidders]]) + epsilon
+
+        # Every course keeps its best bids, current holders winning ties
+        holders = np.flatnonzero(self.held)
+        pairs = np.concatenate([holders, bidders])
+        offers = np.concatenate([self.paid[holders], amounts])
+        newcomer = np.concatenate([np.zeros(len(holders), dtype=bool),
+                                   np.ones(len(bidders), dtype=bool)])
+        courses = model.pair_course[pairs]
+        order = np.lexsort((newcomer, -offers, courses))
+        pairs = pairs[order]
+        offers = offers[order]
+        keep = group_positions(courses[order]) < model.caps[courses[order]]
+        self.held[pairs[~keep]] = False
+        self.held[pairs[keep]] = True
+        self.paid[pairs[keep]] = offers[keep]
+        return True
+
+    def _worst(self):
+        '''Returns a 2-tuple (values, pairs): each student's costliest
+            slot (its rank plus what they paid, or BIG_NUMBER for an empty
+            one), and the pair holding it (-1 for an empty slot).
+        '''
+        model = self.model
+        values = np.where(self.unfilled > 0, float(BIG_NUMBER), -np.inf)
+        pairs = np.full(model.num_students, -1, dtype=np.int64)
+        held = np.flatnonzero(self.held)
+        costs = model.pair_rank[held] + self.paid[held]
+        order = np.lexsort((costs, model.pair_student[held]))
+        held = held[order]
+        costs = costs[order]
+        students = model.pair_student[held]
+        last = np.ones(len(held), dtype=bool)
+        last[:-1] = students[1:] != students[:-1]
+        worse = costs[last] > values[students[last]]
+        values[students[last][worse]] = costs[last][worse]
+        pairs[students[last][worse]] = held[last][worse]
+        return values, pairs
+
+    def reverse(self, epsilon):
+        '''Runs one reverse round: every course with empty seats and a
+            price above zero lowers its price, just far enough to win over
+            the students who would gain the most by moving their costliest
+            slot into it (or to zero, if nobody would).
+
+        Returns: whether anyone moved or any price dropped
+        '''
+        model = self.model
+        open_seats = model.caps - self.taken()
+        selling = (open_seats > 0) & (self.empty_price > 0)
+        if not selling.any():
+            return False
+        worst, worst_pairs = self._worst()
+
+        candidates = np.flatnonzero(~self.held & selling[model.pair_course])
+        students = model.pair_student[candidates]
+        margins = worst[students] - model.pair_rank[candidates]
+        courses = model.pair_course[candidates]
+        order = np.lexsort((-margins, courses))
+        candidates = candidates[order]
+        students = students[order]
+        margins = margins[order]
+        courses = courses[order]
+        position = group_positions(courses)
+
+        # Each student can move one slot a round: the one into the course
+        # (with room for them) where they gain the most
+        offered = np.flatnonzero(position < open_seats[courses])
+        order = np.lexsort((-margins[offered], students[offered]))
+        offered = offered[order]
+        first = np.ones(len(offered), dtype=bool)
+        first[1:] = students[offered][1:] != students[offered][:-1]
+        chosen = np.zeros(len(candidates), dtype=bool)
+        chosen[offered[first]] = True
+
+        # Each course takes the students it was chosen by, best margin first,
+        # up to the first one it wasn't, and drops its price to the margin of
+        # that first one, less epsilon; so nobody else gains more than
+        # epsilon by moving in
+        limit = open_seats.copy()
+        np.minimum.at(limit, courses[~chosen], position[~chosen])
+        beyond = np.zeros(model.num_courses)
+        at_limit = position == limit[courses]
+        beyond[courses[at_limit]] = margins[at_limit]
+        new_prices = np.where(selling, np.maximum(beyond - epsilon, 0.0),
+                              self.empty_price)
+        # (Half of epsilon, as the gains of the students it picked are at
+        # least epsilon but for rounding)
+        movers = np.flatnonzero((position < limit[courses]) &
+                                (margins - new_prices[courses] >= epsilon / 2))
+        students = students[movers]
+
+        changed = bool(np.any(new_prices != self.empty_price)) or \
+            len(movers) > 0
+        self.empty_price = new_prices
+        # Holders of a cheaper course's seats pay no more than its new price
+        held = np.flatnonzero(self.held & selling[model.pair_course])
+        self.paid[held] = np.minimum(self.paid[held],
+                                     new_prices[model.pair_course[held]])
+        if len(movers) == 0:
+            return changed
+        self.rounds += 1
+
+        dropped = worst_pairs[students]
+        self.unfilled[students[dropped < 0]] -= 1
+        dropped = dropped[dropped >= 0]
+        # A course that was full and lost a seat sells it at what it cost
+        full = self.taken() >= model.caps
+        lost = model.pair_course[dropped]
+        self.empty_price[lost[full[lost]]] = np.inf
+        np.minimum.at(self.empty_price, lost, self.paid[dropped])
+        self.held[dropped] = False
+
+        taking = candidates[movers]
+        self.held[taking] = True
+        self.paid[taking] = new_prices[model.pair_course[taking]]
+        return True
+
+    def run(self, epsilon):
+        '''Bids, forward and in reverse, until every slot is filled or left
+            empty and no course with empty seats has a price.
+        '''
+        while True:
+            while self.bid(epsilon):
+                pass
+            if not self.reverse(epsilon):
+                break
+
+    def objective(self):
+        '''Returns the cost of the seats held, as
+            webtree_model.PreferenceModel.objective() counts it.
+        '''
+        return self.model.objective(self.held)
+
+
+def solve_auction(model, epsilon=None, tolerance=0.0, max_epsilon=None):
+    '''Runs the auction with epsilon scaling.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        epsilon - the smallest epsilon to scale down to (default: small
+                  enough that the result is optimal)
+        tolerance - stop as soon as the objective is certified to be within
+                    this much of the optimum
+        max_epsilon - the epsilon to start from (default: the largest rank)
+
+    Returns: a 2-tuple (auction, report): the finished Auction, and a
+        dictionary with the objective, the lower bound, the absolute gap
+        between them, the final epsilon and the number of rounds and phases
+    '''
+    if epsilon is None:
+        epsilon = 1.0 / (int(model.slots.sum()) + 1)
+    if max_epsilon is None:
+        max_epsilon = float(max(int(model.pair_rank.max()), 1)) \
+            if model.num_pairs else 1.0
+    auction = Auction(model)
+    current = max(max_epsilon, epsilon)
+    phases = 0
+    while True:
+        if phases:
+            auction.restart()
+        auction.run(current)
+        phases += 1
+        objective = auction.objective()
+        bound = lower_bound(model, auction.prices())
+        # The objective is a whole number, and so is the optimum
+        if objective - np.ceil(bound - 1e-6) <= tolerance or \
+                current <= epsilon:
+            break
+        current = max(current / EPSILON_FACTOR, epsilon)
+
+    report = {'objective': objective, 'bound': bound,
+              'absolute_gap': objective - bound, 'epsilon': current,
+              'rounds': auction.rounds, 'phases': phases}
+    return auction, report
+
+
+def solve_model(model, epsilon=None, tolerance=0.0):
+    '''Solves the matching for a preference model by auction.
+
+    Returns: a boolean mask over the model's pairs, True for the pairs in the
+        matching
+    '''
+    auction, report = solve_auction(model, epsilon, tolerance)
+    return auction.held.copy()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Match students to courses by auction.')
+    parser.add_argument('requests', help='the WebTree CSV (or saved model)')
+    parser.add_argument('outfile', help='where to write the matching')
+    parser.add_argument('--epsilon', type=float, default=None,
+                        help='the smallest epsilon (default: small enough '
+                             'to be optimal)')
+    parser.add_argument('--tolerance', type=float, default=0.0,
+                        help='stop once the objective is certified to be '
+                             'within this of the optimum')
+    args = parser.parse_args()
+
+    model = read_model(args.requests)
+    print(model)
+    start = time.time()
+    auction, report = solve_auction(model, args.epsilon, args.tolerance)
+    print('auction took %.2fs, %d rounds in %d phases' % (
+        time.time() - start, report['rounds'], report['phases']))
+    print('objective %d, lower bound %.1f, gap %.1f (epsilon %g)' % (
+        report['objective'], report['bound'], report['absolute_gap'],
+        report['epsilon']))
+
+    save(model.assignments(auction.held), args.outfile,
+         semester=semester_name(args.requests),
+         provenance={'method': 'auction',
+                     'absolute_gap': report['absolute_gap']})
+
+
+if __name__ == '__main__':
+    main()
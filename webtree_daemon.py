@@ -0,0 +1,259 @@
+'''
+A resident WebTree server for one semester. Loading numpy, parsing the CSV
+and building the simulator happens once, at startup; after that the request
+data, the ceilings and the current assignment all stay in memory and are
+answered from dictionaries.
+
+It listens on a local Unix socket and speaks JSON lines: one request object
+per line in, one response object per line out. Every response has "ok", and
+either the answer or an "error".
+
+    {"op": "student", "id": 344}      the student's classes and requests
+    {"op": "seats", "crn": 24836}     ceiling, enrollment and seats left
+    {"op": "lottery", "seed": 7}      rerun the lottery, replacing the
+                                      current assignment
+    {"op": "load", "path": "x.wta"}   replace it with an assignment file
+    {"op": "scores"}                  evaluation scores of the current one
+    {"op": "status"}                  what's loaded
+
+    python webtree_daemon.py "WebTree Data/spring-2015.csv" --socket /tmp/webtree.sock
+    python webtree_daemon.py --socket /tmp/webtree.sock --query '{"op": "seats", "crn": 24836}'
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import socket
+import time
+
+import numpy as np
+
+import assignment_io
+import evaluation
+from webtree_data import CLASS_NAMES, load_requests
+from webtree_sim import LotterySimulator
+
+SOCKET_PATH = '/tmp/webtree.sock'
+
+
+class Semester:
+    """One semester's requests and its current assignment, kept ready to
+    answer queries.
+
+    Attributes:
+        filename - the WebTree CSV it was loaded from.
+        simulator - the webtree_sim.LotterySimulator for the requests.
+        index - the preference_index.PreferenceIndex for the requests.
+        class_years - a dictionary mapping student IDs to class years.
+        caps - a dictionary mapping CRNs to their ceilings.
+        assignment - a dictionary mapping student IDs to their CRNs.
+        enrolled - a dictionary mapping CRNs to how many students have them.
+        source - a dictionary describing where the assignment came from.
+    """
+    def __init__(self, filename):
+        """Loads the requests. There's no assignment until a lottery is run
+        or one is loaded.
+
+        Parameters:
+            filename - the WebTree CSV.
+        """
+        self.filename = filename
+        self.simulator = LotterySimulator(load_requests(filename))
+        self.index = self.simulator.index
+        store = self.simulator.store
+        self.class_years = dict(zip(
+            store.ids.tolist(),
+            [CLASS_NAMES[code] for code in store.class_codes.tolist()]))
+        self.caps = dict(zip(self.simulator.crns.tolist(),
+                             self.simulator.caps.tolist()))
+        self.assignment = {}
+        self.enrolled = dict((crn, 0) for crn in self.caps)
+        self.source = {}
+
+    def _set_assignment(self, assignment, source):
+        self.assignment = assignment
+        self.enrolled = dict((crn, 0) for crn in self.caps)
+        for crns in assignment.values():
+            for crn in crns:
+                self.enrolled[crn] = self.enrolled.get(crn, 0) + 1
+        self.source = source
+
+    def run_lottery(self, seed):
+        '''Runs the WebTree lottery with a seed and makes it the current
+            assignment.
+        '''
+        simulator = self.simulator
+        turns = simulator.random_turns(np.random.default_rng(seed))
+        assigned, counts, remaining = simulator.simulate(turns)
+        self._set_assignment(simulator.assignments(assigned, counts),
+                             {'method': 'baseline', 'seed': seed})
+
+    def load_assignment(self, path):
+        '''Makes an assignment file (either format) the current assignment.'''
+        # Anything but a name would be taken as a file descriptor by open()
+        if not isinstance(path, str):
+            raise ValueError('path must be a string, not %r' % (path,))
+        self._set_assignment(assignment_io.load(path), {'path': path})
+
+    def student(self, id):
+        if id not in self.class_years:
+            raise KeyError('no student %d' % id)
+        crns, ranks = self.index.preferences(id)
+        return {'id': id, 'class': self.class_years[id],
+                'assignment': self.assignment.get(id, []),
+                'requests': [[crn, rank] for crn, rank in
+                             zip(crns.tolist(), ranks.tolist())]}
+
+    def seats(self, crn):
+        if crn not in self.caps:
+            raise KeyError('no course %d' % crn)
+        enrolled = self.enrolled[crn]
+        return {'crn': crn, 'cap': self.caps[crn], 'enrolled': enrolled,
+                'seats_left': self.caps[crn] - enrolled}
+
+    def scores(self):
+        students, crns, num_students = evaluation.assignment_pairs(
+            self.assignment)
+        if num_students == 0:
+            raise ValueError('no assignment loaded')
+        scores = evaluation.score_pairs(students, crns, num_students,
+                                        self.index)
+        result = dict(zip(evaluation.SCORE_NAMES, scores))
+        result['happiness'] = self.index.happiness(students, crns)
+        return result
+
+    def status(self):
+        return {'requests': self.filename,
+                'students': len(self.class_years), 'courses': len(self.caps),
+                'assigned': sum(self.enrolled.values()),
+                'source': self.source}
+
+    def answer(self, request):
+        '''Answers one query.
+
+        Parameter:
+            request - the decoded JSON request
+
+        Returns: the response dictionary
+        '''
+        op = request.get('op')
+        try:
+            if op == 'student':
+                result = self.student(int(request['id']))
+            elif op == 'seats':
+                result = self.seats(int(request['crn']))
+            elif op == 'lottery':
+                start = time.time()
+                self.run_lottery(int(request.get('seed', 0)))
+                result = {'seconds': time.time() - start}
+            elif op == 'load':
+                self.load_assignment(request['path'])
+                result = self.status()
+            elif op == 'scores':
+                result = self.scores()
+            elif op == 'status':
+                result = self.status()
+            else:
+                raise ValueError('unknown op %r' % op)
+        except KeyError as e:
+            # str() of a KeyError quotes its key
+            return {'ok': False, 'error': str(e.args[0] if e.args else e)}
+        except (ValueError, TypeError, IOError) as e:
+            return {'ok': False, 'error': str(e)}
+        result['ok'] = True
+        return result
+
+
+async def _serve_client(semester, reader, writer):
+    '''Answers one connection's requests, a line at a time, until it
+        closes.
+    '''
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+            except ValueError:
+                request = None
+            if isinstance(request, dict):
+                response = semester.answer(request)
+            else:
+                response = {'ok': False, 'error': 'not a JSON object'}
+            writer.write(json.dumps(response).encode('utf-8') + b'\n')
+            await writer.drain()
+    finally:
+        writer.close()
+
+
+async def serve(semester, path=SOCKET_PATH):
+    '''Serves a semester on a Unix socket until it gets a SIGTERM.'''
+    if os.path.exists(path):
+        os.remove(path)
+    server = await asyncio.start_unix_server(
+        lambda reader, writer: _serve_client(semester, reader, writer), path)
+    # Shut down cleanly (and remove the socket) when asked to
+    stop = asyncio.Event()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, stop.set)
+    try:
+        async with server:
+            await stop.wait()
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def query(request, path=SOCKET_PATH):
+    '''Sends one request to a running server and returns its response.'''
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(path)
+        client.sendall(json.dumps(request).encode('utf-8') + b'\n')
+        with client.makefile('rb') as f:
+            return json.loads(f.readline())
+    finally:
+        client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Serve one semester of WebTree over a Unix socket.')
+    parser.add_argument('requests', nargs='?', help='the WebTree CSV')
+    parser.add_argument('--socket', default=SOCKET_PATH)
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for the starting lottery')
+    parser.add_argument('--assignments', default=None,
+                        help='start from this assignment file instead of a '
+                             'lottery')
+    parser.add_argument('--query', default=None, metavar='JSON',
+                        help="don't serve; send this request to a running "
+                             "server and print the response")
+    args = parser.parse_args()
+
+    if args.query is not None:
+        print(json.dumps(query(json.loads(args.query), args.socket)))
+        return
+    if args.requests is None:
+        parser.error('the WebTree CSV is needed to serve')
+
+    semester = Semester(args.requests)
+    if args.assignments:
+        semester.load_assignment(args.assignments)
+    else:
+        semester.run_lottery(args.seed)
+    print('serving %s on %s' % (args.requests, args.socket))
+    try:
+        asyncio.run(serve(semester, args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
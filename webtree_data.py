@@ -0,0 +1,151 @@
+'''
+Shared loader for the WebTree request CSVs. Parses the FIELDS layout once into
+typed numpy columns and keeps a binary sidecar cache next to the CSV, so that
+repeat runs on the same semester skip the CSV parse entirely.
+
+Author: Alden Hart
+'''
+
+import csv
+import os
+
+import numpy as np
+
+FIELDS = ['ID','CLASS','CRN','TREE','BRANCH','COURSE_CEILING',
+          'MAJOR','MAJOR2','SUBJ','NUMB','SEQ']
+
+# Class years are coded so that sorting descending puts seniors first, the
+# same numbering replace_with_numbers() has always used.
+CLASS_CODES = {'SENI': 4, 'JUNI': 3, 'SOPH': 2, 'FRST': 1, 'OTHER': 0}
+CLASS_NAMES = ['OTHER', 'FRST', 'SOPH', 'JUNI', 'SENI']
+
+COLUMN_TYPES = [('ID', np.int32),
+                ('CLASS', np.int8),
+                ('CRN', np.int32),
+                ('TREE', np.int8),
+                ('BRANCH', np.int8),
+                ('COURSE_CEILING', np.int32),
+                ('SUBJ', 'S8'),
+                ('NUMB', 'S8')]
+
+CACHE_SUFFIX = '.npz'
+CACHE_VERSION = 3
+
+
+def cache_filename(filename):
+    '''Returns the name of the binary sidecar cache for a WebTree CSV.'''
+    return filename + CACHE_SUFFIX
+
+
+def parse_csv(filename):
+    '''Parses a WebTree CSV into typed numpy columns.
+
+    Parameter:
+        filename - the name of the CSV file
+
+    Returns: a dictionary mapping each column name in COLUMN_TYPES to a numpy
+        array. CLASS holds the codes from CLASS_CODES; unknown class years
+        are coded as OTHER. SUBJ and NUMB are kept as byte strings (catalog
+        numbers aren't always numbers).
+    '''
+    columns = dict((name, []) for name, _ in COLUMN_TYPES)
+    ids = columns['ID']
+    classes = columns['CLASS']
+    crns = columns['CRN']
+    trees = columns['TREE']
+    branches = columns['BRANCH']
+    ceilings = columns['COURSE_CEILING']
+    subjects = columns['SUBJ']
+    numbers = columns['NUMB']
+    other = CLASS_CODES['OTHER']
+
+    with open(filename, 'r') as csvfile:
+        reader = csv.reader(csvfile)
+        next(reader)    # get rid of the header line
+
+        for row in reader:
+            if not row:
+                continue
+            ids.append(int(row[0]))
+            classes.append(CLASS_CODES.get(row[1], other))
+            crns.append(int(row[2]))
+            trees.append(int(row[3]))
+            branches.append(int(row[4]))
+            ceilings.append(int(row[5]))
+            subjects.append(row[8].strip())
+            numbers.append(row[9].strip())
+
+    data = {}
+    for name, dtype in COLUMN_TYPES:
+        data[name] = np.array(columns[name], dtype=dtype)
+    return data
+
+
+def _file_stamp(filename):
+    '''Returns the (size, mtime) pair used to validate a cache.'''
+    stat = os.stat(filename)
+    mtime = getattr(stat, 'st_mtime_ns', int(stat.st_mtime * 1e9))
+    return np.array([stat.st_size, mtime], dtype=np.int64)
+
+
+def _read_cache(filename, stamp):
+    '''Returns the cached columns for filename, or None if the cache is
+        missing, stale or unreadable.
+    '''
+    try:
+        with np.load(cache_filename(filename)) as cache:
+            if int(cache['version']) != CACHE_VERSION:
+                return None
+            if not np.array_equal(cache['stamp'], stamp):
+                return None
+            return dict((name, cache[name]) for name, _ in COLUMN_TYPES)
+    except (IOError, OSError, KeyError, ValueError):
+        return None
+
+
+def _write_cache(filename, stamp, data):
+    '''Writes the sidecar cache. Written to a temporary name first and then
+        renamed, so a concurrent reader never sees half a file.
+    '''
+    target = cache_filename(filename)
+    tmp = '%s.%d.tmp' % (target, os.getpid())
+    try:
+        with open(tmp, 'wb') as f:
+            np.savez(f, version=CACHE_VERSION, stamp=stamp, **data)
+        os.rename(tmp, target)
+    except (IOError, OSError):
+        # A read-only data directory just means no cache
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def load_requests(filename, use_cache=True):
+    '''Returns the typed request columns for a WebTree CSV.
+
+    The sidecar cache (filename + '.npz') is used when its recorded file size
+    and modification time match the CSV; otherwise the CSV is parsed and the
+    cache rewritten.
+
+    Parameters:
+        filename - the name of the CSV file
+        use_cache - whether to read and write the sidecar cache
+
+    Returns: a dictionary of numpy arrays, one per row of the CSV:
+        'ID' (int32), 'CLASS' (int8, see CLASS_CODES), 'CRN' (int32),
+        'TREE' (int8), 'BRANCH' (int8), 'COURSE_CEILING' (int32),
+        'SUBJ' and 'NUMB' (byte strings)
+    '''
+    if not use_cache:
+        return parse_csv(filename)
+
+    stamp = _file_stamp(filename)
+    data = _read_cache(filename, stamp)
+    if data is None:
+        data = parse_csv(filename)
+        _write_cache(filename, stamp, data)
+    return data
+
+
+def class_names(codes):
+    '''Turns an array of class codes back into their string names.'''
+    return [CLASS_NAMES[c] for c in codes.tolist()]
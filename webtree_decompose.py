@@ -0,0 +1,269 @@
+'''
+Splits the WebTree matching into independent blocks and solves them in
+parallel. Students and courses form a bipartite request graph, and two
+students only compete with each other through a course that runs out of
+seats, so:
+
+    - A course with no more requests than seats (demand <= COURSE_CEILING)
+      never binds. Cutting it out of the graph loses nothing: every block
+      that uses it gets its whole ceiling, and they can't overfill it
+      between them.
+    - What's left splits into connected components (scipy.sparse.csgraph),
+      which are exactly independent subproblems.
+    - Optionally, the busiest binding courses (hubs, the ones requested by
+      the most students) can be cut too. Their seats are then shared out
+      between the blocks in proportion to each block's requests for them.
+      That is only a heuristic: the merged matching is always feasible, but
+      may cost more than the optimum. If cutting them doesn't shrink the
+      largest block to HUB_SHRINK of its size, they are left in and the
+      split stays exact; on a well connected semester it usually does not.
+
+Blocks are packed into one subproblem per worker, biggest first, and solved
+in a process pool with the ILP, flow or auction solver; the workers'
+selections are merged back into one selection over the whole model.
+
+    python webtree_decompose.py "WebTree Data/spring-2015.csv" out.wta --method ilp --hubs 20
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
+
+import webtree_auction
+import webtree_flow
+import webtree_ilp
+from assignment_io import save, semester_name
+from webtree_model import read_model
+
+SOLVERS = {
+    'ilp': webtree_ilp.solve_model,
+    'flow': webtree_flow.solve_model,
+    'auction': webtree_auction.solve_model,
+}
+
+# Hubs are only cut if that leaves the largest block at most this fraction
+# of its size without cutting them
+HUB_SHRINK = 0.9
+
+
+def course_demand(model):
+    '''Returns the number of students who requested each course, which is
+        its degree in the request graph (a student requests a CRN once).
+    '''
+    return np.bincount(model.pair_course, minlength=model.num_courses)
+
+
+def largest_block(model, student_block):
+    '''Returns the number of pairs in the biggest block.'''
+    return int(np.bincount(student_block[model.pair_student],
+                           minlength=student_block.max() + 1).max())
+
+
+def cut_courses(model, hubs=0):
+    '''Picks the courses to cut out of the request graph: every course that
+        can't fill up, plus the given number of the binding courses joining
+        the most students. The hubs are dropped again if cutting them
+        doesn't shrink the largest block to HUB_SHRINK of its size.
+
+    Returns: a 2-tuple of boolean masks over the courses (cut, exact): the
+        courses to cut, and which of those can be cut without changing the
+        optimum
+    '''
+    demand = course_demand(model)
+    exact = demand <= model.caps
+    cut = exact.copy()
+    binding = np.flatnonzero(~exact)
+    busiest = binding[np.argsort(-demand[binding], kind='stable')[:hubs]]
+    if not len(busiest):
+        return cut, exact
+    cut[busiest] = True
+    # Cut hubs cost seats; they have to buy a real split
+    if (largest_block(model, find_blocks(model, cut)) >
+            HUB_SHRINK * largest_block(model, find_blocks(model, exact))):
+        return exact.copy(), exact
+    return cut, exact
+
+
+def find_blocks(model, cut):
+    '''Finds the independent blocks of students.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        cut - a boolean mask over the courses to leave out of the graph
+
+    Returns: an array giving each student's block number, numbered from 0
+    '''
+    num_students = model.num_students
+    keep = ~cut[model.pair_course]
+    size = num_students + model.num_courses
+    graph = sparse.csr_matrix(
+        (np.ones(int(keep.sum()), dtype=np.int8),
+         (model.pair_student[keep], num_students + model.pair_course[keep])),
+        shape=(size, size))
+    _, labels = connected_components(graph, directed=False)
+
+    # Renumber so that only blocks with students count
+    _, student_block = np.unique(labels[:num_students], return_inverse=True)
+    return student_block
+
+
+def pack_blocks(model, student_block, bins):
+    '''Packs blocks into at most the given number of bins, each block into the
+        bin with the fewest pairs so far, biggest blocks first.
+
+    Returns: an array giving each student's bin
+    '''
+    if model.num_students == 0:
+        return np.zeros(0, dtype=np.int32)
+    block_pairs = np.bincount(student_block[model.pair_student],
+                              minlength=student_block.max() + 1)
+    loads = [0] * bins
+    block_bin = np.empty(len(block_pairs), dtype=np.int32)
+    for block in np.argsort(-block_pairs, kind='stable').tolist():
+        lightest = loads.index(min(loads))
+        block_bin[block] = lightest
+        loads[lightest] += int(block_pairs[block])
+    return block_bin[student_block]
+
+
+def share_caps(model, student_bin, exact):
+    '''Works out each bin's ceilings. A course used by one bin, or one that
+        can't fill up, keeps its ceiling everywhere; the seats of a cut hub
+        are split between the bins using it in proportion to their
+        requests, largest remainders first.
+
+    Returns: a (bins x courses) array of ceilings
+    '''
+    bins = int(student_bin.max()) + 1
+    requests = np.zeros((bins, model.num_courses), dtype=np.int64)
+    np.add.at(requests, (student_bin[model.pair_student], model.pair_course),
+              1)
+    caps = np.tile(model.caps.astype(np.int64), (bins, 1))
+
+    users = (requests > 0).sum(axis=0)
+    for c in np.flatnonzero((users > 1) & ~exact).tolist():
+        want = requests[:, c]
+        share = model.caps[c] * want / float(want.sum())
+        seats = np.floor(share).astype(np.int64)
+        left = int(model.caps[c] - seats.sum())
+        seats[np.argsort(seats - share, kind='stable')[:left]] += 1
+        caps[:, c] = seats
+    return caps
+
+
+def split_model(model, hubs=0, bins=1):
+    '''Splits a model into independent subproblems.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        hubs - how many binding courses to cut as well
+        bins - how many subproblems to pack the blocks into
+
+    Returns: a 3-tuple (parts, num_blocks, hubs_cut): a list of
+        (submodel, pairs) pairs as from PreferenceModel.submodel, the number
+        of blocks found, and the number of hubs actually cut
+    '''
+    if model.num_students == 0:
+        return [], 0, 0
+    cut, exact = cut_courses(model, hubs)
+    student_block = find_blocks(model, cut)
+    num_blocks = int(student_block.max()) + 1
+    student_bin = pack_blocks(model, student_block, min(bins, num_blocks))
+    caps = share_caps(model, student_bin, exact)
+
+    parts = []
+    for b in range(int(student_bin.max()) + 1):
+        students = np.flatnonzero(student_bin == b)
+        in_bin = student_bin[model.pair_student] == b
+        courses = np.unique(model.pair_course[in_bin])
+        parts.append(model.submodel(students, courses, caps[b, courses]))
+    return parts, num_blocks, int(np.sum(cut & ~exact))
+
+
+def _solve_part(args):
+    '''Solves one subproblem in a worker.'''
+    part, method = args
+    start = time.time()
+    return SOLVERS[method](part), time.time() - start
+
+
+def solve_model(model, method='ilp', hubs=0, processes=None):
+    '''Solves a model block by block.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        method - one of SOLVERS
+        hubs - how many binding courses to cut; with 0 (or when cutting them
+            wouldn't split the graph) the result is optimal
+        processes - the number of worker processes (default: one per core)
+
+    Returns: a 2-tuple (selected, report): a boolean mask over the model's
+        pairs, True for the pairs in the matching, and a dictionary of the
+        block sizes, hubs cut and solve times
+    '''
+    workers = processes or multiprocessing.cpu_count()
+    parts, num_blocks, hubs_cut = split_model(model, hubs, workers)
+    tasks = [(part, method) for part, pairs in parts]
+    if len(tasks) <= 1:
+        results = [_solve_part(task) for task in tasks]
+    else:
+        pool = multiprocessing.Pool(min(workers, len(tasks)))
+        try:
+            results = pool.map(_solve_part, tasks)
+        finally:
+            pool.close()
+            pool.join()
+
+    selected = np.zeros(model.num_pairs, dtype=bool)
+    for (part, pairs), (chosen, seconds) in zip(parts, results):
+        selected[pairs[chosen]] = True
+    report = {'blocks': num_blocks,
+              'hubs': hubs_cut,
+              'part_pairs': [part.num_pairs for part, pairs in parts],
+              'part_seconds': [seconds for chosen, seconds in results]}
+    return selected, report
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Solve the WebTree matching block by block.')
+    parser.add_argument('requests', help='the WebTree CSV (or saved model)')
+    parser.add_argument('outfile', help='where to write the matching')
+    parser.add_argument('--method', choices=sorted(SOLVERS), default='ilp')
+    parser.add_argument('--hubs', type=int, default=0,
+                        help='also cut this many of the busiest binding '
+                             'courses (no longer exact)')
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    model = read_model(args.requests)
+    print(model)
+    start = time.time()
+    selected, report = solve_model(model, args.method, args.hubs,
+                                   args.processes)
+    if args.hubs and not report['hubs']:
+        print('cutting %d hubs would not shrink the largest block; '
+              'solved exactly' % args.hubs)
+    print('%d blocks in %d subproblems, largest %d of %d pairs' % (
+        report['blocks'], len(report['part_pairs']),
+        max(report['part_pairs'] or [0]), model.num_pairs))
+    print('slowest subproblem %.2fs, %.2fs in all, objective %d' % (
+        max(report['part_seconds'] or [0.0]), time.time() - start,
+        model.objective(selected)))
+
+    save(model.assignments(selected), args.outfile,
+         semester=semester_name(args.requests),
+         provenance={'method': args.method, 'blocks': report['blocks'],
+                     'hubs': report['hubs']})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,414 @@
+'''
+Solves the WebTree matching as a min-cost flow. The assignment problem in
+WebTree_LP_v2.m is a transportation problem: every student supplies four seats,
+every CRN can take COURSE_CEILING of them, and a seat costs the rank the
+student gave the course. Network flow solutions are integral, so there's no
+branch-and-bound; the answer is optimal for the same objective as the ILP.
+
+The network:
+
+    source --(slots, 0)--> student --(1, rank)--> course --(cap, 0)--> sink
+                           student --(slots, BIG_NUMBER)--------------> sink
+
+The last arc carries the seats a student can't get, so the full supply can
+always reach the sink.
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import heapq
+import sys
+
+import numpy as np
+
+from webtree_model import build_model, read_model, BIG_NUMBER
+from assignment_io import semester_name
+from baseline_webtree import write_out
+
+OUTFILE = 'class_matching_spring-2015.wta'
+
+INFINITY = float('inf')
+
+
+class FlowNetwork:
+    """A residual network for min-cost flow, solved by successive shortest
+    paths with node potentials (the primal-dual method): each Dijkstra pass
+    is followed by a blocking flow over every shortest path it found.
+
+    Edges are stored in parallel lists; edge e and e ^ 1 are an edge and its
+    reverse, so the flow on edge e is the residual capacity of e ^ 1.
+
+    Attributes:
+        to - the head node of each edge.
+        cap - the residual capacity of each edge.
+        cost - the cost per unit of each edge.
+        adjacent - for each node, the list of edges leaving it.
+        excess - for each node, the supply still to be sent (negative for
+                 demand still to be met).
+        potential - the node potentials; every edge with residual capacity
+                    has a non-negative reduced cost under them.
+    """
+    def __init__(self, num_nodes):
+        """Constructs an empty network.
+
+        Parameters:
+            num_nodes - the number of nodes (an integer).
+        """
+        self.to = []
+        self.cap = []
+        self.cost = []
+        self.adjacent = [[] for i in range(num_nodes)]
+        self.excess = [0] * num_nodes
+        self.potential = [0] * num_nodes
+
+    def add_edge(self, u, v, cap, cost):
+        """Adds an edge from u to v and returns its index.
+
+        Parameters:
+            u, v - the tail and head nodes.
+            cap - the capacity of the edge.
+            cost - the cost per unit of flow. Must not make the reduced cost
+                   under the current potentials negative.
+
+        Returns:
+            The index of the new edge.
+        """
+        e = len(self.to)
+        self.to.extend([v, u])
+        self.cap.extend([cap, 0])
+        self.cost.extend([cost, -cost])
+        self.adjacent[u].append(e)
+        self.adjacent[v].append(e + 1)
+        return e
+
+    def add_node(self, potential=0):
+        """Adds a node with no edges and returns its index.
+
+        Parameters:
+            potential - the node's starting potential.
+
+        Returns:
+            The index of the new node.
+        """
+        self.adjacent.append([])
+        self.excess.append(0)
+        self.potential.append(potential)
+        return len(self.excess) - 1
+
+    def add_supply(self, node, amount):
+        """Adds supply (or demand, if negative) at a node.
+
+        Returns:
+            None.
+        """
+        self.excess[node] += amount
+
+    def flow(self, e):
+        """Returns the flow currently on edge e."""
+        return self.cap[e ^ 1]
+
+    def push(self, e, amount):
+        """Sends amount units along edge e, moving the excess with them.
+
+        Returns:
+            None.
+        """
+        self.cap[e] -= amount
+        self.cap[e ^ 1] += amount
+        self.excess[self.to[e ^ 1]] -= amount
+        self.excess[self.to[e]] += amount
+
+    def reduced_cost(self, e):
+        """Returns the cost of edge e under the current potentials."""
+        return (self.cost[e] + self.potential[self.to[e ^ 1]] -
+                self.potential[self.to[e]])
+
+    def update_edge(self, e, cap, cost):
+        """Changes the capacity and cost of edge e, keeping what's already
+        been solved. Flow over the new capacity is sent back, and if the
+        edge then has a negative reduced cost in either direction it is
+        saturated in that direction. That leaves every residual edge with a
+        non-negative reduced cost, and some excess for solve() to clear up.
+
+        Parameters:
+            e - the edge (not a reverse edge).
+            cap - the new capacity.
+            cost - the new cost per unit of flow.
+
+        Returns:
+            None.
+        """
+        flow = self.cap[e ^ 1]
+        if flow > cap:
+            self.push(e ^ 1, flow - cap)
+            flow = cap
+        self.cap[e] = cap - flow
+        self.cost[e] = cost
+        self.cost[e ^ 1] = -cost
+
+        reduced = self.reduced_cost(e)
+        if reduced < 0 and self.cap[e] > 0:
+            self.push(e, self.cap[e])
+        elif reduced > 0 and self.cap[e ^ 1] > 0:
+            self.push(e ^ 1, self.cap[e ^ 1])
+
+    def solve(self):
+        """Sends every unit of supply to a demand at minimum total cost.
+
+        Works from any flow under which every residual edge has a
+        non-negative reduced cost: an empty network, or a solved one that's
+        been changed with update_edge.
+
+        Raises a RuntimeError if some supply can't reach any demand.
+
+        Returns:
+            None.
+        """
+        while any(x > 0 for x in self.excess):
+            backward = self._search_backward()
+            distance = self._shortest_distance(backward)
+            if distance is None:
+                raise RuntimeError('Not all supply can be routed')
+            self._blocking_flows(backward)
+
+    def _search_backward(self):
+        """Decides which way to search for shortest paths: from the nodes
+        with demand back to the excess when they have fewer edges to scan.
+        After a small change, the excess often sits on the source or sink,
+        which is adjacent to everything, while the demand is on a few nodes.
+
+        Returns:
+            True to search from the demand, False to search from the excess.
+        """
+        supply_edges = demand_edges = 0
+        for v, x in enumerate(self.excess):
+            if x > 0:
+                supply_edges += len(self.adjacent[v])
+            elif x < 0:
+                demand_edges += len(self.adjacent[v])
+        return demand_edges < supply_edges
+
+    def _shortest_distance(self, backward=False):
+        """Runs Dijkstra on reduced costs from every node with excess, up to
+        the nearest node with demand (or, backward, from every node with
+        demand against the edges up to the nearest excess), and shifts the
+        potentials so that every shortest path between them is made of zero
+        reduced cost edges.
+
+        Parameters:
+            backward - whether to search from the demand.
+
+        Returns:
+            The distance to the nearest demand, or None if none is reachable.
+        """
+        to, cap, cost = self.to, self.cap, self.cost
+        potential = self.potential
+        excess = self.excess
+        sign = -1 if backward else 1
+        distance = [INFINITY] * len(excess)
+        heap = []
+        for v in range(len(excess)):
+            if sign * excess[v] > 0:
+                distance[v] = 0
+                heap.append((0, v))
+        heapq.heapify(heap)
+
+        nearest = None
+        while heap:
+            d, u = heapq.heappop(heap)
+            if d > distance[u]:
+                continue
+            if sign * excess[u] < 0:
+                nearest = d
+                break
+            pu = potential[u]
+            for e in self.adjacent[u]:
+                if backward:
+                    # The edge into u that e is the reverse of
+                    e ^= 1
+                    if cap[e] > 0:
+                        v = to[e ^ 1]
+                        nd = d + cost[e] + potential[v] - pu
+                        if nd < distance[v]:
+                            distance[v] = nd
+                            heapq.heappush(heap, (nd, v))
+                elif cap[e] > 0:
+                    v = to[e]
+                    nd = d + cost[e] + pu - potential[v]
+                    if nd < distance[v]:
+                        distance[v] = nd
+                        heapq.heappush(heap, (nd, v))
+
+        if nearest is None:
+            return None
+
+        for v in range(len(potential)):
+            potential[v] += sign * min(distance[v], nearest)
+        return nearest
+
+    def _admissible(self, u, e):
+        """True iff edge e out of u has capacity and zero reduced cost."""
+        return (self.cap[e] > 0 and self.cost[e] + self.potential[u] ==
+                self.potential[self.to[e]])
+
+    def _blocking_flows(self, backward=False):
+        """Pushes as much flow as possible from excess to demand along zero
+        reduced cost edges, Dinic style: levels by BFS, then a blocking flow
+        along edges that go up exactly one level. Backward, the levels count
+        from the demand instead and the flow goes down them.
+
+        Parameters:
+            backward - whether to level from the demand.
+
+        Returns:
+            None.
+        """
+        to, cap = self.to, self.cap
+        excess = self.excess
+        adjacent = self.adjacent
+        n = len(excess)
+        sign = -1 if backward else 1
+        step = -1 if backward else 1
+
+        while True:
+            # Level graph over the admissible edges, only as deep as the
+            # nearest target: nothing past it can be on a shortest path
+            level = [-1] * n
+            queue = [v for v in range(n) if sign * excess[v] > 0]
+            for v in queue:
+                level[v] = 0
+            reached = None
+            i = 0
+            while i < len(queue):
+                u = queue[i]
+                i += 1
+                if sign * excess[u] < 0 and reached is None:
+                    reached = level[u]
+                if reached is not None and level[u] >= reached:
+                    if level[u] > reached:
+                        break
+                    continue
+                for e in adjacent[u]:
+                    v = to[e]
+                    if level[v] < 0 and (self._admissible(v, e ^ 1)
+                                         if backward
+                                         else self._admissible(u, e)):
+                        level[v] = level[u] + 1
+                        queue.append(v)
+            if reached is None:
+                return
+
+            # Blocking flow, with a current-edge pointer per node
+            current = [0] * n
+            for source in range(n):
+                while excess[source] > 0 and level[source] >= 0:
+                    path = []
+                    u = source
+                    while excess[u] >= 0 or u == source:
+                        edges = adjacent[u]
+                        while current[u] < len(edges):
+                            e = edges[current[u]]
+                            v = to[e]
+                            if (level[v] >= 0 and
+                                    level[v] == level[u] + step and
+                                    self._admissible(u, e)):
+                                break
+                            current[u] += 1
+                        if current[u] < len(edges):
+                            path.append(e)
+                            u = to[e]
+                        else:
+                            # Dead end: retreat and never come back here
+                            level[u] = -1
+                            if not path:
+                                break
+                            e = path.pop()
+                            u = to[e ^ 1]
+                            current[u] += 1
+                    if not path:
+                        break
+                    amount = min(excess[source], -excess[u])
+                    for e in path:
+                        amount = min(amount, cap[e])
+                    for e in path:
+                        self.push(e, amount)
+
+
+def build_network(model):
+    '''Builds the flow network for a preference model.
+
+    Parameter:
+        model - a webtree_model.PreferenceModel
+
+    Returns: a 2-tuple (network, pair_edges), where pair_edges holds the
+        index of the edge for each of the model's pairs
+    '''
+    num_students = model.num_students
+    source = 0
+    sink = 1
+    first_student = 2
+    first_course = first_student + num_students
+    network = FlowNetwork(first_course + model.num_courses)
+
+    for s, slots in enumerate(model.slots.tolist()):
+        network.add_edge(source, first_student + s, slots, 0)
+        network.add_edge(first_student + s, sink, slots, BIG_NUMBER)
+    for c, cap in enumerate(model.caps.tolist()):
+        network.add_edge(first_course + c, sink, cap, 0)
+
+    pair_edges = []
+    for s, c, rank in zip(model.pair_student.tolist(),
+                          model.pair_course.tolist(),
+                          model.pair_rank.tolist()):
+        pair_edges.append(network.add_edge(first_student + s,
+                                           first_course + c, 1, rank))
+
+    total = int(model.slots.sum())
+    network.add_supply(source, total)
+    network.add_supply(sink, -total)
+    return network, pair_edges
+
+
+def solve_model(model):
+    '''Solves the matching for a preference model as a min-cost flow.
+
+    Parameter:
+        model - a webtree_model.PreferenceModel
+
+    Returns: a boolean mask over the model's pairs, True for the pairs in the
+        matching
+    '''
+    network, pair_edges = build_network(model)
+    network.solve()
+    return np.array([network.flow(e) > 0 for e in pair_edges], dtype=bool)
+
+
+def solve(data):
+    '''Solves the WebTree matching for the given requests as a min-cost flow.
+
+    Parameter:
+        data - the request columns as returned by webtree_data.load_requests()
+
+    Returns: a dictionary with keys of student IDs and values of the list of
+        CRNs that student was assigned
+    '''
+    model = build_model(data)
+    return model.assignments(solve_model(model))
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print('Usage: python webtree_flow.py <WebTree csv or model> '
+              '[matching outfile]')
+        return
+
+    outfile = sys.argv[2] if len(sys.argv) == 3 else OUTFILE
+    model = read_model(sys.argv[1])
+    write_out(model.assignments(solve_model(model)), outfile,
+              semester_name(sys.argv[1]), {'method': 'flow'})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+'''
+Collapses students with identical requests into weighted groups before
+solving. Two students of the same class year who asked for the same courses
+at the same ranks are interchangeable to the solver, so the program only
+needs one copy of them with a multiplicity: a group's variable for a course
+counts how many of its members get that course (from 0 up to the
+multiplicity), and its slots are the members' slots added up. The program
+is still a transportation problem, so the counts come out integral.
+
+Afterwards the counts are dealt back out to the members in lottery order:
+the group's courses go best rank first, each to the next members in turn,
+cycling through the members from wherever the last course stopped. Nobody
+gets the same course twice (a count is never more than the multiplicity)
+and nobody gets more than their slots. The cost is the same however the
+counts are dealt, so the matching is as optimal as the full program's.
+
+    python webtree_groups.py "WebTree Data/spring-2015.csv" out.wta --seed 3
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+from scipy.optimize import milp
+
+import webtree_ilp
+from assignment_io import save, semester_name
+from webtree_model import read_model
+
+
+def student_groups(model):
+    '''Groups students with identical requests: the same class year, the
+        same number of slots, and the same courses at the same ranks.
+
+    Returns: a 2-tuple of arrays (group, first): each student's group
+        number, and the first student of each group
+    '''
+    starts = np.searchsorted(model.pair_student,
+                             np.arange(model.num_students + 1))
+    courses = model.pair_course.astype(np.int32)
+    ranks = model.pair_rank.astype(np.int16)
+    seen = {}
+    group = np.empty(model.num_students, dtype=np.int64)
+    first = []
+    for s, (a, b) in enumerate(zip(starts[:-1].tolist(),
+                                   starts[1:].tolist())):
+        key = (int(model.class_codes[s]), int(model.slots[s]),
+               courses[a:b].tobytes(), ranks[a:b].tobytes())
+        if key not in seen:
+            seen[key] = len(first)
+            first.append(s)
+        group[s] = seen[key]
+    return group, np.array(first, dtype=np.int64)
+
+
+def group_model(model, group, first):
+    '''Builds the model of the groups: each group's first student stands in
+        for all of them, with their slots added up.
+
+    Returns: a 3-tuple (grouped, pairs, multiplicity): the grouped
+        PreferenceModel, the index in model of each of its pairs, and each
+        group's number of members
+    '''
+    multiplicity = np.bincount(group, minlength=len(first))
+    grouped, pairs = model.submodel(first, np.arange(model.num_courses))
+    grouped.slots = (grouped.slots * multiplicity).astype(np.int32)
+    return grouped, pairs, multiplicity
+
+
+def solve_counts(grouped, multiplicity, time_limit=None):
+    '''Solves the program of the groups.
+
+    Returns: an array with the number of members of the group to get each
+        pair's course
+    '''
+    costs, integrality, bounds, constraints = webtree_ilp.build_program(
+        grouped, multiplicity[grouped.pair_student])
+    options = {}
+    if time_limit is not None:
+        options['time_limit'] = time_limit
+    result = milp(costs, integrality=integrality, bounds=bounds,
+                  constraints=constraints, options=options)
+    if result.x is None:
+        raise RuntimeError('No feasible matching found: ' + result.message)
+    return np.round(result.x[:grouped.num_pairs]).astype(np.int64)
+
+
+def deal(model, group, first, counts, pairs, lottery):
+    '''Deals each group's counts out to its members.
+
+    Parameters:
+        model - the full webtree_model.PreferenceModel
+        group, first - as from student_groups()
+        counts - the count for each pair of the grouped model
+        pairs - the index in model of each pair of the grouped model (that
+            is, of the first member's pairs)
+        lottery - each student's lottery number; lower numbers are dealt to
+            first
+
+    Returns: a boolean mask over model's pairs, True for the pairs in the
+        matching
+    '''
+    starts = np.searchsorted(model.pair_student,
+                             np.arange(model.num_students + 1))
+    # Each grouped pair as an offset into its student's pairs
+    offsets = pairs - starts[model.pair_student[pairs]]
+    grouped_student = np.searchsorted(first, model.pair_student[pairs])
+
+    members = [[] for g in range(len(first))]
+    for s in np.argsort(lottery, kind='stable').tolist():
+        members[group[s]].append(s)
+
+    selected = np.zeros(model.num_pairs, dtype=bool)
+    turn = np.zeros(len(first), dtype=np.int64)
+    # Grouped pairs are sorted by group, then rank, so each group's courses
+    # come best first
+    for g, offset, count in zip(grouped_student.tolist(), offsets.tolist(),
+                                counts.tolist()):
+        size = len(members[g])
+        for k in range(count):
+            member = members[g][(turn[g] + k) % size]
+            selected[starts[member] + offset] = True
+        turn[g] += count
+    return selected
+
+
+def solve_model(model, seed=None, time_limit=None):
+    '''Solves the matching for a preference model with identical students
+        grouped together.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        seed - optional seed for the lottery numbers the counts are dealt by
+        time_limit - optional limit on solver time, in seconds
+
+    Returns: a boolean mask over the model's pairs, True for the pairs in the
+        matching
+    '''
+    group, first = student_groups(model)
+    grouped, pairs, multiplicity = group_model(model, group, first)
+    counts = solve_counts(grouped, multiplicity, time_limit)
+    lottery = np.random.default_rng(seed).permutation(model.num_students)
+    return deal(model, group, first, counts, pairs, lottery)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Solve the WebTree matching with identical students '
+                    'grouped together.')
+    parser.add_argument('requests', help='the WebTree CSV (or saved model)')
+    parser.add_argument('outfile', help='where to write the matching')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the lottery order within groups')
+    args = parser.parse_args()
+
+    model = read_model(args.requests)
+    print(model)
+    start = time.time()
+    group, first = student_groups(model)
+    grouped, pairs, multiplicity = group_model(model, group, first)
+    print('%d groups, largest %d students; %d pairs instead of %d' % (
+        len(first), multiplicity.max(), grouped.num_pairs, model.num_pairs))
+    counts = solve_counts(grouped, multiplicity)
+    lottery = np.random.default_rng(args.seed).permutation(model.num_students)
+    selected = deal(model, group, first, counts, pairs, lottery)
+    print('took %.2fs, objective %d' % (time.time() - start,
+                                        model.objective(selected)))
+
+    provenance = {'method': 'grouped'}
+    if args.seed is not None:
+        provenance['seed'] = args.seed
+    save(model.assignments(selected), args.outfile,
+         semester=semester_name(args.requests), provenance=provenance)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+'''
+Solves the WebTree binary integer program in-process, replacing the round trip
+through webtree_preprocessing_v2.py, WebTree_LP_v2.m and create_matching.py.
+The program is the one WebTree_LP_v2.m solves (four courses per student,
+course ceilings, preference cost), but it only has variables for the pairs
+students requested (see webtree_model.py), the constraint matrices are sparse,
+and the solve is done by HiGHS through scipy.optimize.milp.
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import sys
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import milp, LinearConstraint, Bounds
+
+from webtree_model import build_model, read_model, BIG_NUMBER
+from assignment_io import semester_name
+from baseline_webtree import write_out
+
+OUTFILE = 'class_matching_spring-2015.wta'
+
+
+def build_program(model, pair_upper=None):
+    '''Builds the integer program for a preference model.
+
+    There is one binary variable per requested pair, followed by one integer
+    "unassigned slots" variable per student, so every student's slots are
+    always filled and the program is always feasible.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        pair_upper - optional upper bounds for the pair variables, for
+            pairs that stand for more than one student (default: 1)
+
+    Returns: a 4-tuple (costs, integrality, bounds, constraints) to hand to
+        scipy.optimize.milp
+    '''
+    num_pairs = model.num_pairs
+    num_students = model.num_students
+    num_variables = num_pairs + num_students
+
+    costs = np.concatenate([model.pair_rank.astype(float),
+                            np.empty(num_students)])
+    costs[num_pairs:] = BIG_NUMBER
+
+    upper = np.ones(num_variables)
+    if pair_upper is not None:
+        upper[:num_pairs] = pair_upper
+    upper[num_pairs:] = model.slots
+    bounds = Bounds(0, upper)
+
+    # Every student's chosen pairs plus their unassigned slots add up to 4
+    rows = np.concatenate([model.pair_student, np.arange(num_students)])
+    every_student = sparse.csr_matrix(
+        (np.ones(num_variables), (rows, np.arange(num_variables))),
+        shape=(num_students, num_variables))
+
+    # Every class has to be within its cap. A class no more students asked
+    # for than it has seats can't go over, so it gets no row.
+    demand = np.bincount(model.pair_course, weights=upper[:num_pairs],
+                         minlength=model.num_courses)
+    binding = np.flatnonzero(demand > model.caps)
+    row = np.full(model.num_courses, -1)
+    row[binding] = np.arange(len(binding))
+    rows = row[model.pair_course]
+    in_binding = np.flatnonzero(rows >= 0)
+    every_class = sparse.csr_matrix(
+        (np.ones(len(in_binding)), (rows[in_binding], in_binding)),
+        shape=(len(binding), num_variables))
+
+    constraints = [
+        LinearConstraint(every_student, model.slots, model.slots),
+        LinearConstraint(every_class, -np.inf, model.caps[binding]),
+    ]
+    return costs, np.ones(num_variables), bounds, constraints
+
+
+def solve_model(model, time_limit=None, verbose=False, extra=None):
+    '''Solves the integer program for a preference model.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        time_limit - optional limit on solver time, in seconds
+        verbose - whether to let HiGHS print its progress
+        extra - optional list of further LinearConstraints on the variables
+            of build_program()
+
+    Returns: a boolean mask over the model's pairs, True for the pairs in the
+        matching
+    '''
+    costs, integrality, bounds, constraints = build_program(model)
+    constraints.extend(extra or [])
+    options = {'disp': verbose}
+    if time_limit is not None:
+        options['time_limit'] = time_limit
+
+    result = milp(costs, integrality=integrality, bounds=bounds,
+                  constraints=constraints, options=options)
+    if result.x is None:
+        raise RuntimeError('No feasible matching found: ' + result.message)
+
+    return result.x[:model.num_pairs] > 0.5
+
+
+def solve(data, time_limit=None, verbose=False):
+    '''Solves the WebTree integer program for the given requests.
+
+    Parameters:
+        data - the request columns as returned by webtree_data.load_requests()
+        time_limit - optional limit on solver time, in seconds
+        verbose - whether to let HiGHS print its progress
+
+    Returns: a dictionary with keys of student IDs and values of the list of
+        CRNs that student was assigned
+    '''
+    model = build_model(data)
+    return model.assignments(solve_model(model, time_limit, verbose))
+
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print('Usage: python webtree_ilp.py <WebTree csv or model> '
+              '[matching outfile]')
+        return
+
+    outfile = sys.argv[2] if len(sys.argv) == 3 else OUTFILE
+    model = read_model(sys.argv[1])
+    assignments = model.assignments(solve_model(model, verbose=True))
+    write_out(assignments, outfile, semester_name(sys.argv[1]),
+              {'method': 'ilp'})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,303 @@
+'''
+Incremental re-solving of the WebTree matching. When a department raises a
+COURSE_CEILING or a few students resubmit their trees, the optimal matching
+barely moves, so rather than rebuilding and solving the whole model we keep
+the solved min-cost flow network from webtree_flow.py and change it in
+place.
+
+Every change is an edge update (webtree_flow.FlowNetwork.update_edge), which
+cancels or saturates just that edge's flow so the old potentials still prove
+optimality everywhere else. The leftover excess is then routed by the same
+successive shortest paths as a cold solve, starting from the old flow, so
+only the part of the network the change touched gets re-optimized.
+
+The ILP backend can't be warm-started this way (scipy's milp takes no
+starting point), which is why this works on the flow network.
+
+Added rows go alongside a student's existing requests, so a student who
+resubmits their trees needs their old rows removed and the new ones added
+(removals are applied first):
+
+    python webtree_incremental.py "WebTree Data/spring-2015.csv" out.wta \
+        --cap 15262=40 --remove old_trees.csv --add new_trees.csv
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import time
+
+from assignment_io import save, semester_name
+from webtree_data import load_requests, parse_csv
+from webtree_flow import build_network
+from webtree_model import (BIG_NUMBER, CLASSES_PER_STUDENT, build_model,
+                           preference_ranks)
+
+
+class IncrementalMatcher:
+    """A solved WebTree matching that can be updated in place.
+
+    Attributes:
+        network - the solved webtree_flow.FlowNetwork.
+        source, sink - the source and sink nodes.
+        student_nodes - a dictionary mapping student IDs to their nodes.
+        student_edges - a dictionary mapping student IDs to their
+                        (source -> student, student -> sink) edges.
+        slots - a dictionary mapping student IDs to how many classes they
+                should get.
+        course_nodes - a dictionary mapping CRNs to their nodes.
+        course_edges - a dictionary mapping CRNs to their course -> sink edge.
+        caps - a dictionary mapping CRNs to their enrollment ceilings.
+        pair_edges - a dictionary mapping student IDs to a dictionary from
+                     each CRN they requested (or once requested) to its edge.
+        requests - a dictionary mapping student IDs to the list of their
+                   (CRN, rank) request rows.
+    """
+    def __init__(self, data):
+        """Solves the matching for the given requests from scratch.
+
+        Parameters:
+            data - the request columns from webtree_data.load_requests().
+        """
+        model = build_model(data)
+        self.network, edges = build_network(model)
+        self.network.solve()
+        self.source = 0
+        self.sink = 1
+
+        ids = model.student_ids.tolist()
+        crns = model.crns.tolist()
+        first_student = 2
+        first_course = first_student + len(ids)
+        self.student_nodes = {}
+        self.student_edges = {}
+        self.slots = {}
+        for s, (id, slots) in enumerate(zip(ids, model.slots.tolist())):
+            self.student_nodes[id] = first_student + s
+            # build_network adds two edges (four with reverses) per student
+            self.student_edges[id] = (4 * s, 4 * s + 2)
+            self.slots[id] = slots
+        course_start = 4 * len(ids)
+        self.course_nodes = {}
+        self.course_edges = {}
+        self.caps = {}
+        for c, (crn, cap) in enumerate(zip(crns, model.caps.tolist())):
+            self.course_nodes[crn] = first_course + c
+            self.course_edges[crn] = course_start + 2 * c
+            self.caps[crn] = cap
+
+        self.pair_edges = dict((id, {}) for id in ids)
+        for e, s, c in zip(edges, model.pair_student.tolist(),
+                           model.pair_course.tolist()):
+            self.pair_edges[ids[s]][crns[c]] = e
+
+        self.requests = dict((id, []) for id in ids)
+        ranks = preference_ranks(data['TREE'], data['BRANCH'])
+        for id, crn, rank in zip(data['ID'].tolist(), data['CRN'].tolist(),
+                                 ranks.tolist()):
+            self.requests[id].append((crn, rank))
+
+    def set_cap(self, crn, cap):
+        '''Changes the enrollment ceiling of a course, adding the course if
+            it's new.
+        '''
+        if crn not in self.course_nodes:
+            sink = self.sink
+            node = self.network.add_node(self.network.potential[sink])
+            self.course_nodes[crn] = node
+            self.course_edges[crn] = self.network.add_edge(node, sink, 0, 0)
+        self.caps[crn] = cap
+        self.network.update_edge(self.course_edges[crn], cap, 0)
+
+    def _add_student(self, id):
+        '''Adds a student with no requests yet.'''
+        network = self.network
+        node = network.add_node(network.potential[self.source])
+        slots = CLASSES_PER_STUDENT
+        self.student_nodes[id] = node
+        self.student_edges[id] = (network.add_edge(self.source, node, 0, 0),
+                                  network.add_edge(node, self.sink, 0, 0))
+        self.slots[id] = slots
+        self.pair_edges[id] = {}
+        self.requests[id] = []
+        network.add_supply(self.source, slots)
+        network.add_supply(self.sink, -slots)
+        network.update_edge(self.student_edges[id][0], slots, 0)
+        network.update_edge(self.student_edges[id][1], slots, BIG_NUMBER)
+
+    def _remove_student(self, id):
+        '''Takes a student (who has no requests left) out of the matching.'''
+        network = self.network
+        for e in self.pair_edges.pop(id).values():
+            network.update_edge(e, 0, network.cost[e])
+        supply, slack = self.student_edges.pop(id)
+        network.update_edge(supply, 0, 0)
+        network.update_edge(slack, 0, BIG_NUMBER)
+        slots = self.slots.pop(id)
+        network.add_supply(self.source, -slots)
+        network.add_supply(self.sink, slots)
+        del self.student_nodes[id]
+        del self.requests[id]
+
+    def _refresh_student(self, id):
+        '''Brings a student's pair edges in line with their request rows.'''
+        if not self.requests[id]:
+            self._remove_student(id)
+            return
+
+        best = {}
+        for crn, rank in self.requests[id]:
+            if rank < best.get(crn, rank + 1):
+                best[crn] = rank
+        network = self.network
+        edges = self.pair_edges[id]
+        for crn in set(edges) | set(best):
+            if crn not in edges:
+                edges[crn] = network.add_edge(self.student_nodes[id],
+                                              self.course_nodes[crn], 0, 0)
+            if crn in best:
+                network.update_edge(edges[crn], 1, best[crn])
+            else:
+                network.update_edge(edges[crn], 0, network.cost[edges[crn]])
+
+    def add_requests(self, data):
+        '''Adds request rows, for new students or alongside a student's
+            existing requests (to replace a student's trees, remove the old
+            rows first). Courses not seen before come in with their
+            COURSE_CEILING.
+
+        Parameter:
+            data - request columns as from webtree_data.load_requests()
+        '''
+        ranks = preference_ranks(data['TREE'], data['BRANCH'])
+        touched = set()
+        for id, crn, rank, cap in zip(data['ID'].tolist(), data['CRN'].tolist(),
+                                      ranks.tolist(),
+                                      data['COURSE_CEILING'].tolist()):
+            if crn not in self.course_nodes:
+                self.set_cap(crn, cap)
+            if id not in self.student_nodes:
+                self._add_student(id)
+            self.requests[id].append((crn, rank))
+            touched.add(id)
+        for id in touched:
+            self._refresh_student(id)
+
+    def remove_requests(self, data):
+        '''Removes request rows (matched on ID, CRN, TREE and BRANCH). A
+            student with no rows left is taken out of the matching. If any
+            row isn't there, a KeyError is raised and nothing is removed.
+
+        Parameter:
+            data - request columns as from webtree_data.load_requests()
+        '''
+        ranks = preference_ranks(data['TREE'], data['BRANCH'])
+        rows = list(zip(data['ID'].tolist(), data['CRN'].tolist(),
+                        ranks.tolist()))
+        # Check every row before changing anything, so a bad one leaves the
+        # requests and the network as they were
+        wanted = {}
+        for row in rows:
+            wanted[row] = wanted.get(row, 0) + 1
+        for (id, crn, rank), count in wanted.items():
+            if self.requests.get(id, []).count((crn, rank)) < count:
+                raise KeyError('no request (%d, %d, rank %d) to remove'
+                               % (id, crn, rank))
+        touched = set()
+        for id, crn, rank in rows:
+            self.requests[id].remove((crn, rank))
+            touched.add(id)
+        for id in touched:
+            self._refresh_student(id)
+
+    def resolve(self):
+        '''Re-optimizes after changes, starting from the current flow.'''
+        self.network.solve()
+
+    def apply_delta(self, caps=None, added=None, removed=None):
+        '''Applies a set of changes and re-optimizes.
+
+        Parameters:
+            caps - optional dictionary mapping CRNs to new ceilings
+            added - optional request columns to add
+            removed - optional request columns to remove
+
+        Returns: None
+        '''
+        if removed is not None:
+            self.remove_requests(removed)
+        if added is not None:
+            self.add_requests(added)
+        for crn, cap in (caps or {}).items():
+            self.set_cap(crn, cap)
+        self.resolve()
+
+    def objective(self):
+        '''Returns the total cost of the current matching, on the scale of
+            webtree_model.PreferenceModel.objective().
+        '''
+        network = self.network
+        total = 0
+        for edges in self.pair_edges.values():
+            for e in edges.values():
+                total += network.flow(e) * network.cost[e]
+        for supply, slack in self.student_edges.values():
+            total += network.flow(slack) * BIG_NUMBER
+        return total
+
+    def assignments(self):
+        '''Returns a dictionary with keys of student IDs and values of the
+            list of CRNs that student was assigned, in preference order.
+        '''
+        network = self.network
+        assignments = {}
+        for id, edges in self.pair_edges.items():
+            chosen = [(network.cost[e], crn) for crn, e in edges.items()
+                      if network.flow(e) > 0]
+            assignments[id] = [crn for rank, crn in sorted(chosen)]
+        return assignments
+
+
+def parse_caps(values):
+    '''Parses CRN=CAP strings into a dictionary.'''
+    caps = {}
+    for value in values:
+        crn, cap = value.split('=')
+        caps[int(crn)] = int(cap)
+    return caps
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Re-solve a WebTree matching after a few changes.')
+    parser.add_argument('requests', help='the original WebTree CSV')
+    parser.add_argument('outfile', help='where to write the new matching')
+    parser.add_argument('--cap', action='append', default=[],
+                        metavar='CRN=CAP', help='a new course ceiling')
+    parser.add_argument('--add', default=None,
+                        help='a WebTree CSV of request rows to add')
+    parser.add_argument('--remove', default=None,
+                        help='a WebTree CSV of request rows to remove')
+    args = parser.parse_args()
+
+    start = time.time()
+    matcher = IncrementalMatcher(load_requests(args.requests))
+    print('cold solve took %.2fs, objective %d' % (time.time() - start,
+                                                  matcher.objective()))
+
+    start = time.time()
+    matcher.apply_delta(parse_caps(args.cap),
+                        parse_csv(args.add) if args.add else None,
+                        parse_csv(args.remove) if args.remove else None)
+    print('incremental re-solve took %.2fs, objective %d' % (
+        time.time() - start, matcher.objective()))
+
+    save(matcher.assignments(), args.outfile,
+         semester=semester_name(args.requests),
+         provenance={'method': 'flow', 'incremental': True})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,228 @@
+'''
+Solves the LP relaxation of the WebTree program and rounds it, for when a
+near-optimal matching in seconds is worth more than a proven optimum.
+
+The relaxation is webtree_ilp.build_program with the integrality dropped,
+solved by HiGHS in-process. Its objective is a lower bound on every
+matching. The plain program is a transportation problem, so its constraint
+matrix is totally unimodular and the simplex answer is usually integral
+already; the rounding only has work to do when it isn't (or when extra
+constraints are added to the program).
+
+Rounding keeps every integral value as it is. The fractional pairs of each
+student are rounded together by systematic sampling: one uniform offset per
+student is laid along the running total of their values, so each pair is
+picked with probability equal to its value and the student gets the number
+of pairs their values add up to (rounded up or down). Then a greedy repair:
+
+    - a course over its ceiling gives back the picks it got from rounding,
+      worst rank first, until it fits;
+    - every student with open slots goes down their list in lottery order
+      and takes the first courses that still have room.
+
+    python webtree_lp.py "WebTree Data/spring-2015.csv" out.wta --seed 3
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+from scipy.optimize import milp
+
+import webtree_ilp
+from assignment_io import save, semester_name
+from webtree_auction import group_positions
+from webtree_model import read_model
+
+# Values within this of 0 or 1 count as integral
+TOLERANCE = 1e-6
+
+
+def solve_relaxation(model, time_limit=None):
+    '''Solves the LP relaxation of the program for a preference model.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        time_limit - optional limit on solver time, in seconds
+
+    Returns: a 2-tuple (values, bound): the value of each pair's variable,
+        and the LP objective, a lower bound on the cost of any matching
+    '''
+    costs, integrality, bounds, constraints = webtree_ilp.build_program(model)
+    options = {}
+    if time_limit is not None:
+        options['time_limit'] = time_limit
+    result = milp(costs, integrality=np.zeros_like(integrality),
+                  bounds=bounds, constraints=constraints, options=options)
+    # Stopped short of the optimum, the objective isn't a bound
+    if not result.success:
+        raise RuntimeError('No LP solution found: ' + result.message)
+    values = np.clip(result.x[:model.num_pairs], 0.0, 1.0)
+    return values, result.fun
+
+
+def round_values(model, values, rng):
+    '''Rounds the pair values of each student by systematic sampling.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        values - the value of each pair, between 0 and 1
+        rng - a numpy random Generator
+
+    Returns: a boolean mask over the model's pairs
+    '''
+    selected = values > 1 - TOLERANCE
+    fractional = np.flatnonzero((values > TOLERANCE) &
+                                (values < 1 - TOLERANCE))
+    if not len(fractional):
+        return selected
+
+    students = model.pair_student[fractional]
+    # The running total of each student's fractional values, from 0
+    total = np.cumsum(values[fractional])
+    start = np.arange(len(fractional)) - group_positions(students)
+    before = total[start] - values[fractional][start]
+    high = total - before
+    low = high - values[fractional]
+    offset = rng.random(model.num_students)[students]
+    # A pair is picked when a point offset + k falls in [low, high)
+    selected[fractional] = np.floor(high - offset) > np.floor(low - offset)
+    return selected
+
+
+def repair(model, selected, lottery):
+    '''Makes a selection of pairs fit the ceilings and slots, then fills
+        open slots greedily.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        selected - a boolean mask over the model's pairs; it is changed
+        lottery - each student's lottery number; lower numbers fill their
+            slots first
+
+    Returns: a 2-tuple (removed, added): how many picks the repair took back
+        and how many it added
+    '''
+    removed = 0
+    # Too many picks for a student: keep their best ones
+    chosen = np.flatnonzero(selected)
+    position = group_positions(model.pair_student[chosen])
+    extra = chosen[position >= model.slots[model.pair_student[chosen]]]
+    selected[extra] = False
+    removed += len(extra)
+
+    # Too many students in a course: take back the worst ranks
+    load = np.bincount(model.pair_course[selected],
+                       minlength=model.num_courses)
+    over = np.flatnonzero(load > model.caps)
+    if len(over):
+        is_over = np.zeros(model.num_courses, dtype=bool)
+        is_over[over] = True
+        chosen = np.flatnonzero(selected & is_over[model.pair_course])
+        order = chosen[np.lexsort((-model.pair_rank[chosen],
+                                   model.pair_course[chosen]))]
+        courses = model.pair_course[order]
+        position = group_positions(courses)
+        # Worst first, so the first load - cap of each course go
+        drop = order[position < (load - model.caps)[courses]]
+        selected[drop] = False
+        removed += len(drop)
+
+    load = np.bincount(model.pair_course[selected],
+                       minlength=model.num_courses)
+    filled = np.bincount(model.pair_student[selected],
+                         minlength=model.num_students)
+    starts = np.searchsorted(model.pair_student,
+                             np.arange(model.num_students + 1))
+    courses = model.pair_course.tolist()
+    added = 0
+    for s in np.argsort(lottery, kind='stable').tolist():
+        open_slots = model.slots[s] - filled[s]
+        p = starts[s]
+        while open_slots > 0 and p < starts[s + 1]:
+            c = courses[p]
+            if not selected[p] and load[c] < model.caps[c]:
+                selected[p] = True
+                load[c] += 1
+                open_slots -= 1
+                added += 1
+            p += 1
+    return removed, added
+
+
+def solve_rounded(model, seed=None, time_limit=None):
+    '''Solves the LP relaxation, rounds it and repairs the result.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        seed - optional seed for the rounding and the repair order
+        time_limit - optional limit on the LP solve, in seconds
+
+    Returns: a 2-tuple (selected, report): a boolean mask over the model's
+        pairs, and a dictionary with the bound, the objective and the gap
+    '''
+    start = time.time()
+    values, bound = solve_relaxation(model, time_limit)
+    solved = time.time()
+    rng = np.random.default_rng(seed)
+    selected = round_values(model, values, rng)
+    removed, added = repair(model, selected,
+                            rng.permutation(model.num_students))
+    objective = model.objective(selected)
+    report = {'bound': bound,
+              'objective': objective,
+              'gap': (objective - bound) / max(abs(bound), 1.0),
+              'fractional': int(np.sum((values > TOLERANCE) &
+                                       (values < 1 - TOLERANCE))),
+              'removed': removed,
+              'added': added,
+              'lp_seconds': solved - start,
+              'round_seconds': time.time() - solved}
+    return selected, report
+
+
+def solve_model(model, seed=None):
+    '''Solves the matching for a preference model by rounding its LP
+        relaxation.
+
+    Returns: a boolean mask over the model's pairs, True for the pairs in the
+        matching
+    '''
+    return solve_rounded(model, seed)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Solve the WebTree matching by rounding the LP '
+                    'relaxation.')
+    parser.add_argument('requests', help='the WebTree CSV (or saved model)')
+    parser.add_argument('outfile', help='where to write the matching')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the rounding')
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help='limit on the LP solve, in seconds')
+    args = parser.parse_args()
+
+    model = read_model(args.requests)
+    print(model)
+    selected, report = solve_rounded(model, args.seed, args.time_limit)
+    print('LP bound %.1f in %.2fs, %d fractional pairs' % (
+        report['bound'], report['lp_seconds'], report['fractional']))
+    print('rounded in %.2fs: %d picks taken back, %d added' % (
+        report['round_seconds'], report['removed'], report['added']))
+    print('objective %d, gap %.4f%%' % (report['objective'],
+                                        100 * report['gap']))
+
+    provenance = {'method': 'lp'}
+    if args.seed is not None:
+        provenance['seed'] = args.seed
+    save(model.assignments(selected), args.outfile,
+         semester=semester_name(args.requests), provenance=provenance)
+
+
+if __name__ == '__main__':
+    main()
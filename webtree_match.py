@@ -0,0 +1,137 @@
+'''
+One entry point for every way we have of matching students to courses. Reads
+a WebTree CSV, runs the chosen method and writes the matching.
+
+    python webtree_match.py "WebTree Data/spring-2015.csv" out.wta --method flow
+
+Methods:
+    baseline - the WebTree lottery from baseline_webtree.py
+    ilp - the integer program, solved by HiGHS (webtree_ilp.py)
+    flow - the same optimum as a min-cost flow (webtree_flow.py)
+    auction - the same optimum by auction (webtree_auction.py)
+    lp - the LP relaxation, rounded and repaired (webtree_lp.py)
+    grouped - the ILP, with identical students solved as one group
+        (webtree_groups.py)
+    sections - the ILP over courses instead of sections, so nobody gets two
+        sections of one course, then balanced into the sections students
+        asked for (webtree_sections.py)
+    tiered - seniors first, then each class year on the seats left
+        (webtree_tiered.py)
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import functools
+import random
+import time
+
+import assignment_io
+import baseline_webtree
+import webtree_auction
+import webtree_flow
+import webtree_groups
+import webtree_ilp
+import webtree_lp
+import webtree_presolve
+import webtree_sections
+import webtree_tiered
+from webtree_model import read_model
+
+# Methods that solve a webtree_model.PreferenceModel and return a boolean
+# mask over its pairs
+MODEL_SOLVERS = {
+    'ilp': webtree_ilp.solve_model,
+    'flow': webtree_flow.solve_model,
+    'auction': webtree_auction.solve_model,
+    'lp': webtree_lp.solve_model,
+    'tiered': webtree_tiered.solve_model,
+    'grouped': webtree_groups.solve_model,
+}
+
+# Model solvers that take a seed for their randomness
+SEEDED_SOLVERS = ['grouped', 'lp']
+
+METHODS = ['baseline', 'sections'] + sorted(MODEL_SOLVERS)
+
+
+def run_baseline(filename, seed=None):
+    '''Runs the WebTree lottery on a request file.
+
+    Parameters:
+        filename - the WebTree CSV
+        seed - optional seed for the lottery
+
+    Returns: a dictionary with keys of student IDs and values of the list of
+        CRNs that student was assigned
+    '''
+    if seed is not None:
+        random.seed(seed)
+    student_requests, students_by_class, courses = \
+        baseline_webtree.read_file(filename)
+    random_ordering = baseline_webtree.assign_random_numbers(students_by_class)
+    return baseline_webtree.run_webtree(student_requests, students_by_class,
+                                        courses, random_ordering)
+
+
+def match(filename, method, seed=None, presolve=False):
+    '''Matches students to courses with the given method.
+
+    Parameters:
+        filename - the WebTree CSV, or for the model solvers, a model saved
+            by webtree_model.save_model
+        method - one of METHODS
+        seed - optional seed, for the methods that use randomness (the
+            baseline lottery and SEEDED_SOLVERS)
+        presolve - whether the model solvers should only be given what's
+            left after webtree_presolve.presolve (not used by sections:
+            presolve can fix two sections of one course for a student)
+
+    Returns: a dictionary with keys of student IDs and values of the list of
+        CRNs that student was assigned
+    '''
+    if method == 'baseline':
+        return run_baseline(filename, seed)
+
+    model = read_model(filename)
+    if method == 'sections':
+        return model.assignments(webtree_sections.solve_model(model))
+    solver = MODEL_SOLVERS[method]
+    if method in SEEDED_SOLVERS:
+        solver = functools.partial(solver, seed=seed)
+    if presolve:
+        return model.assignments(webtree_presolve.solve_model(model, solver))
+    return model.assignments(solver(model))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Match students to courses from a WebTree CSV.')
+    parser.add_argument('requests', help='the WebTree CSV (or saved model)')
+    parser.add_argument('outfile', help='where to write the matching')
+    parser.add_argument('--method', choices=METHODS, default='flow')
+    parser.add_argument('--seed', type=int, default=None,
+                        help='seed for the baseline lottery, and for the '
+                             'grouped and lp methods')
+    parser.add_argument('--presolve', action='store_true',
+                        help='presolve the model before solving it')
+    parser.add_argument('--format', choices=['binary', 'text'], default=None,
+                        help='assignment file format (default: text for .txt '
+                             'files, binary otherwise)')
+    args = parser.parse_args()
+
+    start = time.time()
+    assignments = match(args.requests, args.method, args.seed,
+                        args.presolve)
+    print('%s matching took %.2fs' % (args.method, time.time() - start))
+    provenance = {'method': args.method}
+    if args.seed is not None:
+        provenance['seed'] = args.seed
+    assignment_io.save(assignments, args.outfile, args.format,
+                       assignment_io.semester_name(args.requests), provenance)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+'''
+Builds the matching model from the WebTree requests. Unlike the dense matrix
+from webtree_preprocessing_v2.get_student_prefs, which has a cell for every
+(student, course) pair, this only keeps the pairs a student actually put in
+their trees, plus one "unassigned slot" per student so the model is always
+feasible.
+
+save_model() writes a model to disk as a handful of flat arrays (the pairs as
+COO triples, plus the student and course vectors), so its size grows with
+the number of requests rather than students x courses.
+
+Author: Alden Hart
+'''
+
+import zipfile
+
+import numpy as np
+
+from webtree_data import load_requests
+
+CLASSES_PER_STUDENT = 4
+
+# Cost of leaving one of a student's four slots empty. It is bigger than any
+# tree rank, so a solver only does it when there's no other choice.
+BIG_NUMBER = 10000
+
+MODEL_SUFFIX = '.wtm'
+MODEL_VERSION = 1
+MODEL_ARRAYS = ['student_ids', 'class_codes', 'crns', 'caps', 'slots',
+                'pair_student', 'pair_course', 'pair_rank']
+# Arrays a model may or may not have; older model files don't
+OPTIONAL_ARRAYS = ['course_keys']
+
+
+def preference_ranks(trees, branches):
+    '''Returns the linear preference rank 7*(tree-1) + branch of each request,
+        so 1 is the top of the first tree and 25 the end of the fill-in tree.
+    '''
+    return 7 * (trees.astype(np.int16) - 1) + branches
+
+
+class PreferenceModel:
+    """The requested (student, course) pairs of one semester.
+
+    Students and courses are referred to by their index into student_ids and
+    crns. The pairs are sorted by student, then by rank.
+
+    Attributes:
+        student_ids - the student IDs (int32).
+        class_codes - each student's class year, coded as in
+                      webtree_data.CLASS_CODES (int8).
+        crns - the CRNs (int32).
+        caps - each course's enrollment ceiling (int32).
+        slots - how many courses each student should get (int32).
+        pair_student - the student index of each requested pair.
+        pair_course - the course index of each requested pair.
+        pair_rank - the best preference rank the student gave that course.
+        course_keys - each CRN's course, as b'SUBJ NUMB' (byte strings), so
+                      the sections of one course share a key; None if not
+                      known.
+    """
+    def __init__(self, student_ids, class_codes, crns, caps, slots,
+                 pair_student, pair_course, pair_rank, course_keys=None):
+        self.student_ids = student_ids
+        self.class_codes = class_codes
+        self.crns = crns
+        self.caps = caps
+        self.slots = slots
+        self.pair_student = pair_student
+        self.pair_course = pair_course
+        self.pair_rank = pair_rank
+        self.course_keys = course_keys
+
+    def __str__(self):
+        """Returns a printable summary of the model size."""
+        return '{%d students, %d courses, %d requested pairs}' % (
+            self.num_students, self.num_courses, self.num_pairs)
+
+    @property
+    def num_students(self):
+        return len(self.student_ids)
+
+    @property
+    def num_courses(self):
+        return len(self.crns)
+
+    @property
+    def num_pairs(self):
+        return len(self.pair_student)
+
+    def objective(self, selected):
+        '''Returns the total cost of a selection of pairs: the ranks of the
+            chosen pairs plus BIG_NUMBER for every slot left unfilled.
+
+        Parameter:
+            selected - a boolean mask over the pairs, or their indices
+        '''
+        chosen = np.bincount(self.pair_student[selected],
+                             minlength=self.num_students)
+        unfilled = np.maximum(self.slots - chosen, 0).sum()
+        return int(self.pair_rank[selected].sum()) + BIG_NUMBER * int(unfilled)
+
+    def assignments(self, selected):
+        '''Turns a selection of pairs into an assignment of classes.
+
+        Parameter:
+            selected - a boolean mask over the pairs, or their indices
+
+        Returns: a dictionary with keys of student IDs and values of the list
+            of CRNs that student was assigned, in preference order. Every
+            student in the model has an entry.
+        '''
+        assignments = dict((id, []) for id in self.student_ids.tolist())
+        students = self.student_ids[self.pair_student[selected]]
+        courses = self.crns[self.pair_course[selected]]
+        for s, c in zip(students.tolist(), courses.tolist()):
+            assignments[s].append(c)
+        return assignments
+
+    def submodel(self, students, courses, caps=None, keep=None):
+        '''Cuts out the part of the model over some students and courses,
+            keeping the pairs between them.
+
+        Parameters:
+            students - the sorted indices of the students to keep
+            courses - the sorted indices of the courses to keep
+            caps - optional ceilings for the kept courses (by default their
+                   ceilings in this model)
+            keep - optional boolean mask over this model's pairs; only these
+                   are kept
+
+        Returns: a 2-tuple (model, pairs): the smaller PreferenceModel, and
+            the index in this model of each of its pairs
+        '''
+        student_map = np.full(self.num_students, -1, dtype=np.int32)
+        student_map[students] = np.arange(len(students), dtype=np.int32)
+        course_map = np.full(self.num_courses, -1, dtype=np.int32)
+        course_map[courses] = np.arange(len(courses), dtype=np.int32)
+
+        new_student = student_map[self.pair_student]
+        new_course = course_map[self.pair_course]
+        # The maps keep order, so the pairs stay sorted by student and rank
+        inside = (new_student >= 0) & (new_course >= 0)
+        if keep is not None:
+            inside &= keep
+        pairs = np.flatnonzero(inside)
+        if caps is None:
+            caps = self.caps[courses]
+        course_keys = None
+        if self.course_keys is not None:
+            course_keys = self.course_keys[courses]
+        model = PreferenceModel(self.student_ids[students],
+                                self.class_codes[students],
+                                self.crns[courses],
+                                np.asarray(caps, dtype=np.int32),
+                                self.slots[students],
+                                new_student[pairs], new_course[pairs],
+                                self.pair_rank[pairs], course_keys)
+        return model, pairs
+
+
+def build_model(data):
+    '''Builds the preference model from the request columns.
+
+    A course requested more than once by the same student becomes a single
+    pair with the best rank the student gave it.
+
+    Parameter:
+        data - the request columns as returned by webtree_data.load_requests()
+
+    Returns: a PreferenceModel
+    '''
+    student_ids, first_request, student_index = np.unique(
+        data['ID'], return_index=True, return_inverse=True)
+    crns, first_row, course_index = np.unique(
+        data['CRN'], return_index=True, return_inverse=True)
+    num_courses = len(crns)
+
+    ranks = preference_ranks(data['TREE'], data['BRANCH'])
+    cells = student_index.astype(np.int64) * num_courses + course_index
+
+    # Sort by cell, then rank, and keep the first (best) row for every cell
+    order = np.lexsort((ranks, cells))
+    cells = cells[order]
+    first = np.ones(len(cells), dtype=bool)
+    first[1:] = cells[1:] != cells[:-1]
+    keep = order[first]
+
+    pair_student = student_index[keep].astype(np.int32)
+    pair_course = course_index[keep].astype(np.int32)
+    pair_rank = ranks[keep].astype(np.int16)
+
+    # Pairs sorted by student, then rank
+    order = np.lexsort((pair_rank, pair_student))
+
+    slots = np.empty(len(student_ids), dtype=np.int32)
+    slots.fill(CLASSES_PER_STUDENT)
+
+    course_keys = None
+    if 'SUBJ' in data:
+        course_keys = np.char.add(np.char.add(data['SUBJ'][first_row], b' '),
+                                  data['NUMB'][first_row])
+
+    return PreferenceModel(student_ids.astype(np.int32),
+                           data['CLASS'][first_request],
+                           crns.astype(np.int32),
+                           data['COURSE_CEILING'][first_row].astype(np.int32),
+                           slots,
+                           pair_student[order],
+                           pair_course[order],
+                           pair_rank[order],
+                           course_keys)
+
+
+def save_model(model, filename):
+    '''Writes a model to disk (an uncompressed numpy .npz archive, whatever
+        the file is called).
+
+    Parameters:
+        model - a PreferenceModel
+        filename - where to write, conventionally ending in MODEL_SUFFIX
+
+    Returns: None
+    '''
+    arrays = dict((name, getattr(model, name)) for name in MODEL_ARRAYS)
+    for name in OPTIONAL_ARRAYS:
+        if getattr(model, name) is not None:
+            arrays[name] = getattr(model, name)
+    # A file object, so numpy doesn't tack .npz onto the name
+    with open(filename, 'wb') as f:
+        np.savez(f, model_version=np.array(MODEL_VERSION), **arrays)
+
+
+def load_model(filename):
+    '''Reads a model written by save_model().
+
+    Returns: a PreferenceModel
+    '''
+    with np.load(filename) as archive:
+        if int(archive['model_version']) != MODEL_VERSION:
+            raise ValueError('%s is model version %d, not %d' % (
+                filename, int(archive['model_version']), MODEL_VERSION))
+        optional = dict((name, archive[name]) for name in OPTIONAL_ARRAYS
+                        if name in archive.files)
+        return PreferenceModel(*[archive[name] for name in MODEL_ARRAYS],
+                               **optional)
+
+
+def is_model_file(filename):
+    '''Returns whether a file was written by save_model().'''
+    if not zipfile.is_zipfile(filename):
+        return False
+    with zipfile.ZipFile(filename) as archive:
+        return 'model_version.npy' in archive.namelist()
+
+
+def read_model(filename):
+    '''Returns the model for a file that is either a saved model or a
+        WebTree CSV.
+    '''
+    if is_model_file(filename):
+        return load_model(filename)
+    return build_model(load_requests(filename))
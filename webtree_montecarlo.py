@@ -0,0 +1,192 @@
+'''
+Monte Carlo runs of the baseline WebTree lottery. baseline_webtree.main runs
+one random draw; this runs thousands of independently seeded draws across a
+process pool and streams every result into aggregate statistics, so we can see
+how much the baseline varies before comparing it with the optimized matching.
+Nothing per run is written to disk.
+
+Each worker runs its lotteries in batches with webtree_sim.simulate_batch.
+
+    python webtree_montecarlo.py "WebTree Data/spring-2015.csv" --runs 2000
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import multiprocessing
+
+import numpy as np
+
+import evaluation
+from webtree_data import load_requests
+from webtree_model import CLASSES_PER_STUDENT
+from webtree_sim import LotterySimulator
+
+SCORE_NAMES = evaluation.SCORE_NAMES
+
+# Lotteries per task handed to a worker; simulate_batch runs them together
+BATCH_SIZE = 100
+
+# Per-process copy of the semester, set up once by _init_worker so that each
+# run only has to send back its results
+_semester = None
+
+
+class RunningStats:
+    """Running mean and variance of a fixed-size vector (Welford's method),
+    so results can be folded in one at a time without keeping them.
+
+    Attributes:
+        count - the number of vectors added so far.
+        mean - the running mean.
+        _m2 - the running sum of squared deviations from the mean.
+    """
+    def __init__(self, size):
+        self.count = 0
+        self.mean = np.zeros(size)
+        self._m2 = np.zeros(size)
+
+    def add(self, values):
+        """Folds one more vector into the statistics.
+
+        Returns:
+            None.
+        """
+        self.count += 1
+        delta = values - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (values - self.mean)
+
+    def std(self):
+        """Returns the sample standard deviation of every entry."""
+        if self.count < 2:
+            return np.zeros_like(self.mean)
+        return np.sqrt(self._m2 / (self.count - 1))
+
+
+def run_seeds(base_seed, runs):
+    '''Returns one independent seed per run, spawned from base_seed, so that
+        every run gets its own random stream no matter which process runs it.
+    '''
+    children = np.random.SeedSequence(base_seed).spawn(runs)
+    return [int(child.generate_state(2, np.uint64)[0]) for child in children]
+
+
+def _init_worker(simulator):
+    '''Keeps the semester the parent sent, once per worker process.'''
+    global _semester
+    _semester = {'simulator': simulator}
+
+
+def _run_lotteries(seeds):
+    '''Runs one batch of seeded lotteries in a worker.
+
+    Returns: a list with a 3-tuple per lottery (classes per student
+        histogram, evaluation scores, seats filled per course in CRN order)
+    '''
+    simulator = _semester['simulator']
+    turn_matrix = simulator.random_turn_matrix(
+        [np.random.default_rng(seed) for seed in seeds])
+    assigned, counts, remaining = simulator.simulate_batch(turn_matrix)
+
+    given = np.arange(assigned.shape[2]) < counts[:, :, np.newaxis]
+    results = []
+    for run in range(len(seeds)):
+        per_student = np.bincount(counts[run],
+                                  minlength=CLASSES_PER_STUDENT + 1)
+        # Score straight from the arrays; row-major order matches np.repeat
+        students = np.repeat(simulator.student_ids, counts[run])
+        crns = simulator.crns[assigned[run][given[run]]]
+        scores = evaluation.score_pairs(students, crns,
+                                        simulator.num_students,
+                                        simulator.index)
+        filled = simulator.caps - remaining[run]
+        results.append((per_student, np.array(scores), filled))
+    return results
+
+
+def simulate(filename, runs, seed=0, processes=None):
+    '''Runs many seeded WebTree lotteries in parallel and aggregates them.
+
+    Parameters:
+        filename - the WebTree CSV
+        runs - how many lotteries to run
+        seed - the base seed that every run's seed is spawned from
+        processes - the number of worker processes (default: one per core)
+
+    Returns: a dictionary with
+        'runs' - the number of runs
+        'classes_per_student' - the number of students who got 0, 1, ... 4
+            classes, summed over all runs
+        'scores' - a RunningStats over the evaluation.all_scores metrics,
+            in the order of SCORE_NAMES
+        'crns' - the CRNs, sorted
+        'fill' - a RunningStats over seats filled per course, in CRN order
+    '''
+    if runs < 1:
+        raise ValueError('need at least one run, not %d' % runs)
+    seeds = run_seeds(seed, runs)
+    per_student = np.zeros(CLASSES_PER_STUDENT + 1, dtype=np.int64)
+    scores = RunningStats(len(SCORE_NAMES))
+    fill = None
+
+    workers = processes or multiprocessing.cpu_count()
+    batch_size = max(1, min(BATCH_SIZE, runs // workers))
+    batches = [seeds[i:i + batch_size] for i in range(0, runs, batch_size)]
+
+    # Built once here; the simulator's StudentStore and preference index are
+    # a few flat arrays, so shipping them to every worker is cheap
+    simulator = LotterySimulator(load_requests(filename))
+    pool = multiprocessing.Pool(processes, _init_worker, (simulator,))
+    try:
+        for results in pool.imap_unordered(_run_lotteries, batches):
+            for histogram, run_scores, filled in results:
+                per_student[:len(histogram)] += histogram
+                scores.add(run_scores)
+                if fill is None:
+                    fill = RunningStats(len(filled))
+                fill.add(filled)
+    finally:
+        pool.close()
+        pool.join()
+
+    return {'runs': runs, 'classes_per_student': per_student,
+            'scores': scores, 'crns': simulator.crns, 'fill': fill}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Monte Carlo runs of the baseline WebTree lottery.')
+    parser.add_argument('requests', help='the WebTree CSV')
+    parser.add_argument('--runs', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--courses', type=int, default=10,
+                        help='how many of the most variable courses to show')
+    args = parser.parse_args()
+    if args.runs < 1:
+        parser.error('--runs must be at least 1')
+
+    result = simulate(args.requests, args.runs, args.seed, args.processes)
+
+    print('%d lotteries' % result['runs'])
+    print('classes per student:')
+    total = float(result['classes_per_student'].sum())
+    for n, count in enumerate(result['classes_per_student'].tolist()):
+        print('  %d: %.4f' % (n, count / total))
+
+    scores = result['scores']
+    for name, mean, std in zip(SCORE_NAMES, scores.mean, scores.std()):
+        print('%-10s %.4f +/- %.4f' % (name, mean, std))
+
+    fill = result['fill']
+    std = fill.std()
+    print('most variable course fills (CRN, mean, std):')
+    for i in np.argsort(-std)[:args.courses]:
+        print('  %d %.2f %.2f' % (result['crns'][i], fill.mean[i], std[i]))
+
+
+if __name__ == '__main__':
+    main()
@@ -3,21 +3,29 @@ Does the preprocessing of the data to run our WebTree matching as a binary
 integer programming problem in MATLAB. Reads in the file, sorts it accordingly,
 and outputs a text file in an easy-to-parse format.
 
+By default it now writes the sparse model from webtree_model.save_model
+instead, which webtree_ilp.py, webtree_flow.py, webtree_match.py and
+create_matching.py all read. Pass --dense to get the old CSV for MATLAB too.
+
 Author: Alden Hart
 3/23/2015
 '''
 
+from __future__ import print_function
+
+import argparse
 import csv
 import numpy as np
 import random
 
+from webtree_data import load_requests
+from webtree_model import build_model, save_model
+
 FILENAME = './WebTree Data/spring-2015.csv'
 # FILENAME = './WebTree Data/test.csv'
 OUT_FILENAME = 'processed_data_spring-2015.csv'
+OUT_MODEL = 'spring-2015.wtm'
 
-FIELDS = ['ID','CLASS','CRN','TREE','BRANCH','COURSE_CEILING',
-          'MAJOR','MAJOR2','SUBJ','NUMB','SEQ']
-FIELDS_WE_CARE_ABOUT = ['ID','CLASS','CRN','TREE','BRANCH','COURSE_CEILING']
 ID = 0
 CLASS = 1
 CRN = 2
@@ -33,59 +41,13 @@ def read_file(filename):
     Parameter:
         filename - the name of the file to be read
 
-    Returns: a list for each column of the information
+    Returns: a numpy array for each column of the information. Class years
+        come back already coded as 4, 3, 2, 1, 0 for SENI, JUNI, SOPH, FRST,
+        OTHER, so that we can sort by this column.
     """
-    all_data = []
-    for i in FIELDS_WE_CARE_ABOUT:
-        all_data.append([])
-
-    with open(filename, 'r') as csvfile:
-        reader = csv.DictReader(csvfile, fieldnames=FIELDS)
-        reader.next()   # get rid of the header line
-
-        for row in reader:
-            id = int(row['ID'])
-            all_data[ID].append(id)
-
-            class_year = row['CLASS']
-            all_data[CLASS].append(class_year)
-
-            crn = int(row['CRN'])
-            all_data[CRN].append(crn)
-
-            tree = int(row['TREE'])
-            all_data[TREE].append(tree)
-
-            branch = int(row['BRANCH'])
-            all_data[BRANCH].append(branch)
-
-            ceiling = int(row['COURSE_CEILING'])
-            all_data[COURSE_CEILING].append(ceiling)
-
-    return all_data
-
-def replace_with_numbers(class_years):
-    '''Replaces the SENI, JUNI, SOPH, FRST, OTHER tags with numbers 4, 3, 2, 1,
-        0, so that we can sort by this column.
-
-    Parameter:
-        class_years - a list of the class years as returned by read_file()
-
-    Returns: a new list with ints instead of strings
-    '''
-    out = []
-    for year in class_years:
-        if year == 'SENI':
-            out.append(4)
-        elif year == 'JUNI':
-            out.append(3)
-        elif year == 'SOPH':
-            out.append(2)
-        elif year == 'FRST':
-            out.append(1)
-        else:
-            out.append(0)
-    return out
+    data = load_requests(filename)
+    return [data['ID'], data['CLASS'], data['CRN'], data['TREE'],
+            data['BRANCH'], data['COURSE_CEILING']]
 
 def sort_by_class(ids, class_years, crns, trees, branches, ceilings):
     '''Puts students in order by class. Seniors are organized first, then 
@@ -168,7 +130,7 @@ def get_student_prefs(data, num_unique_students, num_unique_classes):
     i = 0
     class_map = course_map(data)
 
-    preference_matrix = np.empty([num_unique_students+2, num_unique_classes+1], dtype=np.int)
+    preference_matrix = np.empty([num_unique_students+2, num_unique_classes+1], dtype=int)
     preference_matrix.fill(BIG_NUMBER)  # If they don't want it, put a big number
 
     for row in data:
@@ -199,11 +161,11 @@ def write_file(data, filename):
         for row in data:
             writer.writerow(row)
 
-def main():
-    all_data = read_file(FILENAME)
+def write_dense(filename, out_filename):
+    '''Writes the dense preference matrix CSV that WebTree_LP_v2.m reads.'''
+    all_data = read_file(filename)
     ids = all_data[ID]
-    raw_class_years = all_data[CLASS]
-    class_years = replace_with_numbers(raw_class_years)
+    class_years = all_data[CLASS]
     crns = all_data[CRN]
     trees = all_data[TREE]
     branches = all_data[BRANCH]
@@ -216,12 +178,29 @@ def main():
     num_unique_students = len(unique_students)
     unique_classes = get_unique_classes(sorted_data)
     num_unique_classes = len(unique_classes)
-    print num_unique_students, num_unique_classes
+    print(num_unique_students, num_unique_classes)
 
     preference_matrix = get_student_prefs(sorted_data, num_unique_students, num_unique_classes)
     # print preference_matrix
 
-    write_file(preference_matrix, OUT_FILENAME)
+    write_file(preference_matrix, out_filename)
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Preprocess WebTree requests into a matching model.')
+    parser.add_argument('requests', nargs='?', default=FILENAME)
+    parser.add_argument('model', nargs='?', default=OUT_MODEL)
+    parser.add_argument('--dense', default=None, metavar='CSV',
+                        help='also write the dense preference matrix for '
+                             'MATLAB (e.g. %s)' % OUT_FILENAME)
+    args = parser.parse_args()
+
+    model = build_model(load_requests(args.requests))
+    print(model)
+    save_model(model, args.model)
+
+    if args.dense:
+        write_dense(args.requests, args.dense)
 
 
 if __name__ == '__main__':
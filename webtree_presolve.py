@@ -0,0 +1,190 @@
+'''
+Presolve for the WebTree matching: takes out the parts of the model whose
+answer is already known, so a solver only sees the contested core.
+
+A course no more students asked for than it has seats (demand <= ceiling)
+can never fill up, and for it:
+
+    - its ceiling row can be dropped;
+    - a student who ranked it within their top open slots gets it in every
+      optimal matching (if they didn't, swapping it in for their worst
+      class, or an empty slot, would be cheaper, and it has room). Ranks are
+      distinct within a student, so the swap is strictly better and the
+      pair can be fixed;
+    - a request ranked below as many such courses as the student has open
+      slots can never be chosen, and is dropped.
+
+Dropping requests lowers demand, which can make more courses non-binding,
+so the rules are applied until nothing changes. A student whose slots are
+all fixed leaves the model. Duplicate requests (a student putting the same
+course in more than one tree) are already merged into one pair with the
+best rank by webtree_model.build_model.
+
+    python webtree_presolve.py "WebTree Data/spring-2015.csv"
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+
+import numpy as np
+
+import webtree_ilp
+from webtree_auction import group_positions
+from webtree_data import load_requests
+from webtree_model import build_model, is_model_file, load_model
+
+
+class Presolved:
+    """A preference model split into what's already decided and the core
+    left to solve.
+
+    Attributes:
+        model - the original webtree_model.PreferenceModel.
+        core - the PreferenceModel left to solve: the students with open
+               slots, the courses they can still get, their remaining
+               ceilings and the pairs still undecided.
+        core_pairs - the index in model of each of core's pairs.
+        fixed - a boolean mask over model's pairs that are in every optimal
+                matching.
+        dropped - a boolean mask over model's pairs that are in none.
+        binding - a boolean mask over core's courses whose ceiling can still
+                  bind.
+        passes - the number of passes it took.
+    """
+    def __init__(self, model, core, core_pairs, fixed, dropped, binding,
+                 passes):
+        self.model = model
+        self.core = core
+        self.core_pairs = core_pairs
+        self.fixed = fixed
+        self.dropped = dropped
+        self.binding = binding
+        self.passes = passes
+
+    def expand(self, selected):
+        '''Turns a selection of the core's pairs into a selection of the
+            whole model's.
+
+        Parameter:
+            selected - a boolean mask over the core's pairs, or their indices
+
+        Returns: a boolean mask over the original model's pairs
+        '''
+        full = self.fixed.copy()
+        full[self.core_pairs[selected]] = True
+        return full
+
+    def report(self):
+        '''Returns a dictionary of how much smaller the core is.'''
+        model = self.model
+        fixed_per_student = np.bincount(model.pair_student[self.fixed],
+                                        minlength=model.num_students)
+        return {'students': model.num_students,
+                'students_fixed': int(np.sum(fixed_per_student >=
+                                             model.slots)),
+                'core_students': self.core.num_students,
+                'courses': model.num_courses,
+                'core_courses': self.core.num_courses,
+                'ceiling_rows': int(np.sum(self.binding)),
+                'pairs': model.num_pairs,
+                'pairs_fixed': int(np.sum(self.fixed)),
+                'pairs_dropped': int(np.sum(self.dropped)),
+                'core_pairs': self.core.num_pairs,
+                'passes': self.passes}
+
+
+def presolve(model):
+    '''Presolves a preference model.
+
+    Parameter:
+        model - a webtree_model.PreferenceModel (pairs sorted by student,
+            then rank)
+
+    Returns: a Presolved
+    '''
+    fixed = np.zeros(model.num_pairs, dtype=bool)
+    dropped = np.zeros(model.num_pairs, dtype=bool)
+    slots = model.slots.astype(np.int64)
+    caps = model.caps.astype(np.int64)
+    passes = 0
+    while True:
+        passes += 1
+        open_pairs = np.flatnonzero(~fixed & ~dropped)
+        students = model.pair_student[open_pairs]
+        courses = model.pair_course[open_pairs]
+        demand = np.bincount(courses, minlength=model.num_courses)
+        never_full = (demand <= caps)[courses]
+
+        # Where each open pair falls in its student's open pairs, and how
+        # many never-full courses the student ranked above it
+        position = group_positions(students)
+        total = np.cumsum(never_full)
+        start = np.arange(len(position)) - position
+        above = total - never_full - (total[start] - never_full[start])
+
+        forced = never_full & (position < slots[students])
+        hopeless = above >= slots[students]
+        if not forced.any() and not hopeless.any():
+            break
+        fixed[open_pairs[forced]] = True
+        dropped[open_pairs[hopeless & ~forced]] = True
+        slots -= np.bincount(students[forced], minlength=model.num_students)
+        caps -= np.bincount(courses[forced], minlength=model.num_courses)
+
+    undecided = ~fixed & ~dropped
+    core_students = np.flatnonzero(slots > 0)
+    core_courses = np.unique(model.pair_course[undecided])
+    core, core_pairs = model.submodel(core_students, core_courses,
+                                      caps[core_courses], undecided)
+    core.slots = slots[core_students].astype(np.int32)
+    demand = np.bincount(core.pair_course, minlength=core.num_courses)
+    return Presolved(model, core, core_pairs, fixed, dropped,
+                     demand > core.caps, passes)
+
+
+def solve_model(model, solver=webtree_ilp.solve_model):
+    '''Presolves a model, solves the core and puts the matching back
+        together.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        solver - a function from a PreferenceModel to a boolean mask over its
+            pairs, like webtree_ilp.solve_model
+
+    Returns: a boolean mask over the model's pairs, True for the pairs in the
+        matching
+    '''
+    presolved = presolve(model)
+    return presolved.expand(solver(presolved.core))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Show how much presolve takes out of a WebTree model.')
+    parser.add_argument('requests', help='the WebTree CSV (or saved model)')
+    args = parser.parse_args()
+
+    if is_model_file(args.requests):
+        model = load_model(args.requests)
+    else:
+        data = load_requests(args.requests)
+        model = build_model(data)
+        print('%d request rows, %d duplicates merged' % (
+            len(data['ID']), len(data['ID']) - model.num_pairs))
+    report = presolve(model).report()
+    print('%d passes' % report['passes'])
+    print('students:  %5d, %d fully fixed, %d left' % (
+        report['students'], report['students_fixed'],
+        report['core_students']))
+    print('courses:   %5d, %d left, %d ceiling rows that can bind' % (
+        report['courses'], report['core_courses'], report['ceiling_rows']))
+    print('pairs:     %5d, %d fixed, %d dropped, %d left' % (
+        report['pairs'], report['pairs_fixed'], report['pairs_dropped'],
+        report['core_pairs']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,252 @@
+'''
+Solves the WebTree matching at the level of courses rather than sections.
+A CRN is one section of a course (SUBJ and NUMB); students usually put
+several sections of a popular course like WRI 101 in their trees, and to the
+section-level program those are unrelated CRNs. That makes a lot of
+interchangeable variables, and it can give a student two sections of the
+same course.
+
+Here the sections of each course are merged into one course with their
+ceilings added up, and each student gets one pair per course, at the best
+rank they gave any of its sections, so nobody can get the same course twice.
+That model is solved as usual. Then a small balancing pass puts every seat
+in a merged course into one of the sections the student asked for: the same
+kind of transportation problem, with each seat as a one-slot student and
+each section taking its own ceiling.
+
+Sections differ in meeting times, so a student is never put in a section
+they didn't ask for. When the requested sections of a course can't hold its
+seats, that course is split back into its sections, with a row keeping each
+student to at most one of them, and the model is solved again. Each round
+splits at least one course, so it ends; usually only a few courses need it.
+
+    python webtree_sections.py "WebTree Data/spring-2015.csv" out.wta
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import LinearConstraint
+
+import webtree_ilp
+from assignment_io import save, semester_name
+from webtree_model import PreferenceModel, read_model
+
+
+def course_model(model, split=None):
+    '''Merges the sections of each course, except for the courses split.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel with course_keys
+        split - optional boolean mask over the sorted unique course keys;
+            these courses keep one node per section
+
+    Returns: a 3-tuple (nodes, section_node, node_course): the
+        PreferenceModel over the merged courses and split sections (each
+        node's CRN is its first section's), the node index of each of
+        model's sections, and the course key index of each node
+    '''
+    if model.course_keys is None:
+        raise ValueError('the model has no course keys; build it from a '
+                         'WebTree CSV with SUBJ and NUMB columns')
+    keys, section_course = np.unique(model.course_keys, return_inverse=True)
+    if split is None:
+        split = np.zeros(len(keys), dtype=bool)
+    # A split course's sections get node numbers after all the courses
+    labels = np.where(split[section_course],
+                      len(keys) + np.arange(model.num_courses),
+                      section_course)
+    labels, first, section_node = np.unique(labels, return_index=True,
+                                            return_inverse=True)
+    caps = np.bincount(section_node, weights=model.caps,
+                       minlength=len(labels)).astype(np.int32)
+
+    # Pairs are sorted by student, then rank, so the first pair for every
+    # (student, node) has the best rank
+    pair_node = section_node[model.pair_course]
+    cells = model.pair_student.astype(np.int64) * len(labels) + pair_node
+    order = np.lexsort((model.pair_rank, cells))
+    best = np.ones(len(cells), dtype=bool)
+    best[1:] = cells[order][1:] != cells[order][:-1]
+    keep = np.sort(order[best])
+
+    nodes = PreferenceModel(model.student_ids, model.class_codes,
+                            model.crns[first], caps, model.slots,
+                            model.pair_student[keep],
+                            pair_node[keep].astype(np.int32),
+                            model.pair_rank[keep], model.course_keys[first])
+    return nodes, section_node, section_course[first]
+
+
+def one_section_rows(nodes, node_course):
+    '''Returns a LinearConstraint keeping each student to at most one
+        section of every split course, over the variables of
+        webtree_ilp.build_program(nodes), or None if none is needed.
+    '''
+    cells = (nodes.pair_student.astype(np.int64) * (node_course.max() + 1) +
+             node_course[nodes.pair_course])
+    cells, row, counts = np.unique(cells, return_inverse=True,
+                                   return_counts=True)
+    pairs = np.flatnonzero(counts[row] > 1)
+    if not len(pairs):
+        return None
+    rows = np.unique(row[pairs], return_inverse=True)[1]
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs)), (rows, pairs)),
+        shape=(rows.max() + 1, nodes.num_pairs + nodes.num_students))
+    return LinearConstraint(matrix, -np.inf, 1)
+
+
+def balance(model, nodes, section_node, selected):
+    '''Puts the seats of a matching over nodes into the sections the
+        students asked for.
+
+    Parameters:
+        model - the section-level PreferenceModel
+        nodes, section_node - as from course_model()
+        selected - a boolean mask over nodes' pairs
+
+    Returns: a 2-tuple (placed, unplaced): a boolean mask over model's pairs
+        for the seats placed, and the node index of every seat that
+        couldn't be
+    '''
+    sections_per_node = np.bincount(section_node, minlength=nodes.num_courses)
+    # Every (student, section) pair, sorted, to look up the index in model
+    cells = (model.pair_student.astype(np.int64) * model.num_courses +
+             model.pair_course)
+    by_pair = np.argsort(cells)
+    placed = np.zeros(model.num_pairs, dtype=bool)
+
+    # A node with one section (an unsplit course with one section, or a
+    # section of a split course) is that section, which was requested
+    chosen = np.flatnonzero(selected)
+    single = chosen[sections_per_node[nodes.pair_course[chosen]] == 1]
+    only_section = np.empty(nodes.num_courses, dtype=np.int64)
+    only_section[section_node] = np.arange(model.num_courses)
+    placed[by_pair[np.searchsorted(
+        cells[by_pair], nodes.pair_student[single].astype(np.int64) *
+        model.num_courses + only_section[nodes.pair_course[single]])]] = True
+
+    # Every other seat picks among the sections of its node the student
+    # asked for
+    seat_pairs = chosen[sections_per_node[nodes.pair_course[chosen]] > 1]
+    if not len(seat_pairs):
+        return placed, np.zeros(0, dtype=np.int64)
+    seat_cells = (nodes.pair_student[seat_pairs].astype(np.int64) *
+                  nodes.num_courses + nodes.pair_course[seat_pairs])
+    pair_cells = (model.pair_student.astype(np.int64) * nodes.num_courses +
+                  section_node[model.pair_course])
+    by_cell = np.argsort(seat_cells)
+    where = np.searchsorted(seat_cells[by_cell], pair_cells).clip(
+        max=len(seat_pairs) - 1)
+    options = np.flatnonzero(seat_cells[by_cell][where] == pair_cells)
+    seat = by_cell[where[options]]
+    sections, section_index = np.unique(model.pair_course[options],
+                                        return_inverse=True)
+    # Sorted by seat, then rank, like any model's pairs
+    order = np.lexsort((model.pair_rank[options], seat))
+    options = options[order]
+    students = nodes.pair_student[seat_pairs]
+    seats = PreferenceModel(model.student_ids[students],
+                            model.class_codes[students],
+                            model.crns[sections], model.caps[sections],
+                            np.ones(len(seat_pairs), dtype=np.int32),
+                            seat[order].astype(np.int32),
+                            section_index[order].astype(np.int32),
+                            model.pair_rank[options])
+    got = webtree_ilp.solve_model(seats)
+    placed[options[got]] = True
+    seated = np.zeros(len(seat_pairs), dtype=bool)
+    seated[seats.pair_student[got]] = True
+    return placed, nodes.pair_course[seat_pairs[~seated]]
+
+
+def solve_sections(model, time_limit=None):
+    '''Solves the matching for a preference model over courses, splitting
+        courses back into sections until every seat fits in a section the
+        student asked for.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel with course_keys
+        time_limit - optional limit on each solve, in seconds
+
+    Returns: a 2-tuple (selected, report): a boolean mask over the model's
+        pairs, and a dictionary describing the reduction and the rounds
+    '''
+    start = time.time()
+    num_keys = len(np.unique(model.course_keys))
+    split = np.zeros(num_keys, dtype=bool)
+    rounds = 0
+    while True:
+        rounds += 1
+        nodes, section_node, node_course = course_model(model, split)
+        rows = one_section_rows(nodes, node_course)
+        selected = webtree_ilp.solve_model(
+            nodes, time_limit, extra=[] if rows is None else [rows])
+        placed, unplaced = balance(model, nodes, section_node, selected)
+        if not len(unplaced):
+            break
+        split[node_course[unplaced]] = True
+
+    keys, section_course = np.unique(model.course_keys, return_inverse=True)
+    report = {'sections': model.num_courses,
+              'courses': num_keys,
+              'multi_section_courses': int(np.sum(
+                  np.bincount(section_course) > 1)),
+              'split_courses': int(np.sum(split)),
+              'nodes': nodes.num_courses,
+              'pairs': model.num_pairs,
+              'node_pairs': nodes.num_pairs,
+              'rounds': rounds,
+              'objective': model.objective(placed),
+              'seconds': time.time() - start}
+    return placed, report
+
+
+def solve_model(model):
+    '''Solves the matching for a preference model over courses, with nobody
+        getting two sections of one course.
+
+    Returns: a boolean mask over the model's pairs, True for the pairs in the
+        matching
+    '''
+    return solve_sections(model)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Solve the WebTree matching over courses, then balance '
+                    'the seats into sections.')
+    parser.add_argument('requests', help='the WebTree CSV (or saved model)')
+    parser.add_argument('outfile', help='where to write the matching')
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help='limit on each solve, in seconds')
+    args = parser.parse_args()
+
+    model = read_model(args.requests)
+    print(model)
+    selected, report = solve_sections(model, args.time_limit)
+    print('%d sections in %d courses (%d with more than one section)' % (
+        report['sections'], report['courses'],
+        report['multi_section_courses']))
+    print('%d rounds, %d courses split back into sections' % (
+        report['rounds'], report['split_courses']))
+    print('%d nodes and %d pairs instead of %d and %d' % (
+        report['nodes'], report['node_pairs'], report['sections'],
+        report['pairs']))
+    print('took %.2fs, objective %d' % (report['seconds'],
+                                        report['objective']))
+
+    save(model.assignments(selected), args.outfile,
+         semester=semester_name(args.requests),
+         provenance={'method': 'sections'})
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,269 @@
+'''
+Array-backed WebTree lottery. Gives exactly the same matching as
+baseline_webtree.run_webtree for the same random ordering, but works on the
+whole cohort at once instead of advancing one Student object at a time.
+
+All requests live in the (students x 29) int32 table of a StudentStore
+(see student_store.py): entry [s, 7*(tree-1) + branch-1] is the index of the
+course at that node of the student's trees, MISSING if they left it empty, and
+column 28 is the "exhausted" state. Capacities are a numpy array, and the moves
+of Student.advance_preference come from the store's compiled plans, with empty
+nodes already skipped, so walking a tree only ever stops at real requests.
+
+simulate() runs one lottery. Within one pass over one class year, every
+student first walks their tree
+(along failure moves) to the first node whose course still has room, against
+the capacities at that moment. Students claim those courses in lottery order,
+and every claim before the first one that overflows its course is exactly
+what run_webtree would have done, so that prefix is committed and the rest
+walk again. Every round fills at least one course, so there are only as many
+rounds as there are courses that fill up. Each round costs a handful of
+numpy calls, so one lottery is only about twice as fast as run_webtree; it is
+meant for single draws, like the daemon's.
+
+simulate_batch() runs many lotteries in lock step: turn by turn, with each
+turn vectorized across the lotteries, about ten times as fast as run_webtree
+per lottery at batches of a hundred or more. Sweeps (the Monte Carlo runs)
+go through it.
+
+Author: Alden Hart
+'''
+
+import numpy as np
+
+from preference_index import build_index
+from student_store import build_store, NUM_STATES, CLASS_ORDER
+
+
+class LotterySimulator:
+    """The requests of one semester, laid out for the array-backed lottery.
+
+    Attributes:
+        store - the student_store.StudentStore with every student's requests,
+                compiled traversal plans and cursor.
+        crns - the CRNs (int32).
+        caps - each course's enrollment ceiling (int64).
+        index - the preference_index.PreferenceIndex, for scoring results.
+    """
+    def __init__(self, data):
+        """Lays out the requests for simulation.
+
+        Parameters:
+            data - the request columns from webtree_data.load_requests().
+        """
+        self.store = build_store(data)
+        crns, first_crn = np.unique(data['CRN'], return_index=True)
+        self.crns = crns.astype(np.int32)
+        self.caps = data['COURSE_CEILING'][first_crn].astype(np.int64)
+        self.index = build_index(data)
+
+    @property
+    def num_students(self):
+        return len(self.store)
+
+    @property
+    def num_courses(self):
+        return len(self.crns)
+
+    @property
+    def student_ids(self):
+        return self.store.ids
+
+    @property
+    def students_by_class(self):
+        '''The class year -> set of IDs dictionary, built exactly the way
+            baseline_webtree.read_file builds it.
+        '''
+        return self.store.students_by_class()
+
+    def turns(self, random_ordering):
+        '''Converts a random_ordering from baseline_webtree.assign_random_numbers
+            into the list of student index arrays, one per (pass, class year),
+            in the order run_webtree serves them.
+        '''
+        turns = []
+        for i in range(4):
+            for class_year in CLASS_ORDER:
+                ids = np.array(random_ordering[class_year][i], dtype=np.int64)
+                turns.append(self.store.index_of(ids))
+        return turns
+
+    def random_turns(self, rng):
+        '''Draws lottery turns directly as index arrays, the same way
+            assign_random_numbers does: two independent permutations per
+            class year, each followed later by its reverse.
+
+        Parameter:
+            rng - a numpy random Generator
+
+        Returns: a list of student index arrays as from turns()
+        '''
+        orders = {}
+        for class_year in CLASS_ORDER:
+            part = self.store.class_slices[class_year]
+            students = np.arange(part.start, part.stop)
+            first = rng.permutation(students)
+            third = rng.permutation(students)
+            orders[class_year] = [first, first[::-1], third, third[::-1]]
+        return [orders[class_year][i] for i in range(4)
+                for class_year in CLASS_ORDER]
+
+    def _tables(self):
+        '''Returns the flattened (requests, on_success, on_failure) tables
+            and each student's plan offset into the two next-state tables.
+        '''
+        store = self.store
+        return (store.requests.reshape(-1),
+                store.plan_success.reshape(-1).astype(np.int64),
+                store.plan_failure.reshape(-1).astype(np.int64),
+                store.plan.astype(np.int64) * NUM_STATES)
+
+    def simulate(self, turns):
+        '''Runs one lottery.
+
+        Parameter:
+            turns - a list of student index arrays, as from turns() or
+                random_turns()
+
+        Returns: a 3-tuple (assigned, counts, remaining): assigned is a
+            (students x 4) array of course indices in the order they were
+            given (-1 past each student's count), counts is the number of
+            classes each student got, remaining the seats left per course
+        '''
+        requests, on_success, on_failure, plan = self._tables()
+        done = self.store.DONE
+        num_students = self.num_students
+        # Room left per course; MISSING has none, DONE always "has room"
+        room = np.concatenate([self.caps, [0, 1]])
+        self.store.reset()
+        state = self.store.cursor.astype(np.int64)
+        assigned = np.empty((num_students, 4), dtype=np.int32)
+        assigned.fill(-1)
+        counts = np.zeros(num_students, dtype=np.int64)
+
+        for active in turns:
+            while len(active):
+                # Walk every student to a node with room (or to the end)
+                rows = active * NUM_STATES
+                course = requests[rows + state[active]]
+                walking = np.flatnonzero(room[course] <= 0)
+                while len(walking):
+                    who = active[walking]
+                    state[who] = on_failure[plan[who] + state[who]]
+                    course[walking] = requests[rows[walking] + state[who]]
+                    walking = walking[room[course[walking]] <= 0]
+
+                # The first claim past its course's room, in lottery order;
+                # only the claims on overflowing courses need sorting
+                claims = np.bincount(course, minlength=len(room))
+                over = claims > room
+                over[done] = False
+                if over.any():
+                    full = np.flatnonzero(over)
+                    late = np.flatnonzero(over[course])
+                    late = late[np.argsort(course[late], kind='stable')]
+                    starts = np.cumsum(claims[full]) - claims[full]
+                    cut = late[starts + room[full]].min()
+                else:
+                    cut = len(active)
+
+                # Everyone before the first overflow gets what they claimed
+                got = np.flatnonzero(course[:cut] != done)
+                who = active[got]
+                course = course[got]
+                room -= np.bincount(course, minlength=len(room))
+                assigned[who, counts[who]] = course
+                counts[who] += 1
+                state[who] = on_success[plan[who] + state[who]]
+                active = active[cut:]
+
+        self.store.cursor[:] = state
+        return assigned, counts, room[:self.num_courses]
+
+    def random_turn_matrix(self, rngs):
+        '''Draws one lottery per random generator, as a matrix of turns.
+
+        Parameter:
+            rngs - a list of numpy random Generators, one per lottery
+
+        Returns: a (lotteries x 4*students) array; row r lists the students
+            in the order lottery r serves them
+        '''
+        return np.array([np.concatenate(self.random_turns(rng))
+                         for rng in rngs])
+
+    def simulate_batch(self, turn_matrix):
+        '''Runs many lotteries in lock step, one turn at a time, with every
+            turn vectorized across the lotteries.
+
+        Parameter:
+            turn_matrix - a (lotteries x turns) array of student indices, as
+                from random_turn_matrix(), or rows of concatenated turns()
+
+        Returns: a 3-tuple (assigned, counts, remaining) shaped like the
+            result of simulate() with a leading lottery axis
+        '''
+        requests, on_success, on_failure, plan = self._tables()
+        num_students = self.num_students
+        num_courses = self.num_courses
+        lotteries = len(turn_matrix)
+        width = num_courses + 2
+
+        # Each lottery has its own stretch of the room and state arrays.
+        # DONE has so much room it never fills.
+        room = np.tile(np.concatenate([self.caps, [0, turn_matrix.size]]),
+                       lotteries)
+        state = np.tile(self.store.plan_start[self.store.plan].astype(np.int64),
+                        lotteries)
+        assigned = np.empty((lotteries * num_students, 4), dtype=np.int32)
+        assigned.fill(-1)
+        counts = np.zeros(lotteries * num_students, dtype=np.int64)
+        student_offset = np.arange(lotteries) * num_students
+        course_offset = np.arange(lotteries) * width
+
+        for who in turn_matrix.T:
+            slot = student_offset + who
+            rows = who * NUM_STATES
+            offset = plan[who]
+            current = state[slot]
+            course = requests[rows + current]
+            seat = course_offset + course
+            walking = np.flatnonzero(room[seat] <= 0)
+            while len(walking):
+                current[walking] = on_failure[offset[walking] +
+                                              current[walking]]
+                course[walking] = requests[rows[walking] + current[walking]]
+                seat[walking] = course_offset[walking] + course[walking]
+                walking = walking[room[seat[walking]] <= 0]
+
+            room[seat] -= 1
+            got = slot[course < num_courses]
+            assigned[got, counts[got]] = course[course < num_courses]
+            counts[got] += 1
+            state[slot] = on_success[offset + current]
+
+        return (assigned.reshape(lotteries, num_students, 4),
+                counts.reshape(lotteries, num_students),
+                room.reshape(lotteries, width)[:, :num_courses])
+
+    def run(self, random_ordering):
+        '''Runs the lottery exactly as run_webtree would for random_ordering.
+
+        Returns: a 2-tuple (assignments, courses): assignments is a
+            dictionary mapping each student ID to the list of CRNs they got,
+            and courses maps each CRN to the seats left in it
+        '''
+        assigned, counts, remaining = self.simulate(self.turns(random_ordering))
+        return (self.assignments(assigned, counts),
+                dict(zip(self.crns.tolist(), remaining.tolist())))
+
+    def assignments(self, assigned, counts):
+        '''Turns one lottery's (assigned, counts) arrays into a dictionary
+            mapping each student ID to the list of CRNs they got.
+        '''
+        crns = self.crns.tolist()
+        assignments = {}
+        for id, row, count in zip(self.student_ids.tolist(), assigned.tolist(),
+                                  counts.tolist()):
+            assignments[id] = [crns[c] for c in row[:count]]
+        return assignments
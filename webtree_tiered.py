@@ -0,0 +1,198 @@
+'''
+Solves the WebTree matching one class year at a time, seniors first. The
+program in WebTree_LP_v2.m puts every class year into one objective, and
+sort_by_class in webtree_preprocessing_v2.py only orders its rows, so the
+optimum doesn't favour seniors at all. Here the class years are tiers,
+solved in CLASS_ORDER (SENI, JUNI, SOPH, FRST, OTHER):
+
+    fix - solve the tier on the seats the tiers before it left, and fix its
+        matching before going on. Every solve is only one class year.
+    bound - solve the tier together with every tier before it, with each
+        earlier tier's objective held to its optimum by a constraint, so
+        earlier tiers can be rearranged (never made worse) to make room.
+        Gives a better matching for the later tiers, but the last solve is
+        the size of the whole program, it needs the ILP, and the extra
+        constraints take away the network structure that makes the plain
+        program easy, so it can be very slow (see --time-limit).
+
+Either way there's no giant weight per class year in one objective, and no
+numerical trouble from it.
+
+    python webtree_tiered.py "WebTree Data/spring-2015.csv" out.wta --mode fix
+
+Author: Alden Hart
+'''
+
+from __future__ import print_function
+
+import argparse
+import time
+
+import numpy as np
+from scipy import sparse
+from scipy.optimize import LinearConstraint
+
+import webtree_ilp
+from assignment_io import save, semester_name
+from student_store import CLASS_ORDER
+from webtree_data import CLASS_CODES
+from webtree_model import BIG_NUMBER, read_model
+
+MODES = ['fix', 'bound']
+
+
+def tiers(model):
+    '''Returns a list of (class year, student indices) pairs in CLASS_ORDER,
+        leaving out class years with no students.
+    '''
+    result = []
+    for year in CLASS_ORDER:
+        students = np.flatnonzero(model.class_codes == CLASS_CODES[year])
+        if len(students):
+            result.append((year, students))
+    return result
+
+
+def tier_cost(model, selected, students):
+    '''Returns the cost of a selection of pairs to some of the students: the
+        ranks of their chosen pairs plus BIG_NUMBER per slot left empty.
+    '''
+    chosen = np.zeros(model.num_pairs, dtype=bool)
+    chosen[selected] = True
+    mine = np.zeros(model.num_students, dtype=bool)
+    mine[students] = True
+    picked = chosen & mine[model.pair_student]
+    filled = np.bincount(model.pair_student[picked],
+                         minlength=model.num_students)
+    unfilled = np.maximum(model.slots - filled, 0)[students].sum()
+    return int(model.pair_rank[picked].sum()) + BIG_NUMBER * int(unfilled)
+
+
+def requested_courses(model, students):
+    '''Returns the sorted indices of the courses some students requested.'''
+    mine = np.zeros(model.num_students, dtype=bool)
+    mine[students] = True
+    return np.unique(model.pair_course[mine[model.pair_student]])
+
+
+def solve_fixed(model, solver=webtree_ilp.solve_model):
+    '''Solves tier by tier, fixing each tier's matching before the next.
+
+    Parameters:
+        model - a webtree_model.PreferenceModel
+        solver - a function from a PreferenceModel to a boolean mask over its
+            pairs, like webtree_ilp.solve_model
+
+    Returns: a 2-tuple (selected, report): a boolean mask over the model's
+        pairs, and a list with a dictionary per tier
+    '''
+    remaining = model.caps.astype(np.int64)
+    selected = np.zeros(model.num_pairs, dtype=bool)
+    report = []
+    for year, students in tiers(model):
+        start = time.time()
+        courses = requested_courses(model, students)
+        part, pairs = model.submodel(students, courses, remaining[courses])
+        chosen = pairs[solver(part)]
+        selected[chosen] = True
+        remaining -= np.bincount(model.pair_course[chosen],
+                                 minlength=model.num_courses)
+        report.append({'tier': year, 'students': part.num_students,
+                       'pairs': part.num_pairs,
+                       'cost': tier_cost(model, chosen, students),
+                       'seconds': time.time() - start})
+    return selected, report
+
+
+def tier_constraint(part, students, limit):
+    '''Returns a LinearConstraint holding the cost to some students (indices
+        into part) to at most limit, over the variables of
+        webtree_ilp.build_program(part).
+    '''
+    mine = np.zeros(part.num_students, dtype=bool)
+    mine[students] = True
+    pairs = np.flatnonzero(mine[part.pair_student])
+    columns = np.concatenate([pairs, part.num_pairs + np.asarray(students)])
+    weights = np.concatenate([part.pair_rank[pairs].astype(float),
+                              np.full(len(students), float(BIG_NUMBER))])
+    row = sparse.csr_matrix((weights, (np.zeros(len(columns), dtype=int),
+                                       columns)),
+                            shape=(1, part.num_pairs + part.num_students))
+    # Costs are whole numbers, so half a unit of slack is only rounding
+    return LinearConstraint(row, -np.inf, limit + 0.5)
+
+
+def solve_bounded(model, time_limit=None):
+    '''Solves tier by tier with the ILP, keeping every earlier tier at its
+        optimum cost by a constraint rather than fixing its seats.
+
+    Parameter:
+        model - a webtree_model.PreferenceModel
+        time_limit - optional limit on each tier's solve, in seconds; a tier
+            that runs out is held to the best cost found instead
+
+    Returns: a 2-tuple (selected, report) as from solve_fixed()
+    '''
+    levels = tiers(model)
+    optimum = []
+    report = []
+    selected = np.zeros(model.num_pairs, dtype=bool)
+    for k, (year, students) in enumerate(levels):
+        start = time.time()
+        everyone = np.sort(np.concatenate([s for y, s in levels[:k + 1]]))
+        courses = requested_courses(model, everyone)
+        part, pairs = model.submodel(everyone, courses)
+        extra = [tier_constraint(part, np.searchsorted(everyone, earlier),
+                                 optimum[t])
+                 for t, (y, earlier) in enumerate(levels[:k])]
+        chosen = pairs[webtree_ilp.solve_model(part, time_limit,
+                                               extra=extra)]
+        selected[:] = False
+        selected[chosen] = True
+        optimum.append(tier_cost(model, chosen, students))
+        report.append({'tier': year, 'students': part.num_students,
+                       'pairs': part.num_pairs, 'cost': optimum[-1],
+                       'seconds': time.time() - start})
+    return selected, report
+
+
+def solve_model(model):
+    '''Solves the matching for a preference model seniors first, fixing
+        each class year's matching before the next.
+
+    Returns: a boolean mask over the model's pairs, True for the pairs in the
+        matching
+    '''
+    return solve_fixed(model)[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Solve the WebTree matching one class year at a time.')
+    parser.add_argument('requests', help='the WebTree CSV (or saved model)')
+    parser.add_argument('outfile', help='where to write the matching')
+    parser.add_argument('--mode', choices=MODES, default='fix')
+    parser.add_argument('--time-limit', type=float, default=None,
+                        help='limit on each tier solve in bound mode, in '
+                             'seconds')
+    args = parser.parse_args()
+
+    model = read_model(args.requests)
+    print(model)
+    if args.mode == 'fix':
+        selected, report = solve_fixed(model)
+    else:
+        selected, report = solve_bounded(model, args.time_limit)
+    for tier in report:
+        print('%-6s %5d students %6d pairs  cost %8d  %.2fs' % (
+            tier['tier'], tier['students'], tier['pairs'], tier['cost'],
+            tier['seconds']))
+    print('objective %d' % model.objective(selected))
+
+    save(model.assignments(selected), args.outfile,
+         semester=semester_name(args.requests),
+         provenance={'method': 'tiered', 'mode': args.mode})
+
+
+if __name__ == '__main__':
+    main()